@@ -1,16 +1,21 @@
 import os
 import random
-from typing import Optional, List, Dict, Any
+import asyncio
+from typing import Optional, List, Dict, Any, AsyncIterator
 from abc import ABC, abstractmethod
-from xai_sdk import Client as XAIClient
+import httpx
+from xai_sdk import AsyncClient as XAIAsyncClient
 from xai_sdk.chat import user, system
-from openai import AsyncOpenAI
-from anthropic import AsyncAnthropic
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient as OpenAIHttpxClient
+from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient as AnthropicHttpxClient
 import google.generativeai as genai
 from google.generativeai.types import HarmCategory, HarmBlockThreshold
 from dotenv import load_dotenv
+from contextlib import asynccontextmanager
 import logging
 
+from rate_limiter import rate_limiter, Reservation
+
 # Suppress gRPC and Abseil warnings
 os.environ["GRPC_VERBOSITY"] = "ERROR"
 logging.getLogger('absl').setLevel(logging.ERROR)
@@ -35,6 +40,36 @@ DEFAULT_PARAMS = {
     "presence_penalty": 0.1
 }
 
+# Connection pool settings shared by the HTTP based clients (OpenAI / Anthropic)
+POOL_LIMITS = httpx.Limits(
+    max_connections=int(os.getenv("AI_CLIENT_MAX_CONNECTIONS", "100")),
+    max_keepalive_connections=int(os.getenv("AI_CLIENT_MAX_KEEPALIVE", "20")),
+    keepalive_expiry=float(os.getenv("AI_CLIENT_KEEPALIVE_EXPIRY", "60"))
+)
+REQUEST_TIMEOUT = httpx.Timeout(
+    float(os.getenv("AI_CLIENT_TIMEOUT", "600")),
+    connect=float(os.getenv("AI_CLIENT_CONNECT_TIMEOUT", "10"))
+)
+
+GEMINI_SAFETY_SETTINGS = [
+    {
+        "category": HarmCategory.HARM_CATEGORY_HARASSMENT,
+        "threshold": HarmBlockThreshold.BLOCK_NONE,
+    },
+    {
+        "category": HarmCategory.HARM_CATEGORY_HATE_SPEECH,
+        "threshold": HarmBlockThreshold.BLOCK_NONE,
+    },
+    {
+        "category": HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT,
+        "threshold": HarmBlockThreshold.BLOCK_NONE,
+    },
+    {
+        "category": HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT,
+        "threshold": HarmBlockThreshold.BLOCK_NONE,
+    },
+]
+
 def get_api_key(env_var: str) -> str:
     """
     Get API key from environment variable
@@ -78,6 +113,64 @@ class BaseAIClient(ABC):
         """
         pass
     
+    async def generate_response_stream(self, prompt: str, system_prompt: str, max_tokens: int = 8192) -> AsyncIterator[str]:
+        """
+        Stream the response from the AI model as text deltas
+        
+        The default implementation yields the complete response of
+        generate_response as a single delta. Subclasses override this to
+        forward the provider's own streaming deltas.
+        
+        Args:
+            prompt: The user's input prompt
+            system_prompt: The system instructions for the model
+            max_tokens: Maximum number of tokens (ignored - length control via prompt)
+            
+        Yields:
+            str: The next piece of generated text
+            
+        Raises:
+            Exception: If all model fallbacks fail before any text was produced,
+                or the stream breaks after text was produced
+        """
+        yield await self.generate_response(prompt, system_prompt, max_tokens)
+    
+    @asynccontextmanager
+    async def _rate_limit(self, model: str, prompt: str, system_prompt: str) -> AsyncIterator[Reservation]:
+        """
+        Wait for the shared rate limit of this API/model before calling it
+        
+        Every provider call goes through this, so concurrent threads share
+        one quota per model. Rate limit errors raised inside the block pause
+        the model for its Retry-After period, and the reserved token budget
+        is settled against the recorded output on exit.
+        
+        Args:
+            model: The model that is about to be called
+            prompt: The user's input prompt
+            system_prompt: The system instructions for the model
+            
+        Yields:
+            Reservation: Record generated text on it with record_output
+        """
+        reservation = await rate_limiter.acquire(self.api_type, model, f"{system_prompt}\n{prompt}")
+        try:
+            yield reservation
+        except Exception as e:
+            rate_limiter.report_error(self.api_type, model, e)
+            raise
+        finally:
+            reservation.settle()
+    
+    async def aclose(self) -> None:
+        """
+        Release the underlying connection pool
+        
+        Clients are shared process-wide by AIClientFactory, so this is only
+        called on application shutdown.
+        """
+        pass
+    
     # _truncate_responseメソッドは削除（使用されていないため）
 
 class AIClientFactory:
@@ -91,8 +184,11 @@ class AIClientFactory:
         "nanashi": "random"
     }
     
+    # api_typeごとに共有されるクライアント（初回利用時に生成）
+    _clients: Dict[str, BaseAIClient] = {}
+    
     @staticmethod
-    def get_client(character_id: str):
+    def get_client(character_id: str) -> BaseAIClient:
         """
         キャラクターIDに基づいて固定のAPIクライアントを返す
         PRIMARY_APIはフォールバック用
@@ -105,31 +201,64 @@ class AIClientFactory:
         if api_type == "random":
             api_type = random.choice(["openai", "anthropic", "google"])
         
-        if api_type == "grok":
-            return GrokClient()
-        elif api_type == "openai":
-            return OpenAIClient()
-        elif api_type == "anthropic":
-            return AnthropicClient()
-        elif api_type == "google":
-            return GeminiClient()
-        else:
-            return OpenAIClient()
+        if api_type not in ("grok", "openai", "anthropic", "google"):
+            api_type = "openai"
+        
+        return AIClientFactory.get_shared_client(api_type)
+    
+    @staticmethod
+    def get_shared_client(api_type: str) -> BaseAIClient:
+        """
+        api_typeごとのクライアントを返す
+        接続プールを使い回すため、プロセス内で1インスタンスのみ生成する
+        """
+        client = AIClientFactory._clients.get(api_type)
+        if client is None:
+            if api_type == "grok":
+                client = GrokClient()
+            elif api_type == "anthropic":
+                client = AnthropicClient()
+            elif api_type == "google":
+                client = GeminiClient()
+            else:
+                client = OpenAIClient()
+            AIClientFactory._clients[api_type] = client
+            logger.info(f"Initialized shared {api_type} client")
+        return client
+    
+    @staticmethod
+    async def close_all() -> None:
+        """共有クライアントの接続プールをすべてクローズ"""
+        clients = list(AIClientFactory._clients.items())
+        AIClientFactory._clients.clear()
+        for api_type, client in clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"Error closing {api_type} client: {str(e)}")
 
 class GrokClient(BaseAIClient):
-    """Grok API専用クライアント"""
+    """Grok API専用クライアント（xai_sdkの非同期クライアントを使用）"""
     def __init__(self):
         super().__init__("grok")
         api_key = get_api_key("GROK_API_KEY")
-        self.client = XAIClient(api_key=api_key, timeout=3600)
+        # 応答全体・チャンク間の待ち時間の上限（秒）
+        self.timeout = float(os.getenv("GROK_TIMEOUT", "120"))
+        self.client = XAIAsyncClient(api_key=api_key, timeout=self.timeout)
+    
+    def _create_chat(self, model: str, prompt: str, system_prompt: str):
+        chat = self.client.chat.create(model=model)
+        chat.append(system(system_prompt))
+        chat.append(user(prompt))
+        return chat
     
     async def generate_response(self, prompt: str, system_prompt: str, max_tokens: int = 8192) -> str:
         for model in self.models:
             try:
-                chat = self.client.chat.create(model=model)
-                chat.append(system(system_prompt))
-                chat.append(user(prompt))
-                response = chat.sample()
+                async with self._rate_limit(model, prompt, system_prompt) as reservation:
+                    chat = self._create_chat(model, prompt, system_prompt)
+                    response = await asyncio.wait_for(chat.sample(), self.timeout)
+                    reservation.record_output(response.content)
                 logger.info(f"Grok: Successfully used model {model}")
                 return response.content  # 文字数制御はプロンプトで実施
             except Exception as e:
@@ -137,44 +266,82 @@ class GrokClient(BaseAIClient):
                 if model == self.models[-1]:
                     raise e
                 continue
+    
+    async def generate_response_stream(self, prompt: str, system_prompt: str, max_tokens: int = 8192) -> AsyncIterator[str]:
+        for model in self.models:
+            produced = False
+            stream = None
+            try:
+                async with self._rate_limit(model, prompt, system_prompt) as reservation:
+                    chat = self._create_chat(model, prompt, system_prompt)
+                    stream = chat.stream()
+                    while True:
+                        # チャンクが届かないまま止まった呼び出しはタイムアウトでキャンセルする
+                        try:
+                            _, chunk = await asyncio.wait_for(stream.__anext__(), self.timeout)
+                        except StopAsyncIteration:
+                            break
+                        if chunk.content:
+                            produced = True
+                            reservation.record_output(chunk.content)
+                            yield chunk.content
+                logger.info(f"Grok: Successfully streamed model {model}")
+                return
+            except Exception as e:
+                logger.warning(f"Grok: Stream failed with model {model}: {str(e)}")
+                if produced or model == self.models[-1]:
+                    raise e
+                continue
+            finally:
+                if stream is not None:
+                    await stream.aclose()
 
 class OpenAIClient(BaseAIClient):
     """OpenAI API専用クライアント"""
     def __init__(self):
         super().__init__("openai")
         api_key = get_api_key("OPENAI_API_KEY")
-        self.client = AsyncOpenAI(api_key=api_key)
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            http_client=OpenAIHttpxClient(limits=POOL_LIMITS, timeout=REQUEST_TIMEOUT)
+        )
+    
+    async def aclose(self) -> None:
+        await self.client.close()
+    
+    def _build_params(self, model: str, prompt: str, system_prompt: str) -> Dict[str, Any]:
+        """モデルごとのリクエストパラメータを構築"""
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ]
+        # GPT-5-mini uses max_completion_tokens instead of max_tokens
+        if model.startswith("gpt-5"):
+            return {
+                "model": model,
+                "messages": messages,
+                "max_completion_tokens": 16384,  # GPT-5の上限
+                "temperature": 1.0
+                # include_reasoningはサポートされていないので削除
+            }
+        return {
+            "model": model,
+            "messages": messages,
+            "max_tokens": 16384,  # OpenAIの上限
+            "temperature": DEFAULT_PARAMS["temperature"],
+            "top_p": DEFAULT_PARAMS["top_p"],
+            "frequency_penalty": DEFAULT_PARAMS["frequency_penalty"],
+            "presence_penalty": DEFAULT_PARAMS["presence_penalty"]
+        }
     
     async def generate_response(self, prompt: str, system_prompt: str, max_tokens: int = 8192) -> str:
         for model in self.models:
             try:
-                # GPT-5-mini uses max_completion_tokens instead of max_tokens
-                if model.startswith("gpt-5"):
-                    params = {
-                        "model": model,
-                        "messages": [
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": prompt}
-                        ],
-                        "max_completion_tokens": 16384,  # GPT-5の上限
-                        "temperature": 1.0
-                        # include_reasoningはサポートされていないので削除
-                    }
-                else:
-                    params = {
-                        "model": model,
-                        "messages": [
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": prompt}
-                        ],
-                        "max_tokens": 16384,  # OpenAIの上限
-                        "temperature": DEFAULT_PARAMS["temperature"],
-                        "top_p": DEFAULT_PARAMS["top_p"],
-                        "frequency_penalty": DEFAULT_PARAMS["frequency_penalty"],
-                        "presence_penalty": DEFAULT_PARAMS["presence_penalty"]
-                    }
+                params = self._build_params(model, prompt, system_prompt)
                 
-                response = await self.client.chat.completions.create(**params)
+                async with self._rate_limit(model, prompt, system_prompt) as reservation:
+                    response = await self.client.chat.completions.create(**params)
+                    reservation.record_output(response.choices[0].message.content or "")
                 logger.info(f"OpenAI: Successfully used model {model}")
                 
                 content = response.choices[0].message.content
@@ -197,25 +364,63 @@ class OpenAIClient(BaseAIClient):
                 if model == self.models[-1]:
                     raise e
                 continue
+    
+    async def generate_response_stream(self, prompt: str, system_prompt: str, max_tokens: int = 8192) -> AsyncIterator[str]:
+        for model in self.models:
+            produced = False
+            try:
+                params = self._build_params(model, prompt, system_prompt)
+                async with self._rate_limit(model, prompt, system_prompt) as reservation:
+                    stream = await self.client.chat.completions.create(**params, stream=True)
+                    async for chunk in stream:
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            produced = True
+                            reservation.record_output(delta)
+                            yield delta
+                
+                if produced:
+                    logger.info(f"OpenAI: Successfully streamed model {model}")
+                    return
+                
+                logger.warning(f"OpenAI: Empty stream from model {model}, using fallback")
+                if model == self.models[-1]:
+                    yield "そうですね、確かに興味深い話題ですね。"
+                    return
+            except Exception as e:
+                logger.warning(f"OpenAI: Stream failed with model {model}: {str(e)}")
+                if produced or model == self.models[-1]:
+                    raise e
+                continue
 
 class AnthropicClient(BaseAIClient):
     """Anthropic API専用クライアント"""
     def __init__(self):
         super().__init__("anthropic")
         api_key = get_api_key("ANTHROPIC_API_KEY")
-        self.client = AsyncAnthropic(api_key=api_key)
+        self.client = AsyncAnthropic(
+            api_key=api_key,
+            http_client=AnthropicHttpxClient(limits=POOL_LIMITS, timeout=REQUEST_TIMEOUT)
+        )
+    
+    async def aclose(self) -> None:
+        await self.client.close()
     
     async def generate_response(self, prompt: str, system_prompt: str, max_tokens: int = 8192) -> str:
         for model in self.models:
             try:
                 adjusted_max_tokens = 8192  # Anthropicの実用的な上限
-                response = await self.client.messages.create(
-                    model=model,
-                    max_tokens=adjusted_max_tokens,
-                    system=system_prompt,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.8
-                )
+                async with self._rate_limit(model, prompt, system_prompt) as reservation:
+                    response = await self.client.messages.create(
+                        model=model,
+                        max_tokens=adjusted_max_tokens,
+                        system=system_prompt,
+                        messages=[{"role": "user", "content": prompt}],
+                        temperature=0.8
+                    )
+                    reservation.record_output(response.content[0].text)
                 logger.info(f"Anthropic: Successfully used model {model}")
                 return response.content[0].text
             except Exception as e:
@@ -223,6 +428,31 @@ class AnthropicClient(BaseAIClient):
                 if model == self.models[-1]:
                     raise e
                 continue
+    
+    async def generate_response_stream(self, prompt: str, system_prompt: str, max_tokens: int = 8192) -> AsyncIterator[str]:
+        for model in self.models:
+            produced = False
+            try:
+                async with self._rate_limit(model, prompt, system_prompt) as reservation, \
+                        self.client.messages.stream(
+                            model=model,
+                            max_tokens=8192,  # Anthropicの実用的な上限
+                            system=system_prompt,
+                            messages=[{"role": "user", "content": prompt}],
+                            temperature=0.8
+                        ) as stream:
+                    async for text in stream.text_stream:
+                        if text:
+                            produced = True
+                            reservation.record_output(text)
+                            yield text
+                logger.info(f"Anthropic: Successfully streamed model {model}")
+                return
+            except Exception as e:
+                logger.warning(f"Anthropic: Stream failed with model {model}: {str(e)}")
+                if produced or model == self.models[-1]:
+                    raise e
+                continue
 
 class GeminiClient(BaseAIClient):
     """Google Gemini API専用クライアント"""
@@ -230,15 +460,14 @@ class GeminiClient(BaseAIClient):
         super().__init__("google")
         api_key = get_api_key("GOOGLE_API_KEY")
         genai.configure(api_key=api_key)
-        self.current_model = None
+        self._model_cache: Dict[str, genai.GenerativeModel] = {}
         self._initialize_model()
     
     def _initialize_model(self):
         """モデルの初期化（フォールバック付き）"""
         for model_name in self.models:
             try:
-                self.current_model = genai.GenerativeModel(model_name)
-                self.current_model_name = model_name
+                self._get_model(model_name)
                 logger.info(f"Gemini: Initialized with model {model_name}")
                 return
             except Exception as e:
@@ -247,45 +476,35 @@ class GeminiClient(BaseAIClient):
                     raise e
                 continue
     
+    def _get_model(self, model_name: str) -> "genai.GenerativeModel":
+        """GenerativeModelをモデル名ごとに一度だけ生成して使い回す"""
+        model = self._model_cache.get(model_name)
+        if model is None:
+            model = genai.GenerativeModel(model_name)
+            self._model_cache[model_name] = model
+        return model
+    
+    def _generation_config(self) -> "genai.GenerationConfig":
+        return genai.GenerationConfig(
+            max_output_tokens=8192,  # Geminiの実用的な上限
+            temperature=0.8,
+            top_p=0.9
+        )
+    
     async def generate_response(self, prompt: str, system_prompt: str, max_tokens: int = 8192) -> str:
         full_prompt = f"{system_prompt}\n\n{prompt}"
         
-        safety_settings = [
-            {
-                "category": HarmCategory.HARM_CATEGORY_HARASSMENT,
-                "threshold": HarmBlockThreshold.BLOCK_NONE,
-            },
-            {
-                "category": HarmCategory.HARM_CATEGORY_HATE_SPEECH,
-                "threshold": HarmBlockThreshold.BLOCK_NONE,
-            },
-            {
-                "category": HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT,
-                "threshold": HarmBlockThreshold.BLOCK_NONE,
-            },
-            {
-                "category": HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT,
-                "threshold": HarmBlockThreshold.BLOCK_NONE,
-            },
-        ]
-        
-        for i, model_name in enumerate(self.models):
+        for model_name in self.models:
             try:
-                if i > 0 or self.current_model_name != model_name:
-                    self.current_model = genai.GenerativeModel(model_name)
-                    self.current_model_name = model_name
-                
-                generation_config = genai.GenerationConfig(
-                    max_output_tokens=8192,  # Geminiの実用的な上限
-                    temperature=0.8,
-                    top_p=0.9
-                )
-                
-                response = await self.current_model.generate_content_async(
-                    full_prompt,
-                    generation_config=generation_config,
-                    safety_settings=safety_settings,
-                )
+                async with self._rate_limit(model_name, prompt, system_prompt) as reservation:
+                    response = await self._get_model(model_name).generate_content_async(
+                        full_prompt,
+                        generation_config=self._generation_config(),
+                        safety_settings=GEMINI_SAFETY_SETTINGS,
+                    )
+                    for candidate in response.candidates[:1]:
+                        if candidate.content and candidate.content.parts:
+                            reservation.record_output(candidate.content.parts[0].text or "")
                 
                 if not response.candidates:
                     logger.warning(f"Gemini: No candidates returned for model {model_name}")
@@ -317,4 +536,39 @@ class GeminiClient(BaseAIClient):
                     continue
                 if model_name == self.models[-1]:
                     raise e
-                continue
\ No newline at end of file
+                continue
+    
+    async def generate_response_stream(self, prompt: str, system_prompt: str, max_tokens: int = 8192) -> AsyncIterator[str]:
+        full_prompt = f"{system_prompt}\n\n{prompt}"
+        
+        for model_name in self.models:
+            produced = False
+            try:
+                async with self._rate_limit(model_name, prompt, system_prompt) as reservation:
+                    response = await self._get_model(model_name).generate_content_async(
+                        full_prompt,
+                        generation_config=self._generation_config(),
+                        safety_settings=GEMINI_SAFETY_SETTINGS,
+                        stream=True,
+                    )
+                    
+                    async for chunk in response:
+                        if not chunk.candidates:
+                            continue
+                        content = chunk.candidates[0].content
+                        if content and content.parts and content.parts[0].text:
+                            produced = True
+                            reservation.record_output(content.parts[0].text)
+                            yield content.parts[0].text
+                
+                if produced:
+                    logger.info(f"Gemini: Successfully streamed model {model_name}")
+                else:
+                    logger.warning(f"Gemini: Using fallback response for {model_name}")
+                    yield "そうだね、確かにそういう見方もあるね。"
+                return
+            except Exception as e:
+                logger.warning(f"Gemini: Stream failed with model {model_name}: {str(e)}")
+                if produced or model_name == self.models[-1]:
+                    raise e
+                continue
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+def content_hash(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False, sort_keys=True).encode()).hexdigest()
+
+class ArenaCache:
+    """On-disk, content-addressed cache of model responses and judge verdicts, bounded to max_bytes by LRU eviction."""
+
+    def __init__(self, path: str = "arena_cache.db", max_bytes: int = 512 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self.conn.commit()
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        self.stats: Dict[str, Dict[str, int]] = {
+            kind: {"hits": 0, "misses": 0} for kind in ("response", "verdict", "ranking")
+        }
+        # last_used of cache hits, written with the next put / evict / close instead of a commit per hit
+        self._touched: Dict[str, float] = {}
+
+    @staticmethod
+    def response_key(endpoint_url: str, model_id: str, prompt: str, params: Optional[Dict] = None) -> str:
+        return content_hash("response", endpoint_url, model_id, hashlib.sha256(prompt.encode()).hexdigest(), params or {})
+
+    @staticmethod
+    def verdict_key(endpoint_url: str, model_id: str, prompt: str, response1: str, response2: str,
+                    params: Optional[Dict] = None) -> str:
+        # params is the judge configuration (mode, prompt template, ...): changing it must not reuse old verdicts
+        return content_hash("verdict", endpoint_url, model_id, *[
+            hashlib.sha256(text.encode()).hexdigest() for text in (prompt, response1, response2)
+        ], params or {})
+
+    @staticmethod
+    def ranking_key(endpoint_url: str, model_id: str, prompt: str, responses: List[str],
+                    params: Optional[Dict] = None) -> str:
+        # Order-independent: the same set of responses hits the cache whatever order the models were listed in
+        return content_hash("ranking", endpoint_url, model_id, hashlib.sha256(prompt.encode()).hexdigest(),
+                            sorted(hashlib.sha256(text.encode()).hexdigest() for text in responses), params or {})
+
+    def get(self, kind: str, key: str):
+        row = self.conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.stats[kind]["misses"] += 1
+            return None
+        self.stats[kind]["hits"] += 1
+        self._touched[key] = time.time()
+        return json.loads(row[0])
+
+    def _flush_touches(self) -> None:
+        # Runs inside the caller's transaction; the caller commits
+        if self._touched:
+            self.conn.executemany("UPDATE entries SET last_used = ? WHERE key = ?",
+                                  [(last_used, key) for key, last_used in self._touched.items()])
+            self._touched.clear()
+
+    def put(self, kind: str, key: str, value) -> None:
+        payload = json.dumps(value, ensure_ascii=False)
+        previous = self.conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+        self._flush_touches()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO entries (key, kind, value, size, last_used) VALUES (?, ?, ?, ?, ?)",
+            (key, kind, payload, len(payload), time.time())
+        )
+        self.conn.commit()
+        self.total_bytes += len(payload) - (previous[0] if previous else 0)
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self) -> None:
+        # Drop least recently used entries until the cache is back under 90% of its budget
+        target = self.max_bytes * 0.9
+        self._flush_touches()
+        rows = self.conn.execute("SELECT key, size FROM entries ORDER BY last_used").fetchall()
+        evicted = []
+        for key, size in rows:
+            if self.total_bytes <= target:
+                break
+            evicted.append((key,))
+            self.total_bytes -= size
+        self.conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+        self.conn.commit()
+        logger.info(f"Evicted {len(evicted)} cache entries")
+
+    def get_response(self, endpoint_url: str, model_id: str, prompt: str, params: Optional[Dict] = None) -> Optional[str]:
+        return self.get("response", self.response_key(endpoint_url, model_id, prompt, params))
+
+    def put_response(self, endpoint_url: str, model_id: str, prompt: str, params: Optional[Dict], response: str) -> None:
+        self.put("response", self.response_key(endpoint_url, model_id, prompt, params), response)
+
+    def get_verdict(self, endpoint_url: str, model_id: str, prompt: str, response1: str, response2: str,
+                    params: Optional[Dict] = None) -> Optional[Tuple[int, int, str]]:
+        verdict = self.get("verdict", self.verdict_key(endpoint_url, model_id, prompt, response1, response2, params))
+        return tuple(verdict) if verdict is not None else None
+
+    def put_verdict(self, endpoint_url: str, model_id: str, prompt: str, response1: str, response2: str,
+                    params: Optional[Dict], verdict: Tuple[int, int, str]) -> None:
+        self.put("verdict", self.verdict_key(endpoint_url, model_id, prompt, response1, response2, params), list(verdict))
+
+    def get_ranking(self, endpoint_url: str, model_id: str, prompt: str, responses: List[str],
+                    params: Optional[Dict] = None) -> Optional[Tuple[List[int], str]]:
+        ranking = self.get("ranking", self.ranking_key(endpoint_url, model_id, prompt, responses, params))
+        if ranking is None:
+            return None
+        scores = ranking["scores"]
+        return [scores[hashlib.sha256(text.encode()).hexdigest()] for text in responses], ranking["explanation"]
+
+    def put_ranking(self, endpoint_url: str, model_id: str, prompt: str, responses: List[str],
+                    params: Optional[Dict], ranking: Tuple[List[int], str]) -> None:
+        scores, explanation = ranking
+        self.put("ranking", self.ranking_key(endpoint_url, model_id, prompt, responses, params), {
+            "scores": {hashlib.sha256(text.encode()).hexdigest(): score for text, score in zip(responses, scores)},
+            "explanation": explanation
+        })
+
+    def close(self) -> None:
+        self._flush_touches()
+        self.conn.commit()
+        self.conn.close()
@@ -0,0 +1,23 @@
+import json
+import os
+from typing import Dict, Optional
+
+class ArenaCheckpoint:
+    """Arena state saved as one JSON file, replaced atomically so a crash never leaves a partial checkpoint."""
+
+    def __init__(self, path: str = "arena_checkpoint.json"):
+        self.path = path
+
+    def save(self, state: Dict) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def load(self) -> Optional[Dict]:
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, encoding="utf-8") as f:
+            return json.load(f)
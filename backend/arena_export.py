@@ -0,0 +1,50 @@
+import hashlib
+import json
+import os
+from typing import Dict, Optional
+
+class TrainingDataExporter:
+    """Appends one JSONL training record per prompt as soon as that prompt's battles are done.
+
+    With resume=True the existing file is kept and prompts already in it are reported as exported,
+    so an interrupted run can skip them. size cuts the file back to the length recorded in an arena
+    checkpoint, dropping records whose battles the checkpoint does not contain.
+    """
+
+    def __init__(self, path: str = "training_data.jsonl", resume: bool = False, size: Optional[int] = None):
+        self.path = path
+        self.exported = set()
+        self.count = 0
+        if resume and size is not None and os.path.exists(path):
+            os.truncate(path, size)
+        if resume and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self.exported.add(self.prompt_key(json.loads(line)["prompt"]))
+                    except (json.JSONDecodeError, KeyError):
+                        # A record cut off by a crash is rewritten when its prompt runs again
+                        continue
+            self.count = len(self.exported)
+        self.file = open(path, "a" if resume else "w", encoding="utf-8")
+
+    @staticmethod
+    def prompt_key(prompt: str) -> str:
+        return hashlib.sha256(prompt.encode()).hexdigest()
+
+    def is_exported(self, prompt: str) -> bool:
+        return self.prompt_key(prompt) in self.exported
+
+    def write(self, record: Dict) -> None:
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.exported.add(self.prompt_key(record["prompt"]))
+        self.count += 1
+
+    @property
+    def size(self) -> int:
+        return self.file.tell()
+
+    def close(self) -> None:
+        self.file.close()
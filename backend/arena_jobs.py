@@ -0,0 +1,54 @@
+import asyncio
+import random
+from typing import Awaitable, Callable, Dict, TypeVar
+
+T = TypeVar("T")
+
+DEFAULT_MAX_CONCURRENCY = 4
+
+class NonRetryableError(Exception):
+    """Raised by a job whose failure another attempt would not fix; the scheduler gives up on it at once."""
+
+class JobScheduler:
+    """Runs arena requests with a concurrency limit per endpoint URL and retries failed calls with backoff."""
+
+    def __init__(self, max_retries: int = 3, retry_backoff: float = 1.0, max_backoff: float = 30.0):
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.stats = {"succeeded": 0, "retried": 0, "failed": 0}
+
+    def semaphore_for(self, endpoint) -> asyncio.Semaphore:
+        # Keyed by URL so that models configured with separate Endpoint objects for the same server share one limit
+        if endpoint.url not in self.semaphores:
+            limit = getattr(endpoint, "max_concurrency", None) or DEFAULT_MAX_CONCURRENCY
+            self.semaphores[endpoint.url] = asyncio.Semaphore(limit)
+        return self.semaphores[endpoint.url]
+
+    async def submit(self, endpoint, job: Callable[[], Awaitable[T]], description: str = "") -> T:
+        semaphore = self.semaphore_for(endpoint)
+        attempt = 0
+        while True:
+            try:
+                async with semaphore:
+                    result = await job()
+                self.stats["succeeded"] += 1
+                return result
+            except asyncio.CancelledError:
+                raise
+            except NonRetryableError as e:
+                self.stats["failed"] += 1
+                print(f"Giving up on {description}: {e}")
+                raise
+            except Exception as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    self.stats["failed"] += 1
+                    print(f"Giving up on {description} after {attempt} attempts: {e}")
+                    raise
+                # Exponential backoff with jitter, outside the semaphore so other jobs can use the slot
+                delay = min(self.max_backoff, self.retry_backoff * 2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+                self.stats["retried"] += 1
+                print(f"Retrying {description} in {delay:.1f}s (attempt {attempt}/{self.max_retries}): {e}")
+                await asyncio.sleep(delay)
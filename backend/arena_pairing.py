@@ -0,0 +1,103 @@
+import itertools
+import math
+import random
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+class PairingStrategy(ABC):
+    """Chooses which model pairs the judge compares for each prompt, within an optional total judge-call budget."""
+
+    def __init__(self, pairs_per_prompt: Optional[int] = None, budget: Optional[int] = None):
+        self.pairs_per_prompt = pairs_per_prompt
+        self.budget = budget
+        self.judge_calls = 0
+        self.pair_counts: Dict[Tuple[str, str], int] = {}
+
+    def remaining(self) -> Optional[int]:
+        return None if self.budget is None else max(0, self.budget - self.judge_calls)
+
+    def select_pairs(self, models: List, prompt: str, listwise: bool = False) -> List[Tuple]:
+        # A listwise judgement scores all of a prompt's pairs in one request, so it is charged as one call
+        limit = self.pairs_per_prompt
+        remaining = self.remaining()
+        if remaining is not None and not listwise:
+            limit = remaining if limit is None else min(limit, remaining)
+        if remaining == 0 or limit == 0 or len(models) < 2:
+            return []
+        pairs = self.choose(models, limit)
+        for model1, model2 in pairs:
+            key = self.pair_key(model1, model2)
+            self.pair_counts[key] = self.pair_counts.get(key, 0) + 1
+        self.judge_calls += min(1, len(pairs)) if listwise else len(pairs)
+        return pairs
+
+    @abstractmethod
+    def choose(self, models: List, limit: Optional[int]) -> List[Tuple]:
+        """Picks up to limit pairs (no limit if None) for one prompt"""
+        pass
+
+    def times_met(self, model1, model2) -> int:
+        return self.pair_counts.get(self.pair_key(model1, model2), 0)
+
+    @staticmethod
+    def pair_key(model1, model2) -> Tuple[str, str]:
+        return tuple(sorted((model1.name, model2.name)))
+
+    def state(self) -> Dict:
+        return {
+            "judge_calls": self.judge_calls,
+            "pair_counts": [[name1, name2, count] for (name1, name2), count in self.pair_counts.items()]
+        }
+
+    def restore(self, state: Dict) -> None:
+        self.judge_calls = state.get("judge_calls", 0)
+        self.pair_counts = {(name1, name2): count for name1, name2, count in state.get("pair_counts", [])}
+
+class AllPairs(PairingStrategy):
+    def choose(self, models: List, limit: Optional[int]) -> List[Tuple]:
+        return list(itertools.combinations(models, 2))[:limit]
+
+class RandomPairs(PairingStrategy):
+    def choose(self, models: List, limit: Optional[int]) -> List[Tuple]:
+        pairs = list(itertools.combinations(models, 2))
+        return random.sample(pairs, min(limit or len(pairs), len(pairs)))
+
+class SwissPairs(PairingStrategy):
+    # Each prompt is a round: models are ranked by rating and paired with the nearest-ranked
+    # opponent they have met least often, so every model plays once per round
+    def choose(self, models: List, limit: Optional[int]) -> List[Tuple]:
+        ranked = sorted(models, key=lambda model: model.elo, reverse=True)
+        pairs = []
+        while len(ranked) >= 2:
+            model = ranked.pop(0)
+            opponent = min(ranked[:3], key=lambda other: self.times_met(model, other))
+            ranked.remove(opponent)
+            pairs.append((model, opponent))
+        return pairs[:limit]
+
+class ActivePairs(PairingStrategy):
+    # Prefers pairs whose outcome is least predictable: close ratings (win probability near 0.5)
+    # and few previous comparisons
+    def choose(self, models: List, limit: Optional[int]) -> List[Tuple]:
+        limit = limit or max(1, len(models) // 2)
+
+        def informativeness(pair) -> float:
+            model1, model2 = pair
+            p = 1 / (1 + 10 ** ((model2.elo - model1.elo) / 400))
+            return p * (1 - p) / math.sqrt(1 + self.times_met(model1, model2)) + random.uniform(0, 1e-3)
+
+        ranked = sorted(itertools.combinations(models, 2), key=informativeness, reverse=True)
+        return ranked[:limit]
+
+PAIRING_STRATEGIES = {
+    "all": AllPairs,
+    "random": RandomPairs,
+    "swiss": SwissPairs,
+    "active": ActivePairs,
+}
+
+def create_pairing_strategy(name: str = "all", pairs_per_prompt: Optional[int] = None,
+                            budget: Optional[int] = None) -> PairingStrategy:
+    if name not in PAIRING_STRATEGIES:
+        raise ValueError(f"Unknown pairing strategy: {name}")
+    return PAIRING_STRATEGIES[name](pairs_per_prompt=pairs_per_prompt, budget=budget)
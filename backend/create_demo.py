@@ -5,7 +5,6 @@
 
 import argparse
 import asyncio
-import json
 from datetime import datetime
 import sys
 import os
@@ -14,8 +13,12 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from thread_manager import ThreadManager
+from thread_store import JsonlThreadStore
 from characters import CHARACTERS
 
+# 生成したデモスレッドの保存先（スレッドごとの追記専用JSONL）
+DEMO_STORE_DIR = "demo_threads"
+
 # デモシナリオ定義
 DEMO_SCENARIOS = {
     1: {
@@ -53,15 +56,24 @@ async def create_demo(scenario_id: int, posts: int = 50):
     print(f"最大投稿数: {posts}")
     print("-" * 60)
     
-    # ThreadManager作成
+    # ThreadManager作成（レスは生成されるたびにストアへ追記される）
+    start_time = datetime.now()
+    thread_id = f"demo_scenario_{scenario_id}_{start_time.strftime('%Y%m%d_%H%M%S')}"
+    store = JsonlThreadStore(DEMO_STORE_DIR)
     thread_manager = ThreadManager(
         title=scenario['title'],
-        max_posts=posts
+        max_posts=posts,
+        thread_id=thread_id,
+        store=store,
+        pacing="fast"
     )
+    thread_manager.metadata = {
+        "scenario_id": scenario_id,
+        "description": scenario['description']
+    }
     
     # 生成開始
     print("🚀 スレッド生成開始...")
-    start_time = datetime.now()
     
     try:
         await thread_manager.start_thread()
@@ -78,37 +90,14 @@ async def create_demo(scenario_id: int, posts: int = 50):
         print(f"❌ エラー発生: {e}")
         return False
     
-    # 結果を保存
     end_time = datetime.now()
     duration = (end_time - start_time).total_seconds()
     
-    result = {
-        "scenario_id": scenario_id,
-        "title": scenario['title'],
-        "description": scenario['description'],
-        "created_at": start_time.isoformat(),
-        "duration_seconds": duration,
-        "total_posts": len(thread_manager.posts),
-        "posts": []
-    }
+    # 生成時間もスレッド情報として保存
+    thread_manager.metadata["duration_seconds"] = duration
+    await thread_manager.save()
     
-    # 投稿内容を追加
-    for post in thread_manager.posts:
-        result["posts"].append({
-            "number": post.number,
-            "character_id": post.character_id,
-            "character_name": post.character_name,
-            "content": post.content,
-            "timestamp": post.timestamp.isoformat(),
-            "anchors": post.anchors
-        })
-    
-    # ファイルに保存
-    filename = f"demo_scenario_{scenario_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(result, f, ensure_ascii=False, indent=2)
-    
-    print(f"💾 結果を {filename} に保存しました")
+    print(f"💾 結果を {store.thread_path(thread_id)} に保存しました")
     
     # 統計情報表示
     print("-" * 60)
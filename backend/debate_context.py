@@ -0,0 +1,80 @@
+import logging
+import os
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from rate_limiter import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN_BUDGET = int(os.getenv("DEBATE_CONTEXT_TOKENS", "4096"))
+DEFAULT_COMPACT_TURNS = int(os.getenv("DEBATE_COMPACT_TURNS", "2"))
+DEFAULT_SUMMARIZE = os.getenv("DEBATE_SUMMARIZE", "false").lower() == "true"
+DEFAULT_KEEP_ALIVE = os.getenv("DEBATE_KEEP_ALIVE", "10m")
+
+MESSAGE_OVERHEAD_TOKENS = 4  # Role and framing of each chat message
+
+class DebateContext:
+    """Conversation history for one debate agent, kept under a token budget.
+
+    When the history plus the next prompt would exceed the budget, the oldest turns are dropped several at a time
+    (compact_turns exchanges per step) and, optionally, folded into a running summary that is sent as the first message.
+    Between compactions the messages sent each turn only grow at the end, so the server can reuse its KV cache for
+    the unchanged prefix instead of re-evaluating the whole history; keep_alive keeps the model loaded between turns.
+    """
+
+    def __init__(self, token_budget: int = DEFAULT_TOKEN_BUDGET, compact_turns: int = DEFAULT_COMPACT_TURNS,
+                 summarize: bool = DEFAULT_SUMMARIZE, keep_alive: Optional[str] = DEFAULT_KEEP_ALIVE):
+        self.token_budget = token_budget
+        self.compact_turns = max(1, compact_turns)
+        self.summarize = summarize
+        self.keep_alive = keep_alive
+        self.turns: List[Dict[str, str]] = []  # Alternating user / assistant messages
+        self.summary = ""
+        self.dropped_turns = 0
+
+    def empty_copy(self) -> "DebateContext":
+        return DebateContext(self.token_budget, self.compact_turns, self.summarize, self.keep_alive)
+
+    def summary_message(self) -> List[Dict[str, str]]:
+        if not self.summary:
+            return []
+        return [{"role": "system", "content": f"Summary of the earlier part of this debate:\n{self.summary}"}]
+
+    def messages(self, prompt: str, role: str = "user") -> List[Dict[str, str]]:
+        return self.summary_message() + self.turns + [{"role": role, "content": prompt}]
+
+    def tokens(self, messages: List[Dict[str, str]]) -> int:
+        # Same estimate as the API rate limiter, so both budgets agree on the same text
+        return sum(estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+    def over_budget(self, prompt: str) -> bool:
+        return self.tokens(self.messages(prompt)) > self.token_budget
+
+    async def compact(self, prompt: str, summarizer: Optional[Callable[[str], Awaitable[str]]] = None) -> None:
+        # A new summary can be longer than the one it replaces, so the budget is checked again after each one
+        while self.turns and self.over_budget(prompt):
+            dropped: List[Dict[str, str]] = []
+            while self.turns and self.over_budget(prompt):
+                count = min(len(self.turns), 2 * self.compact_turns)
+                dropped.extend(self.turns[:count])
+                del self.turns[:count]
+            self.dropped_turns += len(dropped) // 2
+            if self.summarize and summarizer:
+                await self.fold_into_summary(dropped, summarizer)
+
+        # With no turns left to drop, only the most recent part of the summary is kept
+        while self.summary and self.over_budget(prompt):
+            self.summary = self.summary[len(self.summary) // 4 + 1:]
+
+    async def fold_into_summary(self, dropped: List[Dict[str, str]],
+                                summarizer: Callable[[str], Awaitable[str]]) -> None:
+        text = "\n\n".join(f"{message['role']}: {message['content']}" for message in dropped)
+        try:
+            self.summary = await summarizer(f"{self.summary}\n\n{text}".strip())
+        except Exception as e:
+            # Losing the summary only costs context; the debate itself goes on
+            logger.warning(f"Failed to summarize {len(dropped) // 2} dropped turns: {e}")
+
+    def add_turn(self, prompt: str, response: str) -> None:
+        self.turns.append({"role": "user", "content": prompt})
+        self.turns.append({"role": "assistant", "content": response})
@@ -1,5 +1,7 @@
 import asyncio
 import aiohttp
+import copy
+from contextlib import asynccontextmanager, nullcontext
 from typing import Dict, List, Optional, Tuple, AsyncGenerator
 from dataclasses import dataclass
 from enum import Enum
@@ -7,6 +9,10 @@ import json
 import time
 from datetime import datetime
 
+from debate_context import DebateContext
+from http_transport import get_session
+from rating import RatingEngine
+
 
 class AgentRole(Enum):
     COMBATANT_A = "combatant_a"
@@ -16,11 +22,98 @@ class AgentRole(Enum):
 
 @dataclass
 class DebateMetrics:
-    ttft: Optional[float] = None  # Time to first token
-    tps: float = 0.0  # Tokens per second
+    ttft: Optional[float] = None  # Time to first token (measured by the client)
+    tps: float = 0.0  # Tokens per second (chunk-based estimate while streaming, server decode rate once done)
     total_tokens: int = 0
     start_time: Optional[float] = None
     end_time: Optional[float] = None
+    # Reported by Ollama in the final "done" frame
+    prompt_tokens: Optional[int] = None
+    prompt_eval_duration: Optional[float] = None  # Seconds
+    eval_count: Optional[int] = None
+    eval_duration: Optional[float] = None  # Seconds
+    load_duration: Optional[float] = None  # Seconds
+    
+    def record_chunk(self) -> None:
+        now = time.perf_counter()
+        if self.ttft is None:
+            self.ttft = now - self.start_time
+        self.total_tokens += 1
+        elapsed = now - self.start_time
+        if elapsed > 0:
+            self.tps = self.total_tokens / elapsed
+    
+    def apply_done_frame(self, frame: Dict[str, any]) -> None:
+        # Ollama reports durations in nanoseconds
+        seconds = lambda key: frame[key] / 1e9 if frame.get(key) is not None else None
+        self.prompt_tokens = frame.get("prompt_eval_count")
+        self.prompt_eval_duration = seconds("prompt_eval_duration")
+        self.eval_count = frame.get("eval_count")
+        self.eval_duration = seconds("eval_duration")
+        self.load_duration = seconds("load_duration")
+        if self.eval_count is not None:
+            self.total_tokens = self.eval_count
+            if self.eval_duration:
+                self.tps = self.eval_count / self.eval_duration
+    
+    @property
+    def prompt_tps(self) -> Optional[float]:
+        if self.prompt_tokens is None or not self.prompt_eval_duration:
+            return None
+        return self.prompt_tokens / self.prompt_eval_duration
+    
+    @property
+    def server_ttft(self) -> Optional[float]:
+        # Time the server spent before decoding started: model load plus prompt evaluation
+        if self.prompt_eval_duration is None:
+            return None
+        return (self.load_duration or 0.0) + self.prompt_eval_duration
+    
+    def to_dict(self) -> Dict[str, any]:
+        return {
+            "ttft": self.ttft,
+            "tps": self.tps,
+            "total_tokens": self.total_tokens,
+            "server_ttft": self.server_ttft,
+            "prompt_tokens": self.prompt_tokens,
+            "prompt_tps": self.prompt_tps,
+            "decode_tps": self.tps if self.eval_count is not None else None
+        }
+
+
+# Judge verdict when the evaluation could not be parsed; such a debate is not rated
+NO_VERDICT = "no_verdict"
+
+
+class ChatStreamError(Exception):
+    # An error frame from the server, e.g. an unknown model; the turn must fail rather than come back empty
+    pass
+
+
+async def stream_chat(session: aiohttp.ClientSession, url: str, headers: Dict[str, str],
+                      payload: Dict[str, any], metrics: DebateMetrics) -> AsyncGenerator[str, None]:
+    metrics.start_time = time.perf_counter()
+    async with session.post(url=url, headers=headers, json=payload) as response:
+        response.raise_for_status()
+        async for line in response.content:
+            if not line.strip():
+                continue
+            # Ollama streams JSON directly without "data: " prefix
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "error" in data:
+                raise ChatStreamError(f"{payload.get('model')}: {data['error']}")
+            if data.get('done', False):
+                metrics.apply_done_frame(data)
+                continue
+            # Ollama API format - each message contains a single token
+            token = data.get('message', {}).get('content')
+            if token:
+                metrics.record_chunk()
+                yield token
+    metrics.end_time = time.perf_counter()
 
 
 @dataclass
@@ -31,16 +124,37 @@ class DebateTurn:
     timestamp: datetime
 
 
+class EndpointLimiter:
+    # Caps in-flight requests per endpoint URL, e.g. to the number of parallel slots of a local Ollama server
+    def __init__(self, limits: Optional[Dict[str, int]] = None, default_limit: int = 1):
+        self.limits = limits or {}
+        self.default_limit = default_limit
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    @asynccontextmanager
+    async def slot(self, endpoint: str):
+        if endpoint not in self.semaphores:
+            self.semaphores[endpoint] = asyncio.Semaphore(self.limits.get(endpoint, self.default_limit))
+        async with self.semaphores[endpoint]:
+            yield
+
+
 class DebateAgent:
     def __init__(self, name: str, model_id: str, endpoint: str = "http://localhost:11434/api/chat", 
-                 api_key: Optional[str] = None, persona: Optional[str] = None):
+                 api_key: Optional[str] = None, persona: Optional[str] = None,
+                 context: Optional[DebateContext] = None):
         self.name = name
         self.model_id = model_id
         self.endpoint = endpoint
         self.api_key = api_key
         self.persona = persona
         self.elo_score = 1000
-        self.conversation_history: List[Dict[str, str]] = []
+        # History is kept under a token budget so that per-turn prompt evaluation stays bounded
+        self.context = context or DebateContext()
+    
+    @property
+    def conversation_history(self) -> List[Dict[str, str]]:
+        return self.context.turns
         
     def get_headers(self) -> Dict[str, str]:
         headers = {"Content-Type": "application/json"}
@@ -48,6 +162,31 @@ class DebateAgent:
             headers["Authorization"] = f"Bearer {self.api_key}"
         return headers
     
+    def fresh_copy(self) -> "DebateAgent":
+        # Conversation history is per debate, so concurrent debates each need their own copy of the agent
+        agent = copy.copy(self)
+        agent.context = self.context.empty_copy()
+        return agent
+    
+    async def summarize(self, session: aiohttp.ClientSession, text: str) -> str:
+        is_japanese = any(ord(char) > 0x3000 for char in text)
+        instruction = "次のディベートのやり取りを、各側の主張が分かるように200字以内で要約してください。" if is_japanese \
+            else "Summarize the following debate exchange in under 150 words, keeping each side's main claims."
+        async with session.post(
+            url=self.endpoint,
+            headers=self.get_headers(),
+            json={
+                "model": self.model_id,
+                "messages": [{"role": "user", "content": f"{instruction}\n\n{text}"}],
+                "stream": False,
+                "keep_alive": self.context.keep_alive,
+                "options": {"temperature": 0.2}
+            }
+        ) as response:
+            response.raise_for_status()
+            data = await response.json()
+            return data["message"]["content"].strip()
+    
     def build_prompt(self, topic: str, opponent_response: Optional[str] = None, is_opening: bool = False) -> str:
         # 日本語を検出（簡易的な方法）
         is_japanese = any(ord(char) > 0x3000 for char in topic)
@@ -94,56 +233,26 @@ Make your response in 2-3 paragraphs."""
     async def generate_response_stream(self, session: aiohttp.ClientSession, prompt: str, 
                                       role: str = "user") -> AsyncGenerator[Tuple[str, DebateMetrics], None]:
         metrics = DebateMetrics()
-        metrics.start_time = time.perf_counter()
-        first_token = True
+        await self.context.compact(prompt, lambda text: self.summarize(session, text))
+        messages = self.context.messages(prompt, role)
         
-        messages = self.conversation_history + [{"role": role, "content": prompt}]
-        
-        async with session.post(
-            url=self.endpoint,
-            headers=self.get_headers(),
-            json={
-                "model": self.model_id,
-                "messages": messages,
-                "stream": True,
-                "options": {
-                    "temperature": 0.7,
-                    "num_predict": 3000
-                }
+        parts: List[str] = []
+        payload = {
+            "model": self.model_id,
+            "messages": messages,
+            "stream": True,
+            "options": {
+                "temperature": 0.7,
+                "num_predict": 3000
             }
-        ) as response:
-            full_content = ""
-            async for line in response.content:
-                if line:
-                    line_str = line.decode('utf-8').strip()
-                    # Ollama streams JSON directly without "data: " prefix
-                    try:
-                        data = json.loads(line_str)
-                        # Ollama API format - each message contains a single token
-                        if 'message' in data and not data.get('done', False):
-                            message = data['message']
-                            if 'content' in message:
-                                token = message['content']
-                                
-                                if token:
-                                    if first_token:
-                                        metrics.ttft = time.perf_counter() - metrics.start_time
-                                        first_token = False
-                                    full_content += token
-                                    metrics.total_tokens += 1
-                                    
-                                    current_time = time.perf_counter()
-                                    elapsed = current_time - metrics.start_time
-                                    if elapsed > 0:
-                                        metrics.tps = metrics.total_tokens / elapsed
-                                    
-                                    yield token, metrics
-                    except json.JSONDecodeError:
-                        continue
-            
-            metrics.end_time = time.perf_counter()
-            self.conversation_history.append({"role": "user", "content": prompt})
-            self.conversation_history.append({"role": "assistant", "content": full_content})
+        }
+        if self.context.keep_alive:
+            payload["keep_alive"] = self.context.keep_alive
+        async for token in stream_chat(session, self.endpoint, self.get_headers(), payload, metrics):
+            parts.append(token)
+            yield token, metrics
+        
+        self.context.add_turn(prompt, "".join(parts))
 
 
 class JudgeAgent:
@@ -163,8 +272,6 @@ class JudgeAgent:
     async def evaluate_debate_stream(self, session: aiohttp.ClientSession, topic: str, 
                                     debate_history: List[DebateTurn]) -> AsyncGenerator[Tuple[str, DebateMetrics], None]:
         metrics = DebateMetrics()
-        metrics.start_time = time.perf_counter()
-        first_token = True
         
         # 日本語を検出（簡易的な方法）
         is_japanese = any(ord(char) > 0x3000 for char in topic)
@@ -218,52 +325,16 @@ Finally, provide your verdict with scores:
 
 Format your response with clear sections and provide detailed reasoning for your scores."""
         
-        async with session.post(
-            url=self.endpoint,
-            headers=self.get_headers(),
-            json={
-                "model": self.model_id,
-                "messages": [{"role": "user", "content": evaluation_prompt}],
-                "stream": True,
-                "options": {
-                    "temperature": 0.3,
-                    "num_predict": 5000
-                }
+        async for token in stream_chat(session, self.endpoint, self.get_headers(), {
+            "model": self.model_id,
+            "messages": [{"role": "user", "content": evaluation_prompt}],
+            "stream": True,
+            "options": {
+                "temperature": 0.3,
+                "num_predict": 5000
             }
-        ) as response:
-            full_content = ""
-            async for line in response.content:
-                if line:
-                    line_str = line.decode('utf-8').strip()
-                    # Ollama streams JSON directly without "data: " prefix
-                    try:
-                        data = json.loads(line_str)
-                        # Ollama API format - each message contains a single token
-                        if 'message' in data and not data.get('done', False):
-                            message = data['message']
-                            if 'content' in message:
-                                token = message['content']
-                                
-                                if token:
-                                    if first_token:
-                                        metrics.ttft = time.perf_counter() - metrics.start_time
-                                        first_token = False
-                                    full_content += token
-                                    metrics.total_tokens += 1
-                                    
-                                    current_time = time.perf_counter()
-                                    elapsed = current_time - metrics.start_time
-                                    if elapsed > 0:
-                                        metrics.tps = metrics.total_tokens / elapsed
-                                    
-                                    yield token, metrics
-                    except json.JSONDecodeError:
-                        continue
-            
-            metrics.end_time = time.perf_counter()
-            
-            # Parse scores from the evaluation
-            self._parse_scores(full_content)
+        }, metrics):
+            yield token, metrics
     
     def _parse_scores(self, evaluation: str) -> Dict[str, any]:
         scores = {}
@@ -297,14 +368,17 @@ Format your response with clear sections and provide detailed reasoning for your
                     scores["winner"] = "agent_b"
                 else:
                     scores["winner"] = "tie"
-        except:
-            scores = {"agent_a_score": 5, "agent_b_score": 5, "winner": "tie"}
+        except (ValueError, IndexError):
+            # An unreadable evaluation is no verdict, not a tie
+            scores = {}
         
         return scores
 
 
 class DebateManager:
-    def __init__(self, topic: str, combatant_a: DebateAgent, combatant_b: DebateAgent, judge: JudgeAgent):
+    def __init__(self, topic: str, combatant_a: DebateAgent, combatant_b: DebateAgent, judge: JudgeAgent,
+                 ratings: Optional[RatingEngine] = None, session: Optional[aiohttp.ClientSession] = None,
+                 limiter: Optional[EndpointLimiter] = None):
         self.topic = topic
         self.combatant_a = combatant_a
         self.combatant_b = combatant_b
@@ -313,15 +387,21 @@ class DebateManager:
         self.current_turn = 0
         self.max_turns = 3  # Each agent speaks 3 times
         self.debate_state = "not_started"
-        self.session: Optional[aiohttp.ClientSession] = None
+        # Without an explicit session the process-wide pooled session is used; neither is closed by the manager
+        self.session = session
+        self.limiter = limiter
+        self.verdict: Dict[str, any] = {}
+        # Pass a shared engine to rate agents across many debates; a standalone debate is rated by its own engine
+        self.ratings = ratings or RatingEngine([combatant_a.name, combatant_b.name])
     
     async def __aenter__(self):
-        self.session = aiohttp.ClientSession()
+        if not self.session:
+            self.session = get_session()
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self.session:
-            await self.session.close()
+        # The session is shared, so there is nothing to close here
+        pass
     
     async def start_debate(self):
         self.debate_state = "in_progress"
@@ -329,10 +409,21 @@ class DebateManager:
     
     async def process_turn_stream(self, agent_role: AgentRole) -> AsyncGenerator[Dict[str, any], None]:
         if not self.session:
-            self.session = aiohttp.ClientSession()
+            self.session = get_session()
         
+        endpoint = self.judge.endpoint if agent_role == AgentRole.JUDGE else \
+            (self.combatant_a if agent_role == AgentRole.COMBATANT_A else self.combatant_b).endpoint
+        async with self.limiter.slot(endpoint) if self.limiter else nullcontext():
+            async for event in self._stream_turn(agent_role):
+                yield event
+    
+    async def _stream_turn(self, agent_role: AgentRole) -> AsyncGenerator[Dict[str, any], None]:
         if agent_role == AgentRole.JUDGE:
+            parts: List[str] = []
+            turn_metrics = DebateMetrics()
             async for token, metrics in self.judge.evaluate_debate_stream(self.session, self.topic, self.debate_history):
+                parts.append(token)
+                turn_metrics = metrics
                 yield {
                     "type": "token_stream",
                     "agent": "judge",
@@ -343,6 +434,11 @@ class DebateManager:
                         "total_tokens": metrics.total_tokens
                     }
                 }
+            
+            # Keep the parsed verdict on the debate (the judge agent may be shared by many debates)
+            self.verdict = self.judge._parse_scores("".join(parts))
+            self.debate_state = "completed"
+            yield {"type": "turn_end", "agent": "judge", "metrics": turn_metrics.to_dict()}
         else:
             agent = self.combatant_a if agent_role == AgentRole.COMBATANT_A else self.combatant_b
             opponent_agent = self.combatant_b if agent_role == AgentRole.COMBATANT_A else self.combatant_a
@@ -355,11 +451,11 @@ class DebateManager:
             opponent_response = opponent_responses[-1].content if opponent_responses else None
             
             prompt = agent.build_prompt(self.topic, opponent_response, is_opening)
-            full_content = ""
+            parts: List[str] = []
             turn_metrics = DebateMetrics()
             
             async for token, metrics in agent.generate_response_stream(self.session, prompt):
-                full_content += token
+                parts.append(token)
                 turn_metrics = metrics
                 yield {
                     "type": "token_stream",
@@ -375,7 +471,7 @@ class DebateManager:
             # Save the turn to history
             self.debate_history.append(DebateTurn(
                 agent=agent_role,
-                content=full_content,
+                content="".join(parts),
                 metrics=turn_metrics,
                 timestamp=datetime.now()
             ))
@@ -385,18 +481,47 @@ class DebateManager:
             # Check if debate is complete
             if self.current_turn >= self.max_turns * 2:
                 self.debate_state = "awaiting_judgment"
+            
+            # Final figures from the server's done frame (real token counts, prompt-eval and decode rates)
+            yield {
+                "type": "turn_end",
+                "agent": "A" if agent_role == AgentRole.COMBATANT_A else "B",
+                "metrics": turn_metrics.to_dict()
+            }
     
-    def calculate_elo_update(self, winner: str, k_factor: int = 32) -> Tuple[float, float]:
-        score_a = 1.0 if winner == "agent_a" else 0.5 if winner == "tie" else 0.0
-        score_b = 1.0 - score_a
+    async def run_debate(self) -> Dict[str, any]:
+        # Runs every turn and the judgement without a client attached, then rates the result
+        await self.start_debate()
+        for _ in range(self.max_turns):
+            for role in (AgentRole.COMBATANT_A, AgentRole.COMBATANT_B):
+                async for _ in self.process_turn_stream(role):
+                    pass
+        async for _ in self.process_turn_stream(AgentRole.JUDGE):
+            pass
         
-        expected_a = 1 / (1 + 10 ** ((self.combatant_b.elo_score - self.combatant_a.elo_score) / 400))
-        expected_b = 1 - expected_a
+        if self.winner() != NO_VERDICT:
+            elo_a, elo_b = self.calculate_elo_update(self.winner())
+            self.combatant_a.elo_score, self.combatant_b.elo_score = elo_a, elo_b
+        return self.get_debate_summary()
+    
+    def winner(self) -> str:
+        if "winner" in self.verdict:
+            return self.verdict["winner"]
+        score_a, score_b = self.verdict.get("agent_a_score"), self.verdict.get("agent_b_score")
+        if score_a is None or score_b is None:
+            return NO_VERDICT
+        if score_a == score_b:
+            return "tie"
+        return "agent_a" if score_a > score_b else "agent_b"
+    
+    def calculate_elo_update(self, winner: str) -> Tuple[float, float]:
+        score_a = 1.0 if winner == "agent_a" else 0.5 if winner == "tie" else 0.0
         
-        new_elo_a = self.combatant_a.elo_score + k_factor * (score_a - expected_a)
-        new_elo_b = self.combatant_b.elo_score + k_factor * (score_b - expected_b)
+        # Ratings are refitted from all debates recorded in the engine
+        self.ratings.record(self.combatant_a.name, self.combatant_b.name, score_a)
+        ratings = self.ratings.fit()
         
-        return new_elo_a, new_elo_b
+        return ratings[self.combatant_a.name], ratings[self.combatant_b.name]
     
     def get_debate_summary(self) -> Dict[str, any]:
         return {
@@ -413,16 +538,13 @@ class DebateManager:
             },
             "turns": len(self.debate_history),
             "state": self.debate_state,
+            "verdict": self.verdict,
             "history": [
                 {
                     "agent": turn.agent.value,
                     "content": turn.content,
                     "timestamp": turn.timestamp.isoformat(),
-                    "metrics": {
-                        "ttft": turn.metrics.ttft,
-                        "tps": turn.metrics.tps,
-                        "total_tokens": turn.metrics.total_tokens
-                    }
+                    "metrics": turn.metrics.to_dict()
                 } for turn in self.debate_history
             ]
         }
\ No newline at end of file
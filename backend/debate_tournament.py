@@ -0,0 +1,132 @@
+import argparse
+import asyncio
+import aiohttp
+import itertools
+import json
+import time
+import yaml
+from typing import Dict, List, Optional, Tuple
+
+from debate_context import DebateContext
+from debate_manager import NO_VERDICT, DebateAgent, DebateManager, EndpointLimiter, JudgeAgent
+from http_transport import shared_session
+from rating import RatingEngine
+
+DEFAULT_ENDPOINT = "http://localhost:11434/api/chat"
+
+class DebateTournament:
+    # Runs many debates at once over one session. Requests are capped per endpoint by the limiter, and more
+    # debates than slots are kept in flight so that an endpoint always has the next turn queued while one
+    # debate is between turns or waiting on another server.
+    def __init__(self, agents: List[DebateAgent], judge: JudgeAgent, topics: List[str],
+                 limiter: Optional[EndpointLimiter] = None, ratings: Optional[RatingEngine] = None,
+                 max_concurrent_debates: Optional[int] = None, max_turns: int = 3, results_path: Optional[str] = None):
+        self.agents = agents
+        self.judge = judge
+        self.topics = topics
+        self.limiter = limiter or EndpointLimiter()
+        self.ratings = ratings or RatingEngine([agent.name for agent in agents])
+        if max_concurrent_debates is None:
+            endpoints = {agent.endpoint for agent in agents} | {judge.endpoint}
+            max_concurrent_debates = 2 * sum(self.limiter.limits.get(url, self.limiter.default_limit) for url in endpoints)
+        self.debate_slots = asyncio.Semaphore(max_concurrent_debates)
+        self.max_turns = max_turns
+        self.results_path = results_path
+        self.results: List[Dict] = []
+        self.failed: List[Tuple[str, str, str, str]] = []
+
+    def schedule(self) -> List[Tuple[str, DebateAgent, DebateAgent]]:
+        # Every pair debates every topic; sides alternate by topic so that neither agent always opens
+        matches = []
+        for index, topic in enumerate(self.topics):
+            for agent_a, agent_b in itertools.combinations(self.agents, 2):
+                matches.append((topic, agent_a, agent_b) if index % 2 == 0 else (topic, agent_b, agent_a))
+        return matches
+
+    async def run_match(self, session: aiohttp.ClientSession, topic: str,
+                        agent_a: DebateAgent, agent_b: DebateAgent) -> Dict:
+        async with self.debate_slots:
+            print(f"Debate started: {agent_a.name} vs {agent_b.name} on {topic[:40]}...")
+            manager = DebateManager(topic, agent_a.fresh_copy(), agent_b.fresh_copy(), self.judge,
+                                    ratings=self.ratings, session=session, limiter=self.limiter)
+            manager.max_turns = self.max_turns
+            summary = await manager.run_debate()
+
+        if manager.winner() == NO_VERDICT:
+            # Not rated by run_debate; reported with the failed debates instead of counting as a tie
+            print(f"Debate failed: {agent_a.name} vs {agent_b.name} -> judge gave no verdict")
+            self.failed.append((topic, agent_a.name, agent_b.name, "judge gave no verdict"))
+            return summary
+
+        ratings = self.ratings.ratings()
+        for agent in self.agents:
+            agent.elo_score = ratings[agent.name]
+        print(f"Debate finished: {agent_a.name} vs {agent_b.name} -> {manager.winner()} "
+              f"({len(self.results) + 1} done)")
+        self.results.append(summary)
+        if self.results_path:
+            with open(self.results_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(summary, ensure_ascii=False) + "\n")
+        return summary
+
+    async def run(self, session: aiohttp.ClientSession) -> Dict[str, float]:
+        matches = self.schedule()
+        print(f"Running {len(matches)} debates ({len(self.agents)} agents, {len(self.topics)} topics)")
+        results = await asyncio.gather(*[
+            self.run_match(session, topic, agent_a, agent_b) for topic, agent_a, agent_b in matches
+        ], return_exceptions=True)
+        # A failed debate is skipped; the others still count
+        for (topic, agent_a, agent_b), result in zip(matches, results):
+            if isinstance(result, Exception):
+                self.failed.append((topic, agent_a.name, agent_b.name, str(result)))
+        return self.ratings.fit()
+
+def create_agent(config: Dict, cls=DebateAgent, **kwargs):
+    endpoint = config.get("endpoint", {})
+    return cls(config["name"], config["model_id"], endpoint.get("url", DEFAULT_ENDPOINT),
+               api_key=endpoint.get("api_key"), **kwargs)
+
+async def main(config_path: str):
+    with open(config_path, "r") as config_file:
+        config = yaml.safe_load(config_file)
+
+    tournament_config = config.get("tournament", {})
+    # Match each limit to the server's parallel slots (OLLAMA_NUM_PARALLEL for Ollama)
+    limiter = EndpointLimiter(
+        {endpoint["url"]: endpoint.get("parallel", 1) for endpoint in config.get("endpoints", [])},
+        default_limit=tournament_config.get("default_parallel", 1)
+    )
+    context_config = config.get("context", {})
+    agents = [create_agent(agent, persona=agent.get("persona"), context=DebateContext(**context_config))
+              for agent in config["agents"]]
+    judge = create_agent(config["judge"], cls=JudgeAgent)
+
+    tournament = DebateTournament(
+        agents, judge, config["topics"], limiter=limiter,
+        max_concurrent_debates=tournament_config.get("max_concurrent_debates"),
+        max_turns=tournament_config.get("max_turns", 3),
+        results_path=tournament_config.get("results_path", "debate_results.jsonl")
+    )
+    async with shared_session() as session:
+        ratings = await tournament.run(session)
+
+    if tournament.failed:
+        print(f"\n{len(tournament.failed)} debates failed and were skipped:")
+        for topic, name_a, name_b, error in tournament.failed:
+            print(f"  {name_a} vs {name_b} on {topic[:40]}: {error}")
+
+    print("\nFinal ELO ratings (95% bootstrap CI):")
+    intervals = tournament.ratings.confidence_intervals()
+    for name, rating in sorted(ratings.items(), key=lambda item: item[1], reverse=True):
+        low, high = intervals[name]
+        print(f"{name}: {rating:.2f} [{low:.2f}, {high:.2f}]")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a round-robin debate tournament")
+    parser.add_argument("--config", default="debate_config.yaml", help="tournament configuration file")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    asyncio.run(main(args.config))
+    end_time = time.perf_counter()
+    print(f"Total execution time: {end_time - start_time:.2f} seconds")
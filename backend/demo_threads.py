@@ -4,9 +4,9 @@
 3つのテーマでサンプルスレッドを生成
 """
 import asyncio
-import json
 from datetime import datetime
 from thread_manager import ThreadManager
+from thread_store import JsonlThreadStore
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -30,14 +30,23 @@ DEMO_TOPICS = [
     }
 ]
 
+# レスは生成されるたびにスレッドごとのJSONLへ追記される
+store = JsonlThreadStore("demo_threads")
+
 async def create_demo_thread(topic_info):
     """デモスレッドを作成"""
     logger.info(f"Creating demo thread: {topic_info['title']}")
     
+    # ストアは追記専用なので、再実行しても前回のスレッドに混ざらないよう実行ごとに別のIDにする
+    thread_id = f"demo_thread_{DEMO_TOPICS.index(topic_info) + 1}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
     thread_manager = ThreadManager(
         title=topic_info['title'],
-        max_posts=topic_info['max_posts']
+        max_posts=topic_info['max_posts'],
+        thread_id=thread_id,
+        store=store,
+        pacing="fast"
     )
+    thread_manager.metadata = {"description": topic_info['description']}
     
     # スレッドを開始（非同期で実行）
     thread_task = asyncio.create_task(thread_manager.start_thread())
@@ -55,11 +64,7 @@ async def create_demo_thread(topic_info):
     
     await thread_task
     
-    # 結果を保存
-    filename = f"demo_thread_{topic_info['title'].replace(' ', '_')}.json"
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(thread_manager.to_dict(), f, ensure_ascii=False, indent=2)
-    
+    filename = store.thread_path(thread_id)
     logger.info(f"Thread saved to {filename}")
     
     # 統計情報
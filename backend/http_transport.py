@@ -0,0 +1,55 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+import aiohttp
+
+# Same variables as the httpx pools in ai_clients.py, plus the aiohttp-only settings
+MAX_CONNECTIONS = int(os.getenv("AI_CLIENT_MAX_CONNECTIONS", "100"))
+MAX_CONNECTIONS_PER_HOST = int(os.getenv("AI_CLIENT_MAX_PER_HOST", "32"))
+KEEPALIVE_EXPIRY = float(os.getenv("AI_CLIENT_KEEPALIVE_EXPIRY", "60"))
+DNS_CACHE_TTL = int(os.getenv("AI_CLIENT_DNS_TTL", "300"))
+CONNECT_TIMEOUT = float(os.getenv("AI_CLIENT_CONNECT_TIMEOUT", "10"))
+# No total timeout: long generations stream for minutes. A stalled stream is caught by the read timeout instead.
+READ_TIMEOUT = float(os.getenv("AI_CLIENT_READ_TIMEOUT", "300"))
+
+_session: Optional[aiohttp.ClientSession] = None
+_session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def create_session() -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=MAX_CONNECTIONS,
+        limit_per_host=MAX_CONNECTIONS_PER_HOST,
+        keepalive_timeout=KEEPALIVE_EXPIRY,
+        ttl_dns_cache=DNS_CACHE_TTL
+    )
+    timeout = aiohttp.ClientTimeout(total=None, connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+def get_session() -> aiohttp.ClientSession:
+    """Returns the process-wide session for the running event loop, creating it on first use."""
+    global _session, _session_loop
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        # A session cannot outlive its loop; a new asyncio.run() gets a fresh one. The old session is still
+        # closed so that its pooled connections are released (closing does not need its loop to be running).
+        if _session is not None and not _session.closed:
+            loop.create_task(_session.close())
+        _session = create_session()
+        _session_loop = loop
+    return _session
+
+async def close_session() -> None:
+    global _session, _session_loop
+    session, _session, _session_loop = _session, None, None
+    if session is not None and not session.closed:
+        await session.close()
+
+@asynccontextmanager
+async def shared_session() -> AsyncIterator[aiohttp.ClientSession]:
+    """Entry point for scripts: yields the shared session and closes it when the run ends."""
+    try:
+        yield get_session()
+    finally:
+        await close_session()
@@ -1,16 +1,28 @@
+import argparse
 import asyncio
 import aiohttp
-from typing import List, Dict, Tuple
+import itertools
+from typing import Iterable, List, Dict, Optional, Tuple
 import re
 import json
+import random
 import time
 import yaml
-from datasets import load_dataset
+
+from arena_jobs import JobScheduler, NonRetryableError, DEFAULT_MAX_CONCURRENCY
+from arena_cache import ArenaCache, content_hash
+from arena_pairing import PairingStrategy, AllPairs, create_pairing_strategy
+from rating import RatingEngine
+from prompt_source import PromptSource
+from arena_export import TrainingDataExporter
+from arena_checkpoint import ArenaCheckpoint
+from http_transport import shared_session
 
 class Endpoint:
-    def __init__(self, url: str, api_key: str = None):
+    def __init__(self, url: str, api_key: str = None, max_concurrency: int = DEFAULT_MAX_CONCURRENCY):
         self.url = url
         self.api_key = api_key
+        self.max_concurrency = max_concurrency
 
     def get_headers(self):
         headers = {}
@@ -19,14 +31,20 @@ class Endpoint:
         return headers
 
 class Model:
-    def __init__(self, name: str, model_id: str, endpoint: Endpoint):
+    def __init__(self, name: str, model_id: str, endpoint: Endpoint, params: Dict = None, cache: ArenaCache = None):
         self.name = name
         self.model_id = model_id
         self.endpoint = endpoint
+        self.params = params or {}  # Sampling parameters sent with every request (temperature, etc.)
+        self.cache = cache
         self.elo = 1000  # Initial ELO score
         self.responses = {}  # Store responses for each prompt
 
     async def generate_response(self, session: aiohttp.ClientSession, prompt: str) -> str:
+        if prompt not in self.responses and self.cache:
+            cached = self.cache.get_response(self.endpoint.url, self.model_id, prompt, self.params)
+            if cached is not None:
+                self.responses[prompt] = cached
         if prompt not in self.responses:
             print(f"Generating response for {self.name} to prompt: {prompt[:30]}...")
             async with session.post(
@@ -37,29 +55,140 @@ class Model:
                     "messages": [
                         {"role": "user", "content": prompt}
                     ],
-                    "stream": False
+                    "stream": False,
+                    **self.params
                 }
             ) as response:
+                response.raise_for_status()
                 result = await response.json()
                 print(result)
                 self.responses[prompt] = result['choices'][0]['message']['content']
+            if self.cache:
+                self.cache.put_response(self.endpoint.url, self.model_id, prompt, self.params, self.responses[prompt])
         return self.responses[prompt]
 
+JUDGE_MODES = ("explanation", "score_first", "json")
+
+def verdict_schema(labels: List[str]) -> Dict:
+    properties = {f"score_{label.lower()}": {"type": "integer", "minimum": 1, "maximum": 10} for label in labels}
+    return {
+        "type": "object",
+        "properties": {**properties, "explanation": {"type": "string"}},
+        "required": [*properties, "explanation"]
+    }
+
+class JudgeParseError(NonRetryableError, ValueError):
+    pass
+
 class JudgeModel:
-    def __init__(self, name: str, model_id: str, endpoint: Endpoint):
+    # mode: "explanation" (explanation then scores, one blocking request), "score_first" (scores first, streamed)
+    # or "json" (structured output, streamed). The streamed modes stop reading as soon as every score is known
+    # unless early_stop is off.
+    def __init__(self, name: str, model_id: str, endpoint: Endpoint, cache: ArenaCache = None,
+                 mode: str = "score_first", early_stop: bool = True, parse_retries: int = 2, max_tokens: int = None):
+        if mode not in JUDGE_MODES:
+            raise ValueError(f"Unknown judge mode: {mode} (expected one of {', '.join(JUDGE_MODES)})")
         self.name = name
         self.model_id = model_id
         self.endpoint = endpoint
+        self.cache = cache
+        self.mode = mode
+        self.early_stop = early_stop
+        self.parse_retries = parse_retries
+        self.max_tokens = max_tokens
+        self.stats = {"requests": 0, "early_stops": 0, "parse_failures": 0}
+        # Everything that changes what the judge is asked or how its answer is read; part of the cache key
+        self.params = {
+            "mode": mode,
+            "early_stop": early_stop,
+            "max_tokens": max_tokens,
+            "template": content_hash(self.build_prompt("", "", ""), self.build_batch_prompt("", ["", ""]))
+        }
 
     async def evaluate(self, session: aiohttp.ClientSession, prompt: str, response1: str, response2: str) -> Tuple[int, int, str]:
-        evaluation_prompt = f"""You are an impartial judge evaluating the quality of responses from two AI models. Your task is to analyze and compare their responses objectively, focusing on various factors such as coherence, factual accuracy, context-awareness, and overall quality.
+        if self.cache:
+            cached = self.cache.get_verdict(self.endpoint.url, self.model_id, prompt, response1, response2, self.params)
+            if cached is not None:
+                return cached
+
+        scores, explanation = await self.judge(session, self.build_prompt(prompt, response1, response2), ["A", "B"])
+        verdict = (scores["A"], scores["B"], explanation)
+        if self.cache:
+            self.cache.put_verdict(self.endpoint.url, self.model_id, prompt, response1, response2, self.params, verdict)
+        return verdict
+
+    async def evaluate_batch(self, session: aiohttp.ClientSession, prompt: str, responses: List[str]) -> Tuple[List[int], str]:
+        # Scores every response to one prompt in a single request. The responses are shown in random order
+        # so that no model benefits from the judge's position bias; scores come back in the input order.
+        if self.cache:
+            cached = self.cache.get_ranking(self.endpoint.url, self.model_id, prompt, responses, self.params)
+            if cached is not None:
+                return cached
+
+        order = random.sample(range(len(responses)), len(responses))
+        labels = [str(position + 1) for position in range(len(responses))]
+        scores, explanation = await self.judge(
+            session, self.build_batch_prompt(prompt, [responses[index] for index in order]), labels
+        )
+        ranking = [0] * len(responses)
+        for label, index in zip(labels, order):
+            ranking[index] = scores[label]
+
+        if self.cache:
+            self.cache.put_ranking(self.endpoint.url, self.model_id, prompt, responses, self.params,
+                                   (ranking, explanation))
+        return ranking, explanation
+
+    async def judge(self, session: aiohttp.ClientSession, evaluation_prompt: str,
+                    labels: List[str]) -> Tuple[Dict[str, int], str]:
+        for attempt in range(self.parse_retries + 1):
+            evaluation, stopped_early = await self.request(session, evaluation_prompt, labels)
+            parsed = self.parse_scores(evaluation, labels, final=True)
+            if parsed:
+                scores, explanation = parsed
+                if stopped_early:
+                    # Whatever explanation arrived before the stop is cut off mid-sentence
+                    explanation = "No detailed explanation provided."
+                return scores, explanation
+            self.stats["parse_failures"] += 1
+            print(f"Warning: Unable to extract scores from evaluation response - trying again "
+                  f"(attempt {attempt + 1}/{self.parse_retries + 1})")
+        # The judge has already been re-asked parse_retries times; the scheduler does not retry this again
+        raise JudgeParseError(f"Unable to extract scores after {self.parse_retries + 1} attempts")
+
+    def output_instructions(self, labels: List[str], subject: str) -> str:
+        if self.mode == "json":
+            keys = ", ".join(f'"score_{label.lower()}": <score for {subject} {label} (1-10)>' for label in labels)
+            return f"""
+Please evaluate these responses and reply with a single JSON object, with the keys in this order:
+{{{keys}, "explanation": "<short explanation of your scoring>"}}
+"""
+        score_lines = "\n".join(f"Score-{label}: [score]" for label in labels)
+        example_lines = "\n".join(f"Score-{label}: {8 - 2 * (k % 2)}" for k, label in enumerate(labels))
+        return f"""
+Please evaluate these responses and give the scores FIRST, then a short explanation.
+
+Example output:
+{example_lines}
+Explanation: {subject} {labels[0]} was more complete, while {subject} {labels[1]} missed some key details.
+
+Format your response as (IT'S VERY IMPORTANT TO FOLLOW THIS FORMAT):
+{score_lines}
+Explanation: [your explanation]
+"""
+
+    def build_prompt(self, prompt: str, response1: str, response2: str) -> str:
+        header = f"""You are an impartial judge evaluating the quality of responses from two AI models. Your task is to analyze and compare their responses objectively, focusing on various factors such as coherence, factual accuracy, context-awareness, and overall quality.
 
 Original Prompt: {prompt}
 
 Model A's Response: {response1}
 
 Model B's Response: {response2}
-
+"""
+        if self.mode != "explanation":
+            return header + self.output_instructions(["A", "B"], "Model")
+        return header + """
 Please evaluate these responses and provide:
 1. A detailed explanation of your scoring, focusing on the strengths and weaknesses of each response
 2. A score for Model A's response (1-10)
@@ -76,216 +205,470 @@ Score-A: [score]
 Score-B: [score]
         """
 
+    def build_batch_prompt(self, prompt: str, responses: List[str]) -> str:
+        shown = "\n\n".join(f"Response {position + 1}: {response}" for position, response in enumerate(responses))
+        header = f"""You are an impartial judge evaluating the quality of responses from {len(responses)} AI models. Your task is to analyze and compare their responses objectively, focusing on various factors such as coherence, factual accuracy, context-awareness, and overall quality. Score each response on its own merits; the order in which they are listed means nothing.
+
+Original Prompt: {prompt}
+
+{shown}
+"""
+        labels = [str(position + 1) for position in range(len(responses))]
+        if self.mode == "explanation":
+            score_lines = "\n".join(f"Score-{label}: [score]" for label in labels)
+            return header + f"""
+Please evaluate these responses and provide a detailed explanation of your scoring, followed by a score (1-10) for every response.
+
+Format your response as (IT'S VERY IMPORTANT TO FOLLOW THIS FORMAT):
+Explanation: [your detailed explanation]
+{score_lines}
+"""
+        return header + self.output_instructions(labels, "Response")
+
+    async def request(self, session: aiohttp.ClientSession, evaluation_prompt: str,
+                      labels: List[str]) -> Tuple[str, bool]:
+        payload = {
+            "model": self.model_id,
+            "messages": [
+                {"role": "user", "content": evaluation_prompt}
+            ],
+            "stream": self.mode != "explanation"
+        }
+        if self.mode == "json":
+            payload["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": "verdict", "schema": verdict_schema(labels)}
+            }
+        if self.max_tokens:
+            payload["max_tokens"] = self.max_tokens
+        self.stats["requests"] += 1
+
         async with session.post(
             url=self.endpoint.url,
             headers=self.endpoint.get_headers(),
-            json={
-                "model": self.model_id,
-                "messages": [
-                    {"role": "user", "content": evaluation_prompt}
-                ],
-                "stream": False
-            }
+            json=payload
         ) as response:
-            result = await response.json()
-            evaluation = result['choices'][0]['message']['content']
-        
-        parts = evaluation.split("Score-A:")
-        if len(parts) != 2:
-            raise ValueError("Unable to parse evaluation response")
-        
-        explanation = parts[0].replace("Explanation:", "").strip()
-        scores_part = "Score-A:" + parts[1]
-        
-        score_pattern = r'Score-([AB]):\s*(\d+)'
-        scores = re.findall(score_pattern, scores_part)
-        
-        if len(scores) != 2:
-            print("Warning: Unable to extract scores from evaluation response - trying again")
-            self.evaluate(session, prompt, response1, response2)
-
-        score_dict = dict(scores)
-        score1 = int(score_dict.get('A', 0))
-        score2 = int(score_dict.get('B', 0))
-
-        if not explanation:
-            explanation = "No detailed explanation provided."
-
-        return score1, score2, explanation
+            response.raise_for_status()
+            if not payload["stream"]:
+                result = await response.json()
+                return result['choices'][0]['message']['content'], False
+
+            evaluation = ""
+            async for line in response.content:
+                line = line.decode("utf-8").strip()
+                # Only data lines carry chunks; event:, id: and ": keep-alive" comment lines are skipped
+                if not line.startswith("data:"):
+                    continue
+                line = line[len("data:"):].strip()
+                if not line or line == "[DONE]":
+                    continue
+                # Usage-only chunks (stream_options.include_usage) have an empty choices list
+                choices = json.loads(line).get("choices")
+                delta = choices[0].get("delta", {}).get("content") if choices else None
+                if not delta:
+                    continue
+                evaluation += delta
+                if self.early_stop and self.parse_scores(evaluation, labels, final=False):
+                    # Every score is in; closing the connection stops the judge from generating the rest
+                    self.stats["early_stops"] += 1
+                    response.close()
+                    return evaluation, True
+            return evaluation, False
+
+    def parse_scores(self, evaluation: str, labels: List[str],
+                     final: bool = True) -> Optional[Tuple[Dict[str, int], str]]:
+        # While streaming (final=False) a score only counts once a non-digit follows it, so "1" is not taken from "10"
+        end = "" if final else r"(?=\D)"
+        if self.mode == "json":
+            if final:
+                try:
+                    verdict = json.loads(evaluation)
+                    return {label: int(verdict[f"score_{label.lower()}"]) for label in labels}, \
+                        str(verdict.get("explanation") or "No detailed explanation provided.")
+                except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+                    pass  # Fall back to the partial-output patterns below
+            scores = dict(re.findall(r'"score_(\w+)"\s*:\s*(\d+)' + end, evaluation))
+            explanation = re.search(r'"explanation"\s*:\s*"((?:[^"\\]|\\.)*)', evaluation)
+            explanation = explanation.group(1) if explanation else ""
+        else:
+            scores = dict(re.findall(r'Score-(\w+):\s*(\d+)' + end, evaluation))
+            explanation = re.sub(r'Score-\w+:\s*\d+', "", evaluation).replace("Explanation:", "").strip()
+
+        scores = {key.upper(): int(value) for key, value in scores.items()}
+        if any(label not in scores for label in labels):
+            return None
+        return {label: scores[label] for label in labels}, explanation or "No detailed explanation provided."
 
 class ArenaLearning:
-    def __init__(self, models: List[Model], judge_model: JudgeModel):
+    def __init__(self, models: List[Model], judge_model: JudgeModel, scheduler: JobScheduler = None,
+                 pairing: PairingStrategy = None, exporter: TrainingDataExporter = None,
+                 checkpoint: ArenaCheckpoint = None, checkpoint_every: int = 1, listwise: bool = False):
         self.models = models
         self.judge_model = judge_model
-        self.battle_results = []
+        self.scheduler = scheduler or JobScheduler()
+        self.pairing = pairing or AllPairs()
+        self.listwise = listwise  # One judge request scores every planned model for a prompt
+        self.battle_plan: Dict[str, List[Tuple[Model, Model]]] = {}
+        # Results are indexed by prompt and dropped once the prompt's training record is written
+        self.results_by_prompt: Dict[str, List[Tuple]] = {}
+        self.exporter = exporter
+        self.training_data = []  # Only filled when no exporter is given
+        self.failed_jobs = []
+        self.ratings = RatingEngine([model.name for model in models])
         self.elo_history = {model.name: [model.elo] for model in models}
-
-    async def generate_batch_responses(self, session: aiohttp.ClientSession, prompt_batch: List[str]) -> None:
-        tasks = []
+        self.checkpoint = checkpoint
+        self.checkpoint_every = checkpoint_every  # Batches between checkpoints
+        self.batches_done = 0
+        self.prompts_done = 0
+
+    def state(self, resume_point: Dict) -> Dict:
+        return {
+            **resume_point,
+            "batches_done": self.batches_done,
+            "prompts_done": self.prompts_done,
+            "ratings": self.ratings.state(),
+            "elo_history": self.elo_history,
+            "failed_jobs": self.failed_jobs,
+            "export_size": self.exporter.size if self.exporter else None
+        }
+
+    def restore(self, state: Dict) -> None:
+        # Prompt-source offsets and the export file are restored by the caller before the run starts
+        self.batches_done = state["batches_done"]
+        self.prompts_done = state["prompts_done"]
+        self.pairing.restore(state["pairing"])
+        self.ratings.restore(state["ratings"])
+        self.failed_jobs = [tuple(job) for job in state["failed_jobs"]]
+        for name, history in state["elo_history"].items():
+            self.elo_history[name] = history
+        ratings = self.ratings.ratings()
         for model in self.models:
-            for prompt in prompt_batch:
-                tasks.append(model.generate_response(session, prompt))
-        await asyncio.gather(*tasks)
-
-    async def run_battles_for_batch(self, session: aiohttp.ClientSession, prompt_batch: List[str]) -> None:
-        tasks = []
+            model.elo = ratings.get(model.name, model.elo)
+
+    def resume_point(self, prompts: Iterable[str]) -> Dict:
+        # Taken before the next batch is read and planned, so a resumed run starts right after the last finished batch
+        return {
+            "prompts": prompts.state() if isinstance(prompts, PromptSource) else None,
+            "pairing": self.pairing.state()
+        }
+
+    def save_checkpoint(self, resume_point: Dict) -> None:
+        if self.checkpoint:
+            self.checkpoint.save(self.state(resume_point))
+
+    def start_generation(self, session: aiohttp.ClientSession, prompt_batch: List[str]) -> Dict[Tuple[str, str], asyncio.Task]:
+        # Pairs are chosen up front so that only models that will actually be judged generate a response.
+        # One task per (model, prompt); battles await the two tasks they need
+        generation = {}
         for prompt in prompt_batch:
-            for i in range(len(self.models)):
-                for j in range(i + 1, len(self.models)):
-                    print(f"Running battle for prompt: {prompt[:50]}..., {self.models[i].name} vs {self.models[j].name}")
-                    model1, model2 = self.models[i], self.models[j]
-                    tasks.append(self.battle(session, prompt, model1, model2))
-        await asyncio.gather(*tasks)
-
-    async def battle(self, session: aiohttp.ClientSession, prompt: str, model1: Model, model2: Model) -> None:
-        response1 = model1.responses[prompt]
-        response2 = model2.responses[prompt]
-        score1, score2, explanation = await self.judge_model.evaluate(session, prompt, response1, response2)
-        self.battle_results.append((model1, model2, score1, score2, response1, response2, explanation, prompt))
-
-    def update_elo_ratings(self) -> None:
-        K = 32  # K-factor for ELO calculation
-
-        for model1, model2, score1, score2, _, _, _, _ in self.battle_results:
-            expected_score1 = 1 / (1 + 10 ** ((model2.elo - model1.elo) / 400))
-            expected_score2 = 1 - expected_score1
+            self.battle_plan[prompt] = self.pairing.select_pairs(self.models, prompt, listwise=self.listwise)
+            for model in {model for pair in self.battle_plan[prompt] for model in pair}:
+                generation[(model.name, prompt)] = asyncio.create_task(self.scheduler.submit(
+                    model.endpoint,
+                    lambda model=model, prompt=prompt: model.generate_response(session, prompt),
+                    f"generation by {model.name}"
+                ))
+        return generation
 
-            actual_score1 = score1 / (score1 + score2)
-            actual_score2 = 1 - actual_score1
+    async def generate_batch_responses(self, session: aiohttp.ClientSession, prompt_batch: List[str]) -> None:
+        generation = self.start_generation(session, prompt_batch)
+        await self.collect_failures("generation", generation)
+
+    async def collect_failures(self, kind: str, tasks: Dict) -> None:
+        results = await asyncio.gather(*tasks.values(), return_exceptions=True)
+        for key, result in zip(tasks.keys(), results):
+            if isinstance(result, Exception):
+                self.failed_jobs.append((kind, key, str(result)))
+
+    async def run_battles_for_batch(self, session: aiohttp.ClientSession, prompt_batch: List[str],
+                                    generation: Dict[Tuple[str, str], asyncio.Task] = None) -> None:
+        if generation is None:
+            generation = self.start_generation(session, prompt_batch)
+        await asyncio.gather(*[
+            self.run_battles_for_prompt(session, prompt, generation) for prompt in prompt_batch
+        ])
+
+    async def run_battles_for_prompt(self, session: aiohttp.ClientSession, prompt: str,
+                                     generation: Dict[Tuple[str, str], asyncio.Task]) -> None:
+        tasks = {}
+        pairs = self.battle_plan.pop(prompt, [])
+        if self.listwise and pairs:
+            print(f"Running listwise judgement for prompt: {prompt[:50]}... ({len(pairs)} pairs)")
+            tasks[("listwise", prompt)] = asyncio.create_task(self.listwise_battle(session, prompt, pairs, generation))
+            pairs = []
+        for model1, model2 in pairs:
+            print(f"Running battle for prompt: {prompt[:50]}..., {model1.name} vs {model2.name}")
+            tasks[(model1.name, model2.name, prompt)] = asyncio.create_task(self.battle(
+                session, prompt, model1, model2,
+                generation[(model1.name, prompt)], generation[(model2.name, prompt)]
+            ))
+        # A failed generation or judgement only loses the battles that depend on it
+        await self.collect_failures("generation", {
+            key: task for key, task in generation.items() if key[1] == prompt
+        })
+        await self.collect_failures("battle", tasks)
+        # Every battle for this prompt has finished, so its record can be written right away
+        self.finish_prompt(prompt)
+
+    async def battle(self, session: aiohttp.ClientSession, prompt: str, model1: Model, model2: Model,
+                     response1_task: asyncio.Task = None, response2_task: asyncio.Task = None) -> None:
+        if response1_task is not None and response2_task is not None:
+            # Judge as soon as both responses exist, without waiting for the rest of the batch
+            response1, response2 = await asyncio.gather(response1_task, response2_task)
+        else:
+            response1 = model1.responses[prompt]
+            response2 = model2.responses[prompt]
+        score1, score2, explanation = await self.scheduler.submit(
+            self.judge_model.endpoint,
+            lambda: self.judge_model.evaluate(session, prompt, response1, response2),
+            f"judgement of {model1.name} vs {model2.name}"
+        )
+        self.record_battle(prompt, model1, model2, score1, score2, response1, response2, explanation)
+
+    async def listwise_battle(self, session: aiohttp.ClientSession, prompt: str, pairs: List[Tuple[Model, Model]],
+                              generation: Dict[Tuple[str, str], asyncio.Task]) -> None:
+        models = list(dict.fromkeys(model for pair in pairs for model in pair))
+        results = await asyncio.gather(*[generation[(model.name, prompt)] for model in models], return_exceptions=True)
+        # Models whose generation failed drop out; the others are still judged together
+        responses = {model.name: result for model, result in zip(models, results) if not isinstance(result, Exception)}
+        models = [model for model in models if model.name in responses]
+        if len(models) < 2:
+            return
+        scores, explanation = await self.scheduler.submit(
+            self.judge_model.endpoint,
+            lambda: self.judge_model.evaluate_batch(session, prompt, [responses[model.name] for model in models]),
+            f"listwise judgement of {len(models)} responses"
+        )
+        scores = {model.name: score for model, score in zip(models, scores)}
+        # The planned pairs are derived from the one ranking, so ratings and training data see the same battles
+        for model1, model2 in pairs:
+            if model1.name in scores and model2.name in scores:
+                self.record_battle(prompt, model1, model2, scores[model1.name], scores[model2.name],
+                                   responses[model1.name], responses[model2.name], explanation)
+
+    def record_battle(self, prompt: str, model1: Model, model2: Model, score1: int, score2: int,
+                      response1: str, response2: str, explanation: str) -> None:
+        self.results_by_prompt.setdefault(prompt, []).append(
+            (model1, model2, score1, score2, response1, response2, explanation, prompt)
+        )
+        # Share of the judge's points; a 0-0 verdict counts as a tie
+        self.ratings.record(model1.name, model2.name, score1 / (score1 + score2) if score1 + score2 else 0.5)
 
-            model1.elo += K * (actual_score1 - expected_score1)
-            model2.elo += K * (actual_score2 - expected_score2)
+    def update_elo_ratings(self) -> None:
+        # Refit Bradley–Terry over every battle so far (each battle counted once)
+        ratings = self.ratings.fit()
+        for model in self.models:
+            model.elo = ratings[model.name]
 
         # Update ELO history
         for model in self.models:
             self.elo_history[model.name].append(model.elo)
 
-    def generate_training_data(self, prompts: List[str]) -> List[Dict]:
-        training_data = []
-        prompts = set(result[-1] for result in self.battle_results)  # Get unique prompts
-
-        for prompt in prompts:
-            prompt_results = [result for result in self.battle_results if result[-1] == prompt]
-            model_scores = {model.name: {'scores': [], 'response': ''} for model in self.models}
-
-            for model1, model2, score1, score2, response1, response2, _, _ in prompt_results:
-                model_scores[model1.name]['scores'].append(score1)
-                model_scores[model1.name]['response'] = response1
-                model_scores[model2.name]['scores'].append(score2)
-                model_scores[model2.name]['response'] = response2
-
-            # Calculate average scores and prepare ranked list
-            ranked_models = []
-            for model_name, data in model_scores.items():
-                if data['scores']:
-                    avg_score = sum(data['scores']) / len(data['scores'])
-                    ranked_models.append({
-                        'model_name': model_name,
-                        'avg_score': avg_score,
-                        'response': data['response']
-                    })
-
-            # Sort models by average score in descending order
-            ranked_models.sort(key=lambda x: x['avg_score'], reverse=True)
-
-            # Add to training data
-            training_data.append({
-                'prompt': prompt,
-                'ranked_models': ranked_models
-            })
-        return training_data
-
-    async def run_arena(self, session: aiohttp.ClientSession, prompts: List[str], batch_size: int = 3) -> List[Dict]:
+    def finish_prompt(self, prompt: str) -> None:
+        results = self.results_by_prompt.pop(prompt, [])
+        for model in self.models:
+            model.responses.pop(prompt, None)
+        if not results:
+            return
+        record = self.build_training_record(prompt, results)
+        if self.exporter:
+            self.exporter.write(record)
+        else:
+            self.training_data.append(record)
+
+    def build_training_record(self, prompt: str, prompt_results: List[Tuple]) -> Dict:
+        model_scores = {model.name: {'scores': [], 'response': ''} for model in self.models}
+
+        for model1, model2, score1, score2, response1, response2, _, _ in prompt_results:
+            model_scores[model1.name]['scores'].append(score1)
+            model_scores[model1.name]['response'] = response1
+            model_scores[model2.name]['scores'].append(score2)
+            model_scores[model2.name]['response'] = response2
+
+        # Calculate average scores and prepare ranked list
+        ranked_models = []
+        for model_name, data in model_scores.items():
+            if data['scores']:
+                avg_score = sum(data['scores']) / len(data['scores'])
+                ranked_models.append({
+                    'model_name': model_name,
+                    'avg_score': avg_score,
+                    'response': data['response']
+                })
+
+        # Sort models by average score in descending order
+        ranked_models.sort(key=lambda x: x['avg_score'], reverse=True)
+
+        return {
+            'prompt': prompt,
+            'ranked_models': ranked_models
+        }
+
+    async def run_arena(self, session: aiohttp.ClientSession, prompts: Iterable[str], batch_size: int = 3) -> List[Dict]:
         print("Running arena with batched processing...")
-        for i in range(0, len(prompts), batch_size):
-            prompt_batch = prompts[i:i+batch_size]
-            print(f"\nProcessing batch {i//batch_size + 1} (prompts {i+1}-{min(i+batch_size, len(prompts))})")
-            
-            print("Generating responses for current batch...")
-            await self.generate_batch_responses(session, prompt_batch)
+        # Prompts may come from a lazy stream; batches are pulled one ahead in a worker thread
+        # so that reading the dataset never blocks the requests in flight
+        prompt_iterator = iter(prompts)
+        if self.exporter:
+            # Prompts already in the export file were finished by an earlier run
+            prompt_iterator = (prompt for prompt in prompt_iterator if not self.exporter.is_exported(prompt))
+        next_batch = lambda: list(itertools.islice(prompt_iterator, batch_size))
+
+        prompt_batch = await asyncio.to_thread(next_batch)
+        next_generation = self.start_generation(session, prompt_batch) if prompt_batch else None
+
+        while prompt_batch:
+            print(f"\nProcessing batch {self.batches_done + 1} "
+                  f"(prompts {self.prompts_done+1}-{self.prompts_done+len(prompt_batch)})")
+
+            generation = next_generation
+            resume_point = self.resume_point(prompts)
+            # Prefetch the next batch's responses while this batch is being judged
+            upcoming = await asyncio.to_thread(next_batch)
+            if upcoming:
+                next_generation = self.start_generation(session, upcoming)
 
             print("Running battles for current batch...")
-            await self.run_battles_for_batch(session, prompt_batch)
-            
+            await self.run_battles_for_batch(session, prompt_batch, generation)
+            self.prompts_done += len(prompt_batch)
+            self.batches_done += 1
+
             self.update_elo_ratings()
             print("\nIntermediate ELO rankings after current batch:")
             for model in self.models:
                 print(f"{model.name}: {model.elo:.2f}")
 
-        return self.generate_training_data(prompts)
+            if not upcoming or self.batches_done % self.checkpoint_every == 0:
+                self.save_checkpoint(resume_point)
+
+            prompt_batch = upcoming
 
-async def main():
+        if self.failed_jobs:
+            print(f"\n{len(self.failed_jobs)} jobs failed and were skipped:")
+            for kind, key, error in self.failed_jobs:
+                print(f"  {kind} {key}: {error}")
+        print(f"Job stats: {self.scheduler.stats}")
+        print(f"Judge calls: {self.pairing.judge_calls}")
+        print(f"Judge stats: {self.judge_model.stats}")
+
+        return self.training_data
+
+async def main(resume: bool = False):
     # Load configuration from YAML file
     with open("arena_config.yaml", "r") as config_file:
         config = yaml.safe_load(config_file)
 
     default_endpoint = Endpoint(
         url=config["default_endpoint"]["url"],
-        api_key=config["default_endpoint"].get("api_key")
+        api_key=config["default_endpoint"].get("api_key"),
+        max_concurrency=config["default_endpoint"].get("max_concurrency", DEFAULT_MAX_CONCURRENCY)
     )
 
+    cache_config = config.get("cache", {})
+    cache = None
+    if cache_config.get("enabled", True):
+        cache = ArenaCache(
+            path=cache_config.get("path", "arena_cache.db"),
+            max_bytes=int(cache_config.get("max_size_mb", 512) * 1024 * 1024)
+        )
+
     # Create models from configuration
     models = []
     for model_config in config["models"]:
         if "endpoint" in model_config:
             endpoint = Endpoint(
                 url=model_config["endpoint"]["url"],
-                api_key=model_config["endpoint"].get("api_key")
+                api_key=model_config["endpoint"].get("api_key"),
+                max_concurrency=model_config["endpoint"].get("max_concurrency", DEFAULT_MAX_CONCURRENCY)
             )
         else:
             endpoint = default_endpoint
-        models.append(Model(model_config["name"], model_config["model_id"], endpoint))
+        models.append(Model(model_config["name"], model_config["model_id"], endpoint,
+                            params=model_config.get("params"), cache=cache))
 
     # Create judge model from configuration
     judge_config = config["judge_model"]
     if "endpoint" in judge_config:
         judge_endpoint = Endpoint(
             url=judge_config["endpoint"]["url"],
-            api_key=judge_config["endpoint"].get("api_key")
+            api_key=judge_config["endpoint"].get("api_key"),
+            max_concurrency=judge_config["endpoint"].get("max_concurrency", DEFAULT_MAX_CONCURRENCY)
         )
     else:
         judge_endpoint = default_endpoint
-    judge_model = JudgeModel(judge_config["name"], judge_config["model_id"], judge_endpoint)
-
-    # Load dataset from Hugging Face
-    prompts = []
-    for dataset_config in config["datasets"]:
-        ds = load_dataset(dataset_config["name"])
-        split = ds[dataset_config["split"]]
-        prompts.extend(split[dataset_config["field"]][:dataset_config["limit"]])
-
-    print(f"Total number of prompts: {len(prompts)}")
+    judge_model = JudgeModel(judge_config["name"], judge_config["model_id"], judge_endpoint, cache=cache,
+                             mode=judge_config.get("mode", "score_first"),
+                             early_stop=judge_config.get("early_stop", True),
+                             parse_retries=judge_config.get("parse_retries", 2),
+                             max_tokens=judge_config.get("max_tokens"))
+
+    # Prompts are streamed from the datasets as the arena consumes them
+    prompts = PromptSource.from_config(config["datasets"])
+
+    arena_config = config.get("arena", {})
+    scheduler = JobScheduler(
+        max_retries=arena_config.get("max_retries", 3),
+        retry_backoff=arena_config.get("retry_backoff", 1.0)
+    )
+    pairing_config = arena_config.get("pairing", {})
+    pairing = create_pairing_strategy(
+        pairing_config.get("strategy", "all"),
+        pairs_per_prompt=pairing_config.get("pairs_per_prompt"),
+        budget=pairing_config.get("budget")
+    )
+    checkpoint_config = config.get("checkpoint", {})
+    checkpoint = ArenaCheckpoint(checkpoint_config.get("path", "arena_checkpoint.json"))
+    state = checkpoint.load() if resume else None
+    if state:
+        print(f"Resuming after {state['prompts_done']} prompts ({state['batches_done']} batches)")
+        if state["prompts"]:
+            prompts.restore(state["prompts"])
+
+    export_config = config.get("training_data", {})
+    exporter = TrainingDataExporter(
+        path=export_config.get("path", "training_data.jsonl"),
+        resume=resume,
+        size=state["export_size"] if state else None
+    )
+    arena = ArenaLearning(models, judge_model, scheduler, pairing, exporter,
+                          checkpoint=checkpoint, checkpoint_every=checkpoint_config.get("every", 1),
+                          listwise=arena_config.get("listwise_judge", False))
+    if state:
+        arena.restore(state)
 
-    arena = ArenaLearning(models, judge_model)
+    batch_size = arena_config.get("batch_size", 3)
+    async with shared_session() as session:
+        try:
+            await arena.run_arena(session, prompts, batch_size)
+        finally:
+            exporter.close()
 
-    batch_size = 3  # Set the batch size to 3
-    async with aiohttp.ClientSession() as session:
-        training_data = await arena.run_arena(session, prompts, batch_size)
+    print(f"Prompts read: {prompts.state()} ({prompts.duplicates} duplicates skipped)")
 
     print("\nELO rating progression:")
     for model in models:
         print(f"{model.name}: {arena.elo_history[model.name]}")
 
-    # save training data to a file
-    with open("training_data.json", "w") as f:
-        json.dump(training_data, f, indent=4)
+    print(f"\nTraining data: {exporter.count} records in {exporter.path}")
 
-    print("\nTraining data:")
-    for item in training_data:
-        print(f"Prompt: {item['prompt']}")
-        for rank, model_data in enumerate(item['ranked_models']):
-            print(f"  Rank {rank+1}: {model_data['model_name']}")
-            print(f"    Average Score: {model_data['avg_score']:.2f}")
-            print(f"    Response: {model_data['response'][:50]}...")  # Truncate response for brevity
-        print()
-
-    print("\nFinal ELO ratings:")
+    print("\nFinal ELO ratings (95% bootstrap CI):")
+    intervals = arena.ratings.confidence_intervals()
     for model in models:
-        print(f"{model.name}: {model.elo:.2f}")
+        low, high = intervals[model.name]
+        print(f"{model.name}: {model.elo:.2f} [{low:.2f}, {high:.2f}]")
+
+    if cache:
+        print(f"\nCache stats: {cache.stats} ({cache.total_bytes / 1024 / 1024:.1f} MB)")
+        cache.close()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the LLM arena")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue from the last checkpoint, skipping prompts that are already done")
+    args = parser.parse_args()
+
     start_time = time.perf_counter()
-    asyncio.run(main())
+    asyncio.run(main(resume=args.resume))
     end_time = time.perf_counter()
     execution_time = end_time - start_time
     print(f"Total execution time: {execution_time:.2f} seconds")
\ No newline at end of file
@@ -1,23 +1,32 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Query, Header, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from contextlib import asynccontextmanager
 from typing import Dict, List, Optional, Literal
 import json
 import asyncio
+import hashlib
 import signal
 from datetime import datetime
 import uuid
 import logging
 
 from thread_manager import ThreadManager
+from thread_scheduler import QueueFullError, ThreadScheduler
+from thread_store import create_thread_store, is_valid_thread_id
+from ws_outbox import WebSocketOutbox
+from thread_broadcast import ThreadBroadcaster
+from ai_clients import AIClientFactory
 from characters import CHARACTERS
 
 logger = logging.getLogger(__name__)
 
 # グローバル変数
-active_threads: Dict[str, ThreadManager] = {}
+scheduler = ThreadScheduler()
+thread_store = create_thread_store()
 active_connections: List[WebSocket] = []
+# 視聴者のいるスレッドの配信ハブ
+broadcasters: Dict[str, ThreadBroadcaster] = {}
 shutdown_event = asyncio.Event()
 
 @asynccontextmanager
@@ -25,14 +34,16 @@ async def lifespan(app: FastAPI):
     """アプリケーションのライフサイクル管理"""
     # 起動時
     logger.info("AI Resuba BBS API starting...")
+    # 放置されたスレッドの定期的な破棄
+    scheduler.start()
     yield
     # シャットダウン時
     logger.info("AI Resuba BBS API shutting down...")
     
-    # アクティブなスレッドを停止
-    for thread_id, thread_manager in active_threads.items():
-        logger.info(f"Stopping thread {thread_id}")
-        thread_manager.stop_thread()
+    # アクティブなスレッドを停止（未保存のレスはここで書き込まれる）
+    await scheduler.shutdown()
+    if thread_store:
+        thread_store.close()
     
     # WebSocket接続をクローズ
     for websocket in active_connections[:]:  # リストのコピーを使用
@@ -41,6 +52,9 @@ async def lifespan(app: FastAPI):
         except Exception as e:
             logger.warning(f"Error closing websocket: {e}")
     
+    # 共有AIクライアントの接続プールをクローズ
+    await AIClientFactory.close_all()
+    
     logger.info("Shutdown complete")
 
 app = FastAPI(
@@ -61,6 +75,8 @@ app.add_middleware(
 class ThreadCreateRequest(BaseModel):
     title: Optional[str] = ""
     max_posts: Literal[100, 500, 1000] = 100
+    # 未指定の場合は環境変数THREAD_PACING（デフォルトはrealtime）
+    pacing: Optional[Literal["realtime", "fast", "replay"]] = None
 
 
 class CharacterInfo(BaseModel):
@@ -88,7 +104,8 @@ async def root():
 async def health_check():
     return {
         "status": "healthy",
-        "message": "AI Resuba BBS is running"
+        "message": "AI Resuba BBS is running",
+        "threads": scheduler.stats()
     }
 
 
@@ -112,35 +129,140 @@ async def create_thread(request: ThreadCreateRequest):
     thread_id = str(uuid.uuid4())
     thread_manager = ThreadManager(
         title=request.title,
-        max_posts=request.max_posts
+        max_posts=request.max_posts,
+        thread_id=thread_id,
+        store=thread_store,
+        pacing=request.pacing
     )
     
-    active_threads[thread_id] = thread_manager
+    scheduler.register(thread_id, thread_manager)
+    await thread_manager.save()
     
     return {
         "thread_id": thread_id,
         "title": request.title if request.title else "AIが生成予定",
         "max_posts": request.max_posts,
+        "pacing": thread_manager.pacing.name,
         "status": "created"
     }
 
 
+async def thread_summary(thread_id: str) -> Optional[Dict]:
+    """スレッド情報（レス本文なし）。メモリ上にない（終了して破棄された・再起動前の）スレッドはストアから読む"""
+    thread = scheduler.get(thread_id)
+    if thread is not None:
+        return thread.summary()
+    if thread_store is None or not is_valid_thread_id(thread_id):
+        return None
+    
+    stored = await asyncio.to_thread(thread_store.load_thread, thread_id)
+    if stored is None:
+        return None
+    post_count = await asyncio.to_thread(thread_store.count_posts, thread_id)
+    return {
+        "title": stored["title"],
+        "max_posts": stored["max_posts"],
+        "current_posts": post_count,
+        "is_running": False,
+        "status": ThreadManager.restored_status(stored["status"], post_count, stored["max_posts"])
+    }
+
+
+async def thread_posts(thread_id: str, after: int, limit: Optional[int]) -> List[str]:
+    """レス番号がafterより大きいレスをJSONにした状態で返す"""
+    thread = scheduler.get(thread_id)
+    if thread is not None:
+        return thread.posts_page(after, limit)
+    posts = await asyncio.to_thread(thread_store.load_posts, thread_id, after, limit)
+    return [json.dumps(post, ensure_ascii=False) for post in posts]
+
+
+def make_etag(*parts) -> str:
+    """レスは追記のみなので、スレッド情報とページ指定が同じなら同じ内容になる"""
+    digest = hashlib.sha1(json.dumps(parts, ensure_ascii=False, sort_keys=True).encode()).hexdigest()
+    return f'W/"{digest[:20]}"'
+
+
 @app.get("/api/thread/{thread_id}")
-async def get_thread(thread_id: str):
-    """スレッドの情報を取得"""
-    if thread_id not in active_threads:
+async def get_thread(
+    thread_id: str,
+    since: Optional[int] = Query(None, ge=0, description="このレス番号より後のレスだけを返す"),
+    offset: int = Query(0, ge=0, description="先頭（sinceがあればその後）から読み飛ばすレス数"),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="返すレスの最大数"),
+    if_none_match: Optional[str] = Header(None)
+):
+    """スレッドの情報を取得（since / offset / limitで差分・ページ単位の取得ができる）"""
+    summary = await thread_summary(thread_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Thread not found")
+    
+    after = (since or 0) + offset
+    etag = make_etag(thread_id, summary, after, limit)
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    posts = await thread_posts(thread_id, after, limit)
+    # キャッシュ済みのレスのJSONはそのまま連結し、スレッド情報だけをここで変換する
+    body = json.dumps(summary, ensure_ascii=False)[:-1] + ', "posts": [' + ", ".join(posts) + "]}"
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+
+@app.get("/api/thread/{thread_id}/summary")
+async def get_thread_summary(thread_id: str, if_none_match: Optional[str] = Header(None)):
+    """レス本文を含まないスレッド情報（進捗のポーリング用）"""
+    summary = await thread_summary(thread_id)
+    if summary is None:
         raise HTTPException(status_code=404, detail="Thread not found")
     
-    thread = active_threads[thread_id]
-    return thread.to_dict()
+    etag = make_etag(thread_id, summary)
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=json.dumps(summary, ensure_ascii=False), media_type="application/json",
+                    headers={"ETag": etag})
+
+
+async def load_thread(thread_id: str) -> Optional[ThreadManager]:
+    """スレッドを取得し、メモリ上になければストアから復元して登録する"""
+    thread_manager = scheduler.get(thread_id)
+    if thread_manager is None and thread_store and is_valid_thread_id(thread_id):
+        thread_manager = await ThreadManager.from_store(thread_id, thread_store)
+        if thread_manager is not None:
+            # 読み込み中に他の接続が同じスレッドを復元していればそちらを使う
+            existing = scheduler.get(thread_id)
+            if existing is not None:
+                return existing
+            scheduler.register(thread_id, thread_manager)
+    return thread_manager
+
+
+def get_broadcaster(thread_id: str, thread_manager: ThreadManager) -> ThreadBroadcaster:
+    """スレッドの配信ハブを取得（視聴者がいなければ作成）"""
+    broadcaster = broadcasters.get(thread_id)
+    if broadcaster is None or broadcaster.thread_manager is not thread_manager:
+        broadcaster = ThreadBroadcaster(thread_id, thread_manager)
+        broadcasters[thread_id] = broadcaster
+    return broadcaster
+
+
+async def leave_broadcast(broadcaster: ThreadBroadcaster, outbox: WebSocketOutbox):
+    """視聴をやめる（最後の視聴者が抜けたらスレッドを停止してハブを破棄）"""
+    if broadcaster.leave(outbox) > 0:
+        return
+    if broadcasters.get(broadcaster.thread_id) is broadcaster:
+        del broadcasters[broadcaster.thread_id]
+        scheduler.stop(broadcaster.thread_id)
+    broadcaster.close()
 
 
 @app.websocket("/ws/arena")
 async def websocket_arena(websocket: WebSocket):
     await websocket.accept()
     active_connections.append(websocket)
+    # 送信は接続ごとのキューから専用タスクが行う（受信の遅いクライアントがスレッドの進行を待たせないように）
+    outbox = WebSocketOutbox(websocket)
     thread_manager = None
-    thread_task = None
+    thread_id = None
+    broadcaster = None
     
     try:
         while True:
@@ -148,140 +270,86 @@ async def websocket_arena(websocket: WebSocket):
             message = json.loads(data)
             
             if message["action"] == "start_thread":
+                if broadcaster:
+                    # 別のスレッドに切り替える
+                    await leave_broadcast(broadcaster, outbox)
+                    broadcaster = None
+                
                 thread_id = message.get("thread_id")
+                thread_manager = await load_thread(thread_id) if thread_id else None
                 
-                if thread_id and thread_id in active_threads:
-                    thread_manager = active_threads[thread_id]
-                else:
+                if thread_manager is None:
+                    thread_id = str(uuid.uuid4())
                     thread_manager = ThreadManager(
                         title=message.get("title", ""),
-                        max_posts=message.get("max_posts", 100)
+                        max_posts=message.get("max_posts", 100),
+                        thread_id=thread_id,
+                        store=thread_store,
+                        pacing=message.get("pacing")
                     )
-                    thread_id = str(uuid.uuid4())
-                    active_threads[thread_id] = thread_manager
+                    scheduler.register(thread_id, thread_manager)
                 
-                await websocket.send_json({
+                outbox.send({
                     "type": "thread_started",
                     "thread_id": thread_id,
                     "title": thread_manager.title if thread_manager.title else "生成中...",
                     "max_posts": thread_manager.max_posts
-                })
-                
-                async def run_thread():
-                    try:
-                        sent_posts = set()
-                        thread_task = asyncio.create_task(thread_manager.start_thread())
-                        title_sent = thread_manager.title != ""
-                        
-                        while thread_manager.is_running or not thread_task.done():
-                            await asyncio.sleep(0.5)
-                            
-                            if not title_sent and thread_manager.title:
-                                await websocket.send_json({
-                                    "type": "thread_title_updated",
-                                    "title": thread_manager.title
-                                })
-                                title_sent = True
-                            
-                            for post in thread_manager.posts:
-                                if post.number not in sent_posts:
-                                    sent_posts.add(post.number)
-                                    
-                                    await websocket.send_json({
-                                        "type": "post_start",
-                                        "post": {
-                                            "number": post.number,
-                                            "character_id": post.character_id,
-                                            "character_name": post.character_name,
-                                            "timestamp": post.timestamp.isoformat(),
-                                            "character_color": CHARACTERS[post.character_id].color
-                                        }
-                                    })
-                                    
-                                    content = post.content
-                                    
-                                    if content:
-                                        chunk_size = 10
-                                        for i in range(0, len(content), chunk_size):
-                                            chunk = content[i:i+chunk_size]
-                                            await websocket.send_json({
-                                                "type": "post_stream",
-                                                "post_number": post.number,
-                                                "content_chunk": chunk
-                                            })
-                                            await asyncio.sleep(0.05)
-                                    else:
-                                        logger.warning(f"Empty content for {post.character_name} (post #{post.number})")
-                                        await websocket.send_json({
-                                            "type": "post_stream",
-                                            "post_number": post.number,
-                                            "content_chunk": ""
-                                        })
-                                    
-                                    await websocket.send_json({
-                                        "type": "post_complete",
-                                        "post": {
-                                            "number": post.number,
-                                            "character_id": post.character_id,
-                                            "character_name": post.character_name,
-                                            "content": post.content,
-                                            "timestamp": post.timestamp.isoformat(),
-                                            "anchors": post.anchors,
-                                            "character_color": CHARACTERS[post.character_id].color
-                                        }
-                                    })
-                        
-                        await thread_task
-                        
-                        await websocket.send_json({
-                            "type": "thread_completed",
-                            "thread_id": thread_id,
-                            "total_posts": len(thread_manager.posts)
-                        })
-                    except Exception as e:
-                        await websocket.send_json({
-                            "type": "error",
-                            "message": str(e)
-                        })
+                }, control=True)
                 
-                thread_task = asyncio.create_task(run_thread())
+                # 生成はスレッドごとに1つで、視聴者は同じハブから配信を受ける
+                # （現在の状態を受け取ってから実行を予約するので、待ち順や以降のレスはハブ経由で届く）
+                broadcaster = get_broadcaster(thread_id, thread_manager)
+                broadcaster.join(outbox)
+                try:
+                    scheduler.submit(thread_id)
+                except QueueFullError as e:
+                    # 待ち行列が満杯なので生成は始めない（スレッドは作成済みのまま、後で再度開始できる）
+                    outbox.send({
+                        "type": "error",
+                        "code": "queue_full",
+                        "message": str(e)
+                    }, control=True)
+                if thread_manager.status in ("completed", "stopped"):
+                    # 既に終了しているスレッド
+                    outbox.send({
+                        "type": "thread_completed",
+                        "thread_id": thread_id,
+                        "total_posts": len(thread_manager.posts)
+                    }, control=True)
             
             elif message["action"] == "stop_thread":
                 if thread_manager:
-                    thread_manager.stop_thread()
-                    if thread_task:
-                        thread_task.cancel()
-                    await websocket.send_json({
+                    scheduler.stop(thread_id)
+                    outbox.send({
                         "type": "thread_stopped"
-                    })
+                    }, control=True)
             
             elif message["action"] == "get_status":
                 if thread_manager:
-                    await websocket.send_json({
+                    outbox.send({
                         "type": "status",
                         "data": thread_manager.to_dict()
-                    })
+                    }, control=True)
                 else:
-                    await websocket.send_json({
+                    outbox.send({
                         "type": "status",
                         "data": {"state": "no_active_thread"}
-                    })
+                    }, control=True)
     
     except WebSocketDisconnect:
         active_connections.remove(websocket)
-        if thread_manager:
-            thread_manager.stop_thread()
-        if thread_task:
-            thread_task.cancel()
+        if broadcaster:
+            await leave_broadcast(broadcaster, outbox)
+        await outbox.close()
     except Exception as e:
-        await websocket.send_json({
+        outbox.send({
             "type": "error",
             "message": str(e)
-        })
-        if thread_manager:
-            thread_manager.stop_thread()
-        if thread_task:
-            thread_task.cancel()
+        }, control=True)
+        await outbox.flush()
+        if broadcaster:
+            await leave_broadcast(broadcaster, outbox)
+        await outbox.close()
 
 
 if __name__ == "__main__":
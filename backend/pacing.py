@@ -0,0 +1,34 @@
+import os
+import random
+from dataclasses import dataclass
+from typing import Dict, Tuple
+
+@dataclass(frozen=True)
+class PacingPolicy:
+    """レス間の待機時間の設定"""
+    name: str
+    post_delay: Tuple[float, float]  # レス投稿後の待機秒数（最小, 最大）
+    error_delay: float               # 生成失敗後の待機秒数
+
+    def post_interval(self) -> float:
+        return random.uniform(*self.post_delay)
+
+def _replay_policy() -> PacingPolicy:
+    delay = float(os.getenv("DELAY_BETWEEN_POSTS", "3"))
+    return PacingPolicy(name="replay", post_delay=(delay, delay), error_delay=delay)
+
+# realtime: 人が書き込んでいるような間隔（閲覧用のデフォルト）
+# fast: 待機なし（レート制限のみで律速。デモ・バッチ生成用）
+# replay: DELAY_BETWEEN_POSTS秒の一定間隔
+PACING_MODES: Dict[str, PacingPolicy] = {
+    "realtime": PacingPolicy(name="realtime", post_delay=(2, 5), error_delay=5),
+    "fast": PacingPolicy(name="fast", post_delay=(0, 0), error_delay=0),
+}
+
+def get_pacing(mode: str) -> PacingPolicy:
+    """モード名からペース設定を取得"""
+    if mode == "replay":
+        return _replay_policy()
+    if mode not in PACING_MODES:
+        raise ValueError(f"Unknown pacing mode: {mode}")
+    return PACING_MODES[mode]
@@ -0,0 +1,95 @@
+import hashlib
+import itertools
+import json
+from typing import Dict, Iterator, List, Optional
+
+class DatasetStream:
+    """Lazily reads one dataset field from a local JSONL/Parquet file or a Hugging Face dataset in streaming mode.
+
+    offset counts the records consumed so far, so a later run can continue where this one stopped.
+    """
+
+    def __init__(self, name: str, field: str, type: str = "hf", path: Optional[str] = None,
+                 split: str = "train", limit: Optional[int] = None, offset: int = 0):
+        self.name = name
+        self.field = field
+        self.type = type
+        self.path = path or name
+        self.split = split
+        self.limit = limit
+        self.offset = offset
+
+    def records(self) -> Iterator[Dict]:
+        if self.type == "jsonl":
+            with open(self.path, encoding="utf-8") as f:
+                # Blank lines are not records, so they are dropped before skipping the consumed offset
+                lines = (line for line in f if line.strip())
+                for line in itertools.islice(lines, self.offset, None):
+                    yield json.loads(line)
+        elif self.type == "parquet":
+            import pyarrow.parquet as pq  # Optional dependency, only needed for local Parquet files
+            rows = (
+                row
+                for batch in pq.ParquetFile(self.path).iter_batches(columns=[self.field])
+                for row in batch.to_pylist()
+            )
+            yield from itertools.islice(rows, self.offset, None)
+        elif self.type == "hf":
+            from datasets import load_dataset  # Optional dependency, only needed for Hugging Face datasets
+            dataset = load_dataset(self.path, split=self.split, streaming=True)
+            yield from dataset.skip(self.offset)
+        else:
+            raise ValueError(f"Unknown dataset type: {self.type}")
+
+    def __iter__(self) -> Iterator[str]:
+        remaining = None if self.limit is None else max(0, self.limit - self.offset)
+        for record in itertools.islice(self.records(), remaining):
+            self.offset += 1
+            value = record.get(self.field)
+            if isinstance(value, str) and value.strip():
+                yield value
+
+class PromptSource:
+    """Chains dataset streams into one prompt iterator, dropping prompts whose hash was already seen."""
+
+    def __init__(self, streams: List[DatasetStream], dedupe: bool = True):
+        self.streams = streams
+        self.dedupe = dedupe
+        self.seen = set()
+        self.duplicates = 0
+
+    @classmethod
+    def from_config(cls, datasets_config: List[Dict], dedupe: bool = True) -> "PromptSource":
+        return cls([
+            DatasetStream(
+                name=dataset["name"],
+                field=dataset["field"],
+                type=dataset.get("type", "hf"),
+                path=dataset.get("path"),
+                split=dataset.get("split", "train"),
+                limit=dataset.get("limit")
+            )
+            for dataset in datasets_config
+        ], dedupe=dedupe)
+
+    @staticmethod
+    def prompt_hash(prompt: str) -> bytes:
+        return hashlib.blake2b(prompt.strip().encode(), digest_size=8).digest()
+
+    def __iter__(self) -> Iterator[str]:
+        for stream in self.streams:
+            for prompt in stream:
+                if self.dedupe:
+                    digest = self.prompt_hash(prompt)
+                    if digest in self.seen:
+                        self.duplicates += 1
+                        continue
+                    self.seen.add(digest)
+                yield prompt
+
+    def state(self) -> Dict[str, int]:
+        return {stream.name: stream.offset for stream in self.streams}
+
+    def restore(self, state: Dict[str, int]) -> None:
+        for stream in self.streams:
+            stream.offset = state.get(stream.name, stream.offset)
@@ -1,53 +1,194 @@
 import asyncio
 import time
-from typing import Dict, Optional
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple
 from dataclasses import dataclass
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
+# 応答のトークン数の見積もり（実際の出力長で後から精算する）
+ESTIMATED_OUTPUT_TOKENS = 512
+
 @dataclass
 class RateLimitConfig:
     """レート制限設定"""
-    max_requests_per_minute: int = 20
-    delay_between_posts: float = 3.0
+    requests_per_minute: int = 20
+    tokens_per_minute: int = 100000
+
+def load_config(api_type: str) -> RateLimitConfig:
+    """
+    APIごとの設定を環境変数から読み込む
+    RATE_LIMIT_<API>_RPM / RATE_LIMIT_<API>_TPM が未設定の場合は
+    MAX_REQUESTS_PER_MINUTE / MAX_TOKENS_PER_MINUTE を使用
+    """
+    prefix = f"RATE_LIMIT_{api_type.upper()}"
+    return RateLimitConfig(
+        requests_per_minute=int(os.getenv(f"{prefix}_RPM", os.getenv("MAX_REQUESTS_PER_MINUTE", "20"))),
+        tokens_per_minute=int(os.getenv(f"{prefix}_TPM", os.getenv("MAX_TOKENS_PER_MINUTE", "100000")))
+    )
+
+def estimate_tokens(text: str) -> int:
+    """
+    トークン数の簡易見積もり
+    日本語などの非ASCII文字は1文字1トークン、ASCIIは4文字1トークンとして数える
+    """
+    ascii_chars = sum(1 for char in text if ord(char) < 0x80)
+    return (len(text) - ascii_chars) + ascii_chars // 4 + 1
+
+def retry_after_from_error(error: Exception) -> Optional[float]:
+    """
+    レート制限エラー（HTTP 429 / gRPC RESOURCE_EXHAUSTED）なら待機秒数を返す
+    Retry-Afterヘッダがない場合はデフォルトのバックオフ秒数を返し、
+    レート制限以外のエラーならNoneを返す
+    """
+    response = getattr(error, "response", None)
+    status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+    code = getattr(error, "code", None)
+    if callable(code):
+        try:
+            code = code()
+        except Exception:
+            code = None
+
+    if status != 429 and code != 429 and getattr(code, "name", None) != "RESOURCE_EXHAUSTED":
+        return None
+
+    headers = getattr(response, "headers", None) or {}
+    retry_after = headers.get("retry-after") if hasattr(headers, "get") else None
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+
+    return float(os.getenv("RATE_LIMIT_DEFAULT_BACKOFF", "10"))
+
+class TokenBucket:
+    """毎秒rateずつ補充され、最大capacityまで貯まるトークンバケット"""
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def time_until(self, amount: float, now: float) -> float:
+        """amount分のトークンが貯まるまでの秒数"""
+        self._refill(now)
+        # バケット容量を超える要求は満杯になれば通す
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        """トークンを消費（負の値は払い戻し。精算で残高がマイナスになることもある）"""
+        self._refill(time.monotonic())
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+class ModelRateLimiter:
+    """1つの(API, モデル)に対するRPM/TPMの制限"""
+
+    def __init__(self, config: RateLimitConfig):
+        self.config = config
+        self.requests = TokenBucket(config.requests_per_minute, config.requests_per_minute / 60)
+        self.tokens = TokenBucket(config.tokens_per_minute, config.tokens_per_minute / 60)
+        self.blocked_until = 0.0
+        # asyncio.Lockは待機順（FIFO）に起こされるため、複数スレッドから来た要求は到着順に処理される
+        self._queue = asyncio.Lock()
+
+    async def acquire(self, tokens: int):
+        async with self._queue:
+            while True:
+                now = time.monotonic()
+                wait = max(
+                    self.blocked_until - now,
+                    self.requests.time_until(1, now),
+                    self.tokens.time_until(tokens, now)
+                )
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+
+            self.requests.consume(1)
+            self.tokens.consume(tokens)
+
+    def block_for(self, seconds: float):
+        """429応答を受けたら、Retry-Afterの間は新しい要求を出さない"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+class Reservation:
+    """acquireで確保した枠。実際の入出力量で消費トークンを精算する"""
+
+    def __init__(self, limiter: ModelRateLimiter, input_tokens: int, reserved_tokens: int):
+        self.limiter = limiter
+        self.input_tokens = input_tokens
+        self.reserved_tokens = reserved_tokens
+        self.output_tokens = 0
+
+    def record_output(self, text: str):
+        self.output_tokens += estimate_tokens(text)
+
+    def settle(self):
+        self.limiter.tokens.consume(self.input_tokens + self.output_tokens - self.reserved_tokens)
 
 class RateLimiter:
-    """APIレート制限管理"""
-    
+    """APIレート制限管理（API・モデルごとのトークンバケット）"""
+
     def __init__(self):
-        self.config = RateLimitConfig(
-            max_requests_per_minute=int(os.getenv("MAX_REQUESTS_PER_MINUTE", "20")),
-            delay_between_posts=float(os.getenv("DELAY_BETWEEN_POSTS", "3"))
+        self.configs: Dict[str, RateLimitConfig] = {}
+        self.limiters: Dict[Tuple[str, str], ModelRateLimiter] = {}
+
+    def configure(self, api_type: str, model: Optional[str] = None,
+                  requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None):
+        """APIまたは特定モデルの制限値を上書きする"""
+        base = self._config_for(api_type)
+        config = RateLimitConfig(
+            requests_per_minute=requests_per_minute or base.requests_per_minute,
+            tokens_per_minute=tokens_per_minute or base.tokens_per_minute
         )
-        self.request_times: Dict[str, list] = {
-            "openai": [],
-            "anthropic": [],
-            "google": [],
-            "grok": []
-        }
-        self.last_post_time = 0
-    
-    async def wait_if_needed(self, api_type: str):
-        """必要に応じて待機"""
-        current_time = time.time()
-        
-        if api_type not in self.request_times:
-            self.request_times[api_type] = []
-        
-        self.request_times[api_type] = [
-            t for t in self.request_times[api_type] 
-            if current_time - t < 60
-        ]
-        
-        if len(self.request_times[api_type]) >= self.config.max_requests_per_minute:
-            wait_time = 60 - (current_time - self.request_times[api_type][0])
-            if wait_time > 0:
-                await asyncio.sleep(wait_time)
-        
-        time_since_last_post = current_time - self.last_post_time
-        if time_since_last_post < self.config.delay_between_posts:
-            await asyncio.sleep(self.config.delay_between_posts - time_since_last_post)
-        
-        self.request_times[api_type].append(current_time)
-        self.last_post_time = current_time
-
-rate_limiter = RateLimiter()
\ No newline at end of file
+        if model is None:
+            self.configs[api_type] = config
+            self.limiters = {key: limiter for key, limiter in self.limiters.items() if key[0] != api_type}
+        else:
+            self.configs[f"{api_type}/{model}"] = config
+            self.limiters.pop((api_type, model), None)
+
+    def _config_for(self, api_type: str, model: Optional[str] = None) -> RateLimitConfig:
+        if model and f"{api_type}/{model}" in self.configs:
+            return self.configs[f"{api_type}/{model}"]
+        if api_type not in self.configs:
+            self.configs[api_type] = load_config(api_type)
+        return self.configs[api_type]
+
+    def get_limiter(self, api_type: str, model: str) -> ModelRateLimiter:
+        key = (api_type, model)
+        if key not in self.limiters:
+            self.limiters[key] = ModelRateLimiter(self._config_for(api_type, model))
+        return self.limiters[key]
+
+    async def acquire(self, api_type: str, model: str, prompt: str) -> Reservation:
+        """リクエスト1回分の枠を確保するまで待機"""
+        limiter = self.get_limiter(api_type, model)
+        input_tokens = estimate_tokens(prompt)
+        reserved = input_tokens + ESTIMATED_OUTPUT_TOKENS
+        await limiter.acquire(reserved)
+        return Reservation(limiter, input_tokens, reserved)
+
+    def report_error(self, api_type: str, model: str, error: Exception):
+        """APIエラーを受け取り、レート制限エラーなら該当モデルの送信を止める"""
+        retry_after = retry_after_from_error(error)
+        if retry_after is not None:
+            logger.warning(f"Rate limited by {api_type}/{model}, backing off {retry_after:.1f}s")
+            self.get_limiter(api_type, model).block_for(retry_after)
+
+rate_limiter = RateLimiter()
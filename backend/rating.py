@@ -0,0 +1,126 @@
+import math
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+ELO_BASE = 1000.0
+ELO_SCALE = 400.0
+
+class RatingEngine:
+    """Bradley–Terry ratings on the Elo scale, shared by the arena and the debate flow.
+
+    Battles are appended to compact NumPy arrays and aggregated into win/game matrices as they
+    arrive, so a refit costs O(players^3) Newton steps regardless of how many battles were played.
+    Each fit warm-starts from the previous solution.
+    """
+
+    def __init__(self, players: Iterable[str] = (), prior: float = 1.0,
+                 base: float = ELO_BASE, scale: float = ELO_SCALE):
+        self.prior = prior  # L2 penalty on log-strengths; keeps unbeaten / unplayed players finite
+        self.base = base
+        self.scale = scale
+        self.index: Dict[str, int] = {}
+        self.wins = np.zeros((0, 0))   # wins[i, j]: (fractional) wins of i over j
+        self.games = np.zeros((0, 0))  # games[i, j] == games[j, i]
+        self.theta = np.zeros(0)       # log-strengths of the last fit
+
+        self._a = np.zeros(64, dtype=np.int32)
+        self._b = np.zeros(64, dtype=np.int32)
+        self._score = np.zeros(64)
+        self.battle_count = 0
+
+        for player in players:
+            self.add_player(player)
+
+    def add_player(self, name: str) -> int:
+        if name not in self.index:
+            n = len(self.index)
+            self.index[name] = n
+            self.wins = np.pad(self.wins, ((0, 1), (0, 1)))
+            self.games = np.pad(self.games, ((0, 1), (0, 1)))
+            self.theta = np.append(self.theta, 0.0)
+        return self.index[name]
+
+    def record(self, player_a: str, player_b: str, score_a: float) -> None:
+        # score_a is player_a's share of the result: 1 win, 0.5 tie, 0 loss (or any fraction in between)
+        i, j = self.add_player(player_a), self.add_player(player_b)
+        if self.battle_count == len(self._score):
+            self._a = np.resize(self._a, 2 * len(self._a))
+            self._b = np.resize(self._b, 2 * len(self._b))
+            self._score = np.resize(self._score, 2 * len(self._score))
+        self._a[self.battle_count], self._b[self.battle_count] = i, j
+        self._score[self.battle_count] = score_a
+        self.battle_count += 1
+
+        self.wins[i, j] += score_a
+        self.wins[j, i] += 1 - score_a
+        self.games[i, j] += 1
+        self.games[j, i] += 1
+
+    def state(self) -> Dict:
+        # Battles are enough to rebuild everything; theta is kept so the next fit warm-starts
+        n = self.battle_count
+        return {
+            "players": list(self.index),
+            "theta": self.theta.tolist(),
+            "a": self._a[:n].tolist(),
+            "b": self._b[:n].tolist(),
+            "score": self._score[:n].tolist()
+        }
+
+    def restore(self, state: Dict) -> None:
+        players = state["players"]
+        for player in players:
+            self.add_player(player)
+        for i, j, score in zip(state["a"], state["b"], state["score"]):
+            self.record(players[i], players[j], score)
+        for player, theta in zip(players, state.get("theta", [])):
+            self.theta[self.index[player]] = theta
+
+    def _solve(self, wins: np.ndarray, games: np.ndarray, theta: np.ndarray,
+               max_iter: int = 50, tol: float = 1e-8) -> np.ndarray:
+        # Newton's method on the penalised Bradley–Terry log-likelihood
+        identity = np.eye(len(theta))
+        for _ in range(max_iter):
+            p = 1 / (1 + np.exp(theta[None, :] - theta[:, None]))  # p[i, j] = P(i beats j)
+            gradient = (wins - games * p).sum(axis=1) - self.prior * theta
+            weights = games * p * (1 - p)
+            hessian = weights - np.diag(weights.sum(axis=1)) - self.prior * identity
+            step = np.linalg.solve(hessian, gradient)
+            theta = theta - step
+            if np.abs(step).max() < tol:
+                break
+        return theta - theta.mean()
+
+    def fit(self) -> Dict[str, float]:
+        if len(self.index):
+            self.theta = self._solve(self.wins, self.games, self.theta)
+        return self.ratings()
+
+    def to_elo(self, theta: np.ndarray) -> np.ndarray:
+        return self.base + theta * self.scale / math.log(10)
+
+    def ratings(self) -> Dict[str, float]:
+        elo = self.to_elo(self.theta)
+        return {name: float(elo[i]) for name, i in self.index.items()}
+
+    def confidence_intervals(self, samples: int = 200, alpha: float = 0.05,
+                             seed: Optional[int] = None) -> Dict[str, Tuple[float, float]]:
+        # Bootstrap over battles: each resample reweights battles with multinomial counts
+        n = len(self.index)
+        if self.battle_count == 0:
+            return {name: (self.base, self.base) for name in self.index}
+        rng = np.random.default_rng(seed)
+        a, b, score = self._a[:self.battle_count], self._b[:self.battle_count], self._score[:self.battle_count]
+        estimates = np.empty((samples, n))
+        for k in range(samples):
+            weight = rng.multinomial(self.battle_count, np.full(self.battle_count, 1 / self.battle_count))
+            wins = np.zeros((n, n))
+            games = np.zeros((n, n))
+            np.add.at(wins, (a, b), weight * score)
+            np.add.at(wins, (b, a), weight * (1 - score))
+            np.add.at(games, (a, b), weight)
+            np.add.at(games, (b, a), weight)
+            estimates[k] = self.to_elo(self._solve(wins, games, self.theta.copy()))
+        low, high = np.quantile(estimates, [alpha / 2, 1 - alpha / 2], axis=0)
+        return {name: (float(low[i]), float(high[i])) for name, i in self.index.items()}
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+GrokClient 非同期化の回帰テスト
+Grokの応答待ちの間もイベントループが止まらず、他のスレッドが進行することを確認
+（実APIは呼ばず、xai_sdkのチャットをフェイクに差し替えて実行）
+"""
+
+import asyncio
+import os
+import time
+
+os.environ.setdefault("GROK_API_KEY", "test-key")
+
+from ai_clients import GrokClient
+
+GROK_LATENCY = 1.0  # フェイクGrokの応答時間（秒）
+TICK_INTERVAL = 0.05
+
+
+class FakeChunk:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class FakeResponse:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class FakeChat:
+    """xai_sdk.aio.chat.Chat の代わりに、待ち時間だけを再現する"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def append(self, message):
+        pass
+
+    async def sample(self):
+        await asyncio.sleep(self.latency)
+        return FakeResponse("フェイク応答")
+
+    async def stream(self):
+        for i in range(5):
+            await asyncio.sleep(self.latency / 5)
+            yield FakeResponse(""), FakeChunk(f"chunk{i}")
+
+
+class FakeChatClient:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def create(self, model: str):
+        return FakeChat(self.latency)
+
+
+class FakeXAIClient:
+    def __init__(self, latency: float):
+        self.chat = FakeChatClient(latency)
+
+
+def make_client(latency: float = GROK_LATENCY, timeout: float = 30) -> GrokClient:
+    client = GrokClient()
+    client.client = FakeXAIClient(latency)
+    client.timeout = timeout
+    return client
+
+
+async def other_thread(stop: asyncio.Event) -> int:
+    """Grok呼び出し中に進行するはずの別スレッド（ティック数を返す）"""
+    ticks = 0
+    while not stop.is_set():
+        await asyncio.sleep(TICK_INTERVAL)
+        ticks += 1
+    return ticks
+
+
+async def run_concurrently(call) -> int:
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(other_thread(stop))
+    await call
+    stop.set()
+    return await ticker
+
+
+def test_sample_does_not_block_event_loop():
+    """generate_response中も他のコルーチンが進行する"""
+    async def scenario():
+        client = make_client()
+        return await run_concurrently(client.generate_response("テスト", "system"))
+
+    ticks = asyncio.run(scenario())
+    expected = GROK_LATENCY / TICK_INTERVAL
+    print(f"  ticks during generate_response: {ticks} (expected ~{expected:.0f})")
+    assert ticks >= expected * 0.5, "event loop was blocked during Grok sample"
+
+
+def test_stream_does_not_block_event_loop():
+    """generate_response_stream中も他のコルーチンが進行する"""
+    async def consume(client: GrokClient):
+        return [delta async for delta in client.generate_response_stream("テスト", "system")]
+
+    async def scenario():
+        client = make_client()
+        return await run_concurrently(consume(client))
+
+    ticks = asyncio.run(scenario())
+    expected = GROK_LATENCY / TICK_INTERVAL
+    print(f"  ticks during generate_response_stream: {ticks} (expected ~{expected:.0f})")
+    assert ticks >= expected * 0.5, "event loop was blocked during Grok stream"
+
+
+def test_concurrent_calls_overlap():
+    """複数スレッドからのGrok呼び出しが直列化されない"""
+    async def scenario():
+        client = make_client()
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            client.generate_response("テスト", "system") for _ in range(5)
+        ])
+        return time.perf_counter() - start
+
+    elapsed = asyncio.run(scenario())
+    print(f"  5 concurrent calls took {elapsed:.2f}s (single call: {GROK_LATENCY:.2f}s)")
+    assert elapsed < GROK_LATENCY * 2, "Grok calls were serialized"
+
+
+def test_timeout_cancels_hung_call():
+    """応答が返らない呼び出しはタイムアウトで打ち切られる"""
+    async def scenario():
+        client = make_client(latency=10, timeout=0.2)
+        client.models = client.models[:1]
+        try:
+            await client.generate_response("テスト", "system")
+        except asyncio.TimeoutError:
+            return True
+        return False
+
+    start = time.perf_counter()
+    timed_out = asyncio.run(scenario())
+    elapsed = time.perf_counter() - start
+    print(f"  hung call aborted after {elapsed:.2f}s")
+    assert timed_out and elapsed < 2, "hung Grok call was not cancelled"
+
+
+def main():
+    print("=" * 60)
+    print("GrokClient Async Regression Test")
+    print("=" * 60)
+
+    tests = [
+        test_sample_does_not_block_event_loop,
+        test_stream_does_not_block_event_loop,
+        test_concurrent_calls_overlap,
+        test_timeout_cancels_hung_call,
+    ]
+
+    failed = 0
+    for test in tests:
+        print(f"\n{test.__name__}")
+        try:
+            test()
+            print("  ✅ PASS")
+        except AssertionError as e:
+            failed += 1
+            print(f"  ❌ FAIL: {e}")
+
+    print(f"\n{'=' * 60}")
+    print(f"📊 Results: {len(tests) - failed}/{len(tests)} passed")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+プロンプト読み込み（DatasetStream / PromptSource）の回帰テスト
+JSONLの途中再開で、空行があってもプロンプトが重複・欠落しないことを確認
+"""
+
+import json
+import os
+import tempfile
+from itertools import islice
+
+from prompt_source import DatasetStream, PromptSource
+
+
+def write_jsonl(directory: str, lines) -> str:
+    path = os.path.join(directory, "prompts.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write((json.dumps({"prompt": line}) if line is not None else "") + "\n")
+    return path
+
+
+def test_resume_skips_blank_lines():
+    """空行を含むファイルでも、再開後は続きのレコードから読む"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = write_jsonl(directory, ["a", None, "b", "c", None, "d"])
+        stream = DatasetStream("prompts", "prompt", type="jsonl", path=path)
+        assert list(islice(stream, 2)) == ["a", "b"]
+
+        resumed = DatasetStream("prompts", "prompt", type="jsonl", path=path, offset=stream.offset)
+        assert list(resumed) == ["c", "d"]
+        assert resumed.offset == 4, resumed.offset
+
+
+def test_source_state_roundtrip():
+    """state / restoreで保存したoffsetから、残りのプロンプトだけを読む"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = write_jsonl(directory, [None, "a", "b", None, "c"])
+        config = [{"name": "prompts", "field": "prompt", "type": "jsonl", "path": path}]
+        source = PromptSource.from_config(config)
+        first = next(iter(source))
+
+        resumed = PromptSource.from_config(config)
+        resumed.restore(source.state())
+        assert [first] + list(resumed) == ["a", "b", "c"]
+
+
+def test_limit_counts_consumed_records():
+    """limitは再開前に読んだ分も含めた件数"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = write_jsonl(directory, ["a", None, "b", "c", "d"])
+        stream = DatasetStream("prompts", "prompt", type="jsonl", path=path, limit=3, offset=1)
+        assert list(stream) == ["b", "c"]
+
+
+def main():
+    print("=" * 60)
+    print("Prompt Source Regression Test")
+    print("=" * 60)
+
+    tests = [
+        test_resume_skips_blank_lines,
+        test_source_state_roundtrip,
+        test_limit_counts_consumed_records,
+    ]
+
+    failed = 0
+    for test in tests:
+        print(f"\n{test.__name__}")
+        try:
+            test()
+            print("  ✅ PASS")
+        except AssertionError as e:
+            failed += 1
+            print(f"  ❌ FAIL: {e}")
+
+    print(f"\n{'=' * 60}")
+    print(f"📊 Results: {len(tests) - failed}/{len(tests)} passed")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
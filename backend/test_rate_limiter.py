@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+レート制限の回帰テスト
+トークンバケットの待機・429後の送信停止・Retry-Afterの解釈・出力量による精算を確認
+（AI APIは呼ばない）
+"""
+
+import asyncio
+import os
+import time
+from email.utils import formatdate
+from types import SimpleNamespace
+
+from rate_limiter import (
+    ModelRateLimiter, RateLimitConfig, RateLimiter, TokenBucket, retry_after_from_error
+)
+
+
+def make_error(status_code=None, headers=None, code=None) -> Exception:
+    """httpx / SDKの例外と同じく、status_codeやresponse.headersを持つ例外"""
+    error = Exception("rate limited")
+    error.response = SimpleNamespace(status_code=status_code, headers=headers or {})
+    if code is not None:
+        error.code = code
+    return error
+
+
+def test_bucket_refill_time():
+    """足りない分は補充速度から待ち時間を計算し、容量を超える要求は満杯で通す"""
+    bucket = TokenBucket(capacity=10, rate=2)
+    assert bucket.time_until(10, bucket.updated_at) == 0.0
+    bucket.consume(10)
+    now = bucket.updated_at
+    assert abs(bucket.time_until(4, now) - 2.0) < 0.01
+    assert abs(bucket.time_until(100, now) - 5.0) < 0.01
+    assert bucket.time_until(4, now + 2.0) == 0.0
+
+
+def test_acquire_waits_for_tokens():
+    """TPMを使い切ると、次の要求は補充されるまで待つ"""
+    async def scenario():
+        # 毎秒100トークン補充
+        limiter = ModelRateLimiter(RateLimitConfig(requests_per_minute=600, tokens_per_minute=6000))
+        await limiter.acquire(6000)
+        start = time.monotonic()
+        await limiter.acquire(50)
+        return time.monotonic() - start
+
+    elapsed = asyncio.run(scenario())
+    assert 0.4 <= elapsed < 1.0, elapsed
+
+
+def test_blocked_after_rate_limit_error():
+    """429を受けたモデルはRetry-Afterの間だけ止まり、他のモデルは止まらない"""
+    async def scenario():
+        limiter = RateLimiter()
+        limiter.configure("test", requests_per_minute=600, tokens_per_minute=100000)
+        limiter.report_error("test", "model-a", make_error(429, {"retry-after": "0.3"}))
+
+        start = time.monotonic()
+        await limiter.acquire("test", "model-b", "hello")
+        other = time.monotonic() - start
+        await limiter.acquire("test", "model-a", "hello")
+        blocked = time.monotonic() - start
+        return other, blocked
+
+    other, blocked = asyncio.run(scenario())
+    assert other < 0.1, other
+    assert 0.25 <= blocked < 0.6, blocked
+
+
+def test_retry_after_parsing():
+    """Retry-Afterは秒数とHTTP日付の両方に対応し、ない場合はデフォルトのバックオフ"""
+    default = float(os.getenv("RATE_LIMIT_DEFAULT_BACKOFF", "10"))
+
+    assert retry_after_from_error(make_error(429, {"retry-after": "7"})) == 7.0
+    assert retry_after_from_error(make_error(429, {"retry-after": "-3"})) == 0.0
+    seconds = retry_after_from_error(make_error(429, {"retry-after": formatdate(time.time() + 30, usegmt=True)}))
+    assert 25 <= seconds <= 31, seconds
+    assert retry_after_from_error(make_error(429, {"retry-after": "soon"})) == default
+    assert retry_after_from_error(make_error(429)) == default
+
+    # gRPC（Gemini）のRESOURCE_EXHAUSTED
+    resource_exhausted = SimpleNamespace(name="RESOURCE_EXHAUSTED")
+    assert retry_after_from_error(make_error(code=lambda: resource_exhausted)) == default
+
+    # レート制限以外のエラーは対象外
+    assert retry_after_from_error(make_error(500, {"retry-after": "7"})) is None
+    assert retry_after_from_error(ValueError("broken")) is None
+
+
+def test_reservation_settles_actual_usage():
+    """見積もりより短い応答なら、確保した分の差額がバケットに戻る"""
+    async def scenario():
+        limiter = RateLimiter()
+        limiter.configure("test", requests_per_minute=600, tokens_per_minute=100000)
+        reservation = await limiter.acquire("test", "model", "a" * 400)
+        bucket = reservation.limiter.tokens
+        after_acquire = bucket.tokens
+        reservation.record_output("b" * 40)
+        reservation.settle()
+        return reservation, after_acquire, bucket.tokens
+
+    reservation, after_acquire, after_settle = asyncio.run(scenario())
+    refund = reservation.reserved_tokens - reservation.input_tokens - reservation.output_tokens
+    assert refund > 0
+    assert abs(after_settle - after_acquire - refund) < 5, (after_acquire, after_settle, refund)
+
+
+def main():
+    print("=" * 60)
+    print("Rate Limiter Regression Test")
+    print("=" * 60)
+
+    tests = [
+        test_bucket_refill_time,
+        test_acquire_waits_for_tokens,
+        test_blocked_after_rate_limit_error,
+        test_retry_after_parsing,
+        test_reservation_settles_actual_usage,
+    ]
+
+    failed = 0
+    for test in tests:
+        print(f"\n{test.__name__}")
+        try:
+            test()
+            print("  ✅ PASS")
+        except AssertionError as e:
+            failed += 1
+            print(f"  ❌ FAIL: {e}")
+
+    print(f"\n{'=' * 60}")
+    print(f"📊 Results: {len(tests) - failed}/{len(tests)} passed")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+レーティングエンジン（Bradley–Terry）の回帰テスト
+既知の強さから生成した対戦結果で、順位・信頼区間・再計算の性質を確認
+"""
+
+import numpy as np
+
+from rating import RatingEngine
+
+
+def simulate(engine: RatingEngine, strengths: np.ndarray, battles: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    for _ in range(battles):
+        i, j = rng.choice(len(strengths), 2, replace=False)
+        p = 1 / (1 + np.exp(strengths[j] - strengths[i]))
+        engine.record(f"m{i}", f"m{j}", float(rng.random() < p))
+
+
+def test_recovers_known_strengths():
+    """対戦数が十分なら、真の強さの順に並ぶ"""
+    strengths = np.linspace(-1.5, 1.5, 6)
+    engine = RatingEngine()
+    simulate(engine, strengths, 6000)
+    ratings = engine.fit()
+    order = sorted(ratings, key=ratings.get)
+    assert order == [f"m{i}" for i in range(6)], order
+
+
+def test_refit_does_not_double_count():
+    """fitを何度呼んでも、同じ対戦結果からは同じレーティングになる"""
+    engine = RatingEngine()
+    simulate(engine, np.array([0.0, 1.0, 2.0]), 300)
+    first = engine.fit()
+    second = engine.fit()
+    assert all(abs(first[name] - second[name]) < 1e-6 for name in first)
+
+
+def test_incremental_matches_batch():
+    """対戦ごとに更新しても、まとめて計算しても結果は同じ"""
+    incremental = RatingEngine()
+    batch = RatingEngine()
+    rng = np.random.default_rng(1)
+    for k in range(500):
+        i, j = rng.choice(4, 2, replace=False)
+        score = float(rng.random() < 0.5 + 0.1 * (i - j))
+        incremental.record(f"m{i}", f"m{j}", score)
+        batch.record(f"m{i}", f"m{j}", score)
+        if k % 50 == 0:
+            incremental.fit()
+    a, b = incremental.fit(), batch.fit()
+    assert all(abs(a[name] - b[name]) < 1e-6 for name in a)
+
+
+def test_confidence_intervals_contain_estimate():
+    """ブートストラップ信頼区間は推定値を含み、対戦が増えると狭くなる"""
+    strengths = np.array([0.0, 0.5, 1.0])
+    widths = []
+    for battles in (100, 2000):
+        engine = RatingEngine()
+        simulate(engine, strengths, battles)
+        ratings = engine.fit()
+        intervals = engine.confidence_intervals(samples=100, seed=0)
+        for name, (low, high) in intervals.items():
+            assert low <= ratings[name] <= high, (name, low, ratings[name], high)
+        widths.append(np.mean([high - low for low, high in intervals.values()]))
+    assert widths[1] < widths[0], widths
+
+
+def test_state_restore_roundtrip():
+    """チェックポイントから復元したエンジンは、元と同じレーティングになる"""
+    engine = RatingEngine()
+    simulate(engine, np.array([0.0, 0.7, 1.4]), 400)
+    engine.fit()
+    restored = RatingEngine()
+    restored.restore(engine.state())
+    assert restored.battle_count == engine.battle_count
+    a, b = engine.fit(), restored.fit()
+    assert all(abs(a[name] - b[name]) < 1e-6 for name in a)
+
+
+def main():
+    print("=" * 60)
+    print("Rating Engine Regression Test")
+    print("=" * 60)
+
+    tests = [
+        test_recovers_known_strengths,
+        test_refit_does_not_double_count,
+        test_incremental_matches_batch,
+        test_confidence_intervals_contain_estimate,
+        test_state_restore_roundtrip,
+    ]
+
+    failed = 0
+    for test in tests:
+        print(f"\n{test.__name__}")
+        try:
+            test()
+            print("  ✅ PASS")
+        except AssertionError as e:
+            failed += 1
+            print(f"  ❌ FAIL: {e}")
+
+    print(f"\n{'=' * 60}")
+    print(f"📊 Results: {len(tests) - failed}/{len(tests)} passed")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+スレッド取得APIの回帰テスト
+since / offset / limitによる差分・ページ取得、ETagによる304、
+メモリにないスレッドのストアからの読み込みを確認
+（AI APIは呼ばない。レスはテストで直接追加する）
+"""
+
+import os
+import tempfile
+from datetime import datetime
+
+os.environ.setdefault("THREAD_STORE", "none")
+
+from fastapi.testclient import TestClient
+
+import main as server
+from characters import ResponseLength
+from thread_manager import ThreadManager, Post
+from thread_store import SQLiteThreadStore
+
+
+def make_post(number: int) -> Post:
+    return Post(
+        number=number,
+        character_id="gpt",
+        character_name="GPT",
+        content=f"レス{number}",
+        timestamp=datetime.now(),
+        anchors=[number - 1] if number > 1 else [],
+        response_length=ResponseLength.SHORT
+    )
+
+
+def register_thread(thread_id: str, post_count: int) -> ThreadManager:
+    """生成済みのレスを持つスレッドをスケジューラに登録する（生成は開始しない）"""
+    thread = ThreadManager(title="テスト", max_posts=100, thread_id=thread_id)
+    for number in range(1, post_count + 1):
+        thread._add_post(make_post(number))
+    server.scheduler.register(thread_id, thread)
+    return thread
+
+
+def numbers(response) -> list:
+    return [post["number"] for post in response.json()["posts"]]
+
+
+def test_since_offset_limit():
+    """sinceの後からoffset件読み飛ばし、最大limit件を返す"""
+    register_thread("api_page", 30)
+    client = TestClient(server.app)
+    assert numbers(client.get("/api/thread/api_page")) == list(range(1, 31))
+    assert numbers(client.get("/api/thread/api_page?since=25")) == [26, 27, 28, 29, 30]
+    assert numbers(client.get("/api/thread/api_page?offset=5&limit=3")) == [6, 7, 8]
+    assert numbers(client.get("/api/thread/api_page?since=10&offset=5&limit=3")) == [16, 17, 18]
+    assert numbers(client.get("/api/thread/api_page?since=30")) == []
+
+    body = client.get("/api/thread/api_page?limit=1").json()
+    assert body["current_posts"] == 30 and body["title"] == "テスト", body
+    assert body["posts"][0]["content"] == "レス1" and body["posts"][0]["response_length"] == "SHORT", body
+
+
+def test_etag_not_modified():
+    """内容が変わっていなければ304、レスが増えたら新しい内容を返す"""
+    thread = register_thread("api_etag", 3)
+    client = TestClient(server.app)
+    first = client.get("/api/thread/api_etag?since=1")
+    etag = first.headers["ETag"]
+
+    again = client.get("/api/thread/api_etag?since=1", headers={"If-None-Match": etag})
+    assert again.status_code == 304, again.status_code
+    summary = client.get("/api/thread/api_etag/summary")
+    assert client.get("/api/thread/api_etag/summary",
+                      headers={"If-None-Match": summary.headers["ETag"]}).status_code == 304
+
+    thread._add_post(make_post(4))
+    changed = client.get("/api/thread/api_etag?since=1", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and numbers(changed) == [2, 3, 4], changed.status_code
+    assert changed.headers["ETag"] != etag
+
+
+def test_store_fallback():
+    """メモリにないスレッドはストアから読み、存在しないIDや不正なIDは404"""
+    original = server.thread_store
+    with tempfile.TemporaryDirectory() as directory:
+        store = SQLiteThreadStore(os.path.join(directory, "threads.db"))
+        store.save_thread("api_stored", {
+            "title": "保存済み", "max_posts": 100, "status": "completed",
+            "created_at": datetime.now().isoformat(), "metadata": {}
+        })
+        store.append_posts("api_stored", [make_post(n).to_dict() for n in range(1, 11)])
+        server.thread_store = store
+        try:
+            client = TestClient(server.app)
+            response = client.get("/api/thread/api_stored?since=4&limit=3")
+            assert response.status_code == 200, response.status_code
+            assert numbers(response) == [5, 6, 7]
+            assert response.json()["current_posts"] == 10 and not response.json()["is_running"]
+
+            etag = response.headers["ETag"]
+            assert client.get("/api/thread/api_stored?since=4&limit=3",
+                              headers={"If-None-Match": etag}).status_code == 304
+            assert client.get("/api/thread/missing").status_code == 404
+            assert client.get("/api/thread/..%2F..%2Fetc").status_code == 404
+        finally:
+            server.thread_store = original
+            store.close()
+
+
+def main():
+    print("=" * 60)
+    print("Thread API Regression Test")
+    print("=" * 60)
+
+    tests = [
+        test_since_offset_limit,
+        test_etag_not_modified,
+        test_store_fallback,
+    ]
+
+    failed = 0
+    for test in tests:
+        print(f"\n{test.__name__}")
+        try:
+            test()
+            print("  ✅ PASS")
+        except AssertionError as e:
+            failed += 1
+            print(f"  ❌ FAIL: {e}")
+
+    print(f"\n{'=' * 60}")
+    print(f"📊 Results: {len(tests) - failed}/{len(tests)} passed")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+スレッド配信ハブの回帰テスト
+生成中に途中参加した視聴者・送信が追いつかない視聴者も、
+スナップショット＋以降の差分から組み立てた内容が確定済みのレスと一致することを確認
+（AI APIは呼ばない。少しずつ返す偽のクライアントを使う）
+"""
+
+import asyncio
+import json
+from typing import Dict, List
+
+import thread_manager
+from thread_broadcast import ThreadBroadcaster
+from thread_scheduler import ThreadScheduler
+from ws_outbox import WebSocketOutbox
+
+
+class FakeStreamingClient:
+    """40個のチャンクを少しずつ返すクライアント（生成の呼び出し回数を数える）"""
+
+    calls = 0
+
+    async def generate_response_stream(self, prompt, system_prompt=None, **kwargs):
+        FakeStreamingClient.calls += 1
+        for index in range(40):
+            await asyncio.sleep(0.002)
+            yield f"{index},"
+
+    async def generate_response(self, prompt, system_prompt=None, **kwargs):
+        return "テスト"
+
+
+class RecordingWebSocket:
+    """送られたフレームを記録するだけの接続"""
+
+    def __init__(self):
+        self.frames: List[Dict] = []
+
+    async def send_text(self, text: str):
+        self.frames.append(json.loads(text))
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def rebuild(frames: List[Dict]) -> Dict[int, str]:
+    """クライアント（threadStore）と同じ手順でフレームからレスの本文を組み立てる"""
+    posts: Dict[int, str] = {}
+    for frame in frames:
+        if frame["type"] == "thread_snapshot":
+            posts = {post["number"]: post["content"] for post in frame["posts"]}
+            if frame["streaming"]:
+                posts[frame["streaming"]["post"]["number"]] = frame["streaming"]["content"]
+        elif frame["type"] == "post_start":
+            posts[frame["post"]["number"]] = ""
+        elif frame["type"] == "post_stream":
+            posts[frame["post_number"]] += frame["content_chunk"]
+        elif frame["type"] == "post_complete":
+            number = frame["post"]["number"]
+            assert posts[number] == frame["post"]["content"], (number, posts[number], frame["post"]["content"])
+    return posts
+
+
+def run_thread(viewer_count: int, join_interval: float, max_posts: int = 4):
+    """スレッドを1本生成し、生成中に視聴者を1人ずつ参加させる"""
+    async def scenario():
+        scheduler = ThreadScheduler()
+        manager = thread_manager.ThreadManager(title="テスト", max_posts=max_posts,
+                                               thread_id="broadcast_test", pacing="fast")
+        scheduler.register("broadcast_test", manager)
+        hub = ThreadBroadcaster("broadcast_test", manager)
+
+        websockets = [RecordingWebSocket() for _ in range(viewer_count)]
+        outboxes = [WebSocketOutbox(websocket) for websocket in websockets]
+        hub.join(outboxes[0])
+        scheduler.submit("broadcast_test")
+        for outbox in outboxes[1:]:
+            await asyncio.sleep(join_interval)
+            hub.join(outbox)
+
+        # 送信が追いつかず、スナップショットを送り直される視聴者
+        slow = RecordingWebSocket()
+        slow_outbox = WebSocketOutbox(slow, max_frames=2, slow_policy="snapshot")
+        hub.join(slow_outbox)
+        websockets.append(slow)
+        outboxes.append(slow_outbox)
+
+        while manager.status not in ("completed", "stopped"):
+            await asyncio.sleep(0.01)
+        # 最後のdeltaのまとめ送りと送信キューを待つ
+        await asyncio.sleep(hub.flush_interval + 0.05)
+        for outbox in outboxes:
+            await outbox.flush(timeout=1.0)
+
+        truth = {post.number: post.content for post in manager.posts}
+        views = [rebuild(websocket.frames) for websocket in websockets]
+        hub.close()
+        for outbox in outboxes:
+            await outbox.close()
+        await scheduler.shutdown()
+        return truth, views, slow_outbox.stats
+
+    original = thread_manager.AIClientFactory.get_client
+    thread_manager.AIClientFactory.get_client = staticmethod(lambda character_id: FakeStreamingClient())
+    FakeStreamingClient.calls = 0
+    try:
+        return asyncio.run(scenario())
+    finally:
+        thread_manager.AIClientFactory.get_client = original
+
+
+def test_late_joiners_see_consistent_posts():
+    """生成中のどの時点で参加しても、組み立てた本文が確定済みのレスと一致する"""
+    truth, views, _ = run_thread(viewer_count=20, join_interval=0.007)
+    assert len(truth) == 4, truth
+    for index, view in enumerate(views):
+        assert view == truth, (index, view, truth)
+
+
+def test_one_generation_per_post():
+    """視聴者数によらず、レス1件につき生成は1回だけ"""
+    truth, _, _ = run_thread(viewer_count=20, join_interval=0.003)
+    assert FakeStreamingClient.calls == len(truth), (FakeStreamingClient.calls, len(truth))
+
+
+def test_slow_viewer_recovers_from_snapshot():
+    """送信キューが溢れた視聴者にはスナップショットを送り直し、最終的な内容は一致する"""
+    truth, views, slow_stats = run_thread(viewer_count=1, join_interval=0)
+    assert slow_stats["snapshots"] >= 1, slow_stats
+    assert views[-1] == truth, (views[-1], truth)
+
+
+def main():
+    print("=" * 60)
+    print("Thread Broadcast Regression Test")
+    print("=" * 60)
+
+    tests = [
+        test_late_joiners_see_consistent_posts,
+        test_one_generation_per_post,
+        test_slow_viewer_recovers_from_snapshot,
+    ]
+
+    failed = 0
+    for test in tests:
+        print(f"\n{test.__name__}")
+        try:
+            test()
+            print("  ✅ PASS")
+        except AssertionError as e:
+            failed += 1
+            print(f"  ❌ FAIL: {e}")
+
+    print(f"\n{'=' * 60}")
+    print(f"📊 Results: {len(tests) - failed}/{len(tests)} passed")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
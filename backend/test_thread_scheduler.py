@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+スレッドスケジューラの回帰テスト
+同時実行数・待機数の上限・待ち順の通知・二重起動の防止・TTL / LRUによる破棄を確認
+（AI APIは呼ばない。ThreadManagerの代わりに、終了を外から指示できるスレッドを使う）
+"""
+
+import asyncio
+import time
+from typing import List
+
+from thread_scheduler import QueueFullError, ThreadScheduler
+
+
+class FakeThread:
+    """スケジューラが使うThreadManagerのインターフェースだけを持つスレッド"""
+
+    def __init__(self):
+        self.status = "created"
+        self.posts: List = []
+        self.max_posts = 10
+        self.queue_position = 0
+        self.notified: List[int] = []
+        self.starts = 0
+        self.finish = asyncio.Event()
+
+    def notify_queued(self, position: int):
+        self.status = "queued"
+        if position != self.queue_position:
+            self.queue_position = position
+            self.notified.append(position)
+
+    async def start_thread(self):
+        self.starts += 1
+        self.status = "running"
+        await self.finish.wait()
+        self.status = "completed"
+
+    def stop_thread(self):
+        if self.status == "queued":
+            self.status = "stopped"
+        self.finish.set()
+
+
+def register(scheduler: ThreadScheduler, count: int) -> List[FakeThread]:
+    threads = [FakeThread() for _ in range(count)]
+    for index, thread in enumerate(threads):
+        scheduler.register(f"t{index}", thread)
+    return threads
+
+
+def test_running_cap_and_queue_positions():
+    """上限を超えたスレッドは到着順に待ち、空きができると先頭から開始する"""
+    async def scenario():
+        scheduler = ThreadScheduler(max_running=2)
+        threads = register(scheduler, 4)
+        positions = [scheduler.submit(f"t{index}") for index in range(4)]
+        await asyncio.sleep(0)
+        running_before = scheduler.stats()["running"]
+
+        threads[0].finish.set()
+        await asyncio.sleep(0.01)
+        after = (threads[2].status, scheduler.position("t3"), threads[3].notified)
+
+        for thread in threads:
+            thread.finish.set()
+        await scheduler.shutdown()
+        return positions, running_before, after
+
+    positions, running_before, (third_status, fourth_position, fourth_notified) = asyncio.run(scenario())
+    assert positions == [0, 0, 1, 2], positions
+    assert running_before == 2
+    assert third_status == "running"
+    assert fourth_position == 1 and fourth_notified == [2, 1], fourth_notified
+
+
+def test_priority_and_duplicate_submit():
+    """priorityの小さいスレッドが先に開始し、同じスレッドを二重に開始しない"""
+    async def scenario():
+        scheduler = ThreadScheduler(max_running=1)
+        threads = register(scheduler, 3)
+        scheduler.submit("t0")
+        scheduler.submit("t1")
+        scheduler.submit("t2", priority=-1)
+        # 実行中・待機中のスレッドをもう一度予約しても何も起きない
+        again = (scheduler.submit("t0"), scheduler.submit("t1"))
+        order = (scheduler.position("t2"), scheduler.position("t1"))
+
+        threads[0].finish.set()
+        await asyncio.sleep(0.01)
+        started = [thread.starts for thread in threads]
+
+        for thread in threads:
+            thread.finish.set()
+        await scheduler.shutdown()
+        return again, order, started
+
+    again, order, started = asyncio.run(scenario())
+    assert again == (0, 2), again
+    assert order == (1, 2), order
+    assert started == [1, 0, 1], started
+
+
+def test_stop_queued_thread():
+    """待機中のスレッドを止めると待ち行列から外れ、後ろのスレッドの順番が繰り上がる"""
+    async def scenario():
+        scheduler = ThreadScheduler(max_running=1)
+        threads = register(scheduler, 3)
+        for index in range(3):
+            scheduler.submit(f"t{index}")
+        scheduler.stop("t1")
+        result = (threads[1].status, scheduler.position("t1"), scheduler.position("t2"), scheduler.stats()["queued"])
+
+        for thread in threads:
+            thread.finish.set()
+        await scheduler.shutdown()
+        return result
+
+    status, stopped_position, next_position, queued = asyncio.run(scenario())
+    assert status == "stopped"
+    assert stopped_position == 0 and next_position == 1 and queued == 1
+
+
+def test_ttl_eviction_keeps_running_threads():
+    """TTLを過ぎた放置スレッドは破棄し、実行中のスレッドは残す"""
+    async def scenario():
+        scheduler = ThreadScheduler(max_running=2, thread_ttl=0.05)
+        threads = register(scheduler, 2)
+        scheduler.submit("t1")
+        await asyncio.sleep(0.1)
+        scheduler.evict()
+        retained = set(scheduler.threads)
+
+        threads[1].finish.set()
+        await scheduler.shutdown()
+        return retained
+
+    assert asyncio.run(scenario()) == {"t1"}
+
+
+def test_queue_cap_rejects_new_runs():
+    """待機中のスレッドが上限に達したら、新しい予約はQueueFullErrorで断り、状態を変えない"""
+    async def scenario():
+        scheduler = ThreadScheduler(max_running=1, max_queued=2)
+        threads = register(scheduler, 4)
+        for index in range(3):
+            scheduler.submit(f"t{index}")
+        try:
+            scheduler.submit("t3")
+            rejected = False
+        except QueueFullError:
+            rejected = True
+        result = (rejected, threads[3].status, scheduler.stats()["queued"])
+
+        # 待機中のスレッドが開始されれば、また予約できる
+        threads[0].finish.set()
+        await asyncio.sleep(0.01)
+        position = scheduler.submit("t3")
+
+        for thread in threads:
+            thread.finish.set()
+        await scheduler.shutdown()
+        return result, position
+
+    (rejected, status, queued), position = asyncio.run(scenario())
+    assert rejected and status == "created" and queued == 2, (rejected, status, queued)
+    assert position == 2, position
+
+
+def test_periodic_sweep_evicts_idle_threads():
+    """新しいスレッドが登録されなくても、定期処理がTTLを過ぎたスレッドを破棄する"""
+    async def scenario():
+        scheduler = ThreadScheduler(max_running=1, thread_ttl=0.05, sweep_interval=0.02)
+        register(scheduler, 2)
+        scheduler.start()
+        await asyncio.sleep(0.15)
+        retained = len(scheduler.threads)
+        await scheduler.shutdown()
+        return retained, scheduler._sweeper
+
+    retained, sweeper = asyncio.run(scenario())
+    assert retained == 0, retained
+    assert sweeper is None
+
+
+def test_lru_eviction():
+    """保持数の上限を超えたら、最も長く参照されていないスレッドから破棄する"""
+    scheduler = ThreadScheduler(max_running=1, thread_ttl=3600, max_threads=2)
+    register(scheduler, 2)
+    time.sleep(0.01)
+    scheduler.get("t0")
+    scheduler.register("t2", FakeThread())
+    assert list(scheduler.threads) == ["t0", "t2"], list(scheduler.threads)
+
+
+def main():
+    print("=" * 60)
+    print("Thread Scheduler Regression Test")
+    print("=" * 60)
+
+    tests = [
+        test_running_cap_and_queue_positions,
+        test_priority_and_duplicate_submit,
+        test_stop_queued_thread,
+        test_queue_cap_rejects_new_runs,
+        test_ttl_eviction_keeps_running_threads,
+        test_periodic_sweep_evicts_idle_threads,
+        test_lru_eviction,
+    ]
+
+    failed = 0
+    for test in tests:
+        print(f"\n{test.__name__}")
+        try:
+            test()
+            print("  ✅ PASS")
+        except AssertionError as e:
+            failed += 1
+            print(f"  ❌ FAIL: {e}")
+
+    print(f"\n{'=' * 60}")
+    print(f"📊 Results: {len(tests) - failed}/{len(tests)} passed")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+スレッドストアの回帰テスト
+SQLite / JSONLの両方で、レスの追記・ページング・スレッドの復元ができることを確認
+（AI APIは呼ばない）
+"""
+
+import asyncio
+import os
+import tempfile
+from datetime import datetime
+
+from characters import ResponseLength
+from thread_manager import ThreadManager, Post
+from thread_store import SQLiteThreadStore, JsonlThreadStore, BatchedPostWriter, is_valid_thread_id
+
+
+def make_post(number: int) -> Post:
+    return Post(
+        number=number,
+        character_id="gpt",
+        character_name="GPT",
+        content=f"レス{number}",
+        timestamp=datetime.now(),
+        anchors=[number - 1] if number > 1 else [],
+        response_length=ResponseLength.SHORT
+    )
+
+
+def make_stores(directory: str):
+    return [
+        SQLiteThreadStore(os.path.join(directory, "threads.db")),
+        JsonlThreadStore(os.path.join(directory, "threads"))
+    ]
+
+
+def test_append_and_page():
+    """追記したレスが番号順に、after / limit で取得できる"""
+    with tempfile.TemporaryDirectory() as directory:
+        for store in make_stores(directory):
+            store.append_posts("t1", [make_post(n).to_dict() for n in range(1, 6)])
+            store.append_posts("t1", [make_post(n).to_dict() for n in range(6, 11)])
+
+            assert store.count_posts("t1") == 10, type(store).__name__
+            page = store.load_posts("t1", after=3, limit=4)
+            assert [post["number"] for post in page] == [4, 5, 6, 7], type(store).__name__
+            assert Post.from_dict(page[0]).anchors == [3]
+            store.close()
+
+
+def test_batched_writer_flushes():
+    """バッチサイズに達するか、flushを呼ぶとストアに書き込まれる"""
+    async def scenario(store):
+        writer = BatchedPostWriter(store, "t1", batch_size=3, flush_interval=60)
+        for n in range(1, 5):
+            await writer.add(make_post(n).to_dict())
+        written = store.count_posts("t1")
+        await writer.flush()
+        return written, store.count_posts("t1")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for store in make_stores(directory):
+            assert asyncio.run(scenario(store)) == (3, 4), type(store).__name__
+            store.close()
+
+
+def test_resume_from_store():
+    """途中で止まったスレッドを復元すると、続きから再開できる状態になる"""
+    async def scenario(store):
+        thread_manager = ThreadManager(title="テスト", max_posts=10, thread_id="t1", store=store)
+        thread_manager.metadata = {"scenario_id": 1}
+        thread_manager.status = "running"
+        await thread_manager.save()
+        store.append_posts("t1", [make_post(n).to_dict() for n in range(1, 4)])
+
+        restored = await ThreadManager.from_store("t1", store)
+        missing = await ThreadManager.from_store("unknown", store)
+        return restored, missing
+
+    with tempfile.TemporaryDirectory() as directory:
+        for store in make_stores(directory):
+            restored, missing = asyncio.run(scenario(store))
+            assert missing is None
+            assert restored.title == "テスト" and restored.metadata == {"scenario_id": 1}
+            assert [post.number for post in restored.posts] == [1, 2, 3]
+            assert restored.status == "stopped", type(store).__name__
+            store.close()
+
+
+def test_rejects_path_like_thread_ids():
+    """ストアのディレクトリの外を指すスレッドIDはファイルに使わない"""
+    assert is_valid_thread_id("3f2b8c4e-1d2a-4b7e-9c1f-0a2b3c4d5e6f")
+    assert is_valid_thread_id("demo_scenario_1_20250101_000000")
+    for thread_id in ("../x", "..", "a/b", "a\\b", "", "x" * 129):
+        assert not is_valid_thread_id(thread_id), thread_id
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = JsonlThreadStore(os.path.join(directory, "threads"))
+        try:
+            store.append_posts("../escaped", [make_post(1).to_dict()])
+            assert False, "path traversal was not rejected"
+        except ValueError:
+            pass
+        assert not os.path.exists(os.path.join(directory, "escaped.jsonl"))
+        store.close()
+
+
+def main():
+    print("=" * 60)
+    print("Thread Store Regression Test")
+    print("=" * 60)
+
+    tests = [
+        test_append_and_page,
+        test_batched_writer_flushes,
+        test_resume_from_store,
+        test_rejects_path_like_thread_ids,
+    ]
+
+    failed = 0
+    for test in tests:
+        print(f"\n{test.__name__}")
+        try:
+            test()
+            print("  ✅ PASS")
+        except AssertionError as e:
+            failed += 1
+            print(f"  ❌ FAIL: {e}")
+
+    print(f"\n{'=' * 60}")
+    print(f"📊 Results: {len(tests) - failed}/{len(tests)} passed")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+WebSocket送信キューの回帰テスト
+遅いクライアントに対する送り直し（snapshot）と切断（disconnect）を確認
+（実際のWebSocketは使わず、受信を止められる偽の接続を使う）
+"""
+
+import asyncio
+import json
+from typing import List, Optional
+
+from ws_outbox import CLOSE_CODE_SLOW_CONSUMER, WebSocketOutbox
+
+
+class SlowWebSocket:
+    """gateが開くまでsend_textを返さない接続"""
+
+    def __init__(self):
+        self.sent: List[str] = []
+        self.gate = asyncio.Event()
+        self.close_code: Optional[int] = None
+
+    async def send_text(self, text: str):
+        await self.gate.wait()
+        self.sent.append(text)
+
+    async def close(self, code: int = 1000):
+        self.close_code = code
+
+
+def test_frames_are_sent_in_order():
+    """受信が追いついていればフレームは積んだ順に届く（dictはJSON、strはそのまま）"""
+    async def scenario():
+        websocket = SlowWebSocket()
+        websocket.gate.set()
+        outbox = WebSocketOutbox(websocket, max_frames=10, slow_policy="snapshot")
+        outbox.send({"type": "post_start", "post_number": 1})
+        outbox.send('{"type":"post_complete"}')
+        await outbox.flush(timeout=1.0)
+        await outbox.close()
+        return websocket.sent
+
+    sent = asyncio.run(scenario())
+    assert [json.loads(text)["type"] for text in sent] == ["post_start", "post_complete"], sent
+
+
+def test_slow_consumer_gets_snapshot():
+    """キューが溢れたら溜まったフレームを捨て、スナップショットの後に新しいフレームだけを送る"""
+    async def scenario():
+        websocket = SlowWebSocket()
+        state = {"version": 0}
+        outbox = WebSocketOutbox(
+            websocket, max_frames=3, slow_policy="snapshot",
+            snapshot=lambda: [{"type": "thread_snapshot", "version": state["version"]}],
+        )
+        # 最初のフレームは送信中のまま止まる
+        outbox.send({"type": "delta", "n": 0})
+        await asyncio.sleep(0)
+        for n in range(1, 10):
+            state["version"] = n
+            outbox.send({"type": "delta", "n": n})
+
+        websocket.gate.set()
+        await outbox.flush(timeout=1.0)
+        state["version"] = 10
+        outbox.send({"type": "delta", "n": 10})
+        await outbox.flush(timeout=1.0)
+        await outbox.close()
+        return websocket.sent, outbox.stats
+
+    sent, stats = asyncio.run(scenario())
+    frames = [json.loads(text) for text in sent]
+    assert frames == [
+        {"type": "delta", "n": 0},
+        {"type": "thread_snapshot", "version": 9},
+        {"type": "delta", "n": 10},
+    ], frames
+    assert stats["snapshots"] == 1, stats
+
+
+def test_control_frames_survive_snapshot():
+    """溢れて送り直すときも、controlフレーム（終了通知など）は捨てずにスナップショットより前に送る"""
+    async def scenario():
+        websocket = SlowWebSocket()
+        outbox = WebSocketOutbox(
+            websocket, max_frames=3, slow_policy="snapshot",
+            snapshot=lambda: [{"type": "thread_snapshot", "status": "completed"}],
+        )
+        outbox.send({"type": "delta", "n": 0})
+        await asyncio.sleep(0)
+        outbox.send({"type": "thread_started"}, control=True)
+        for n in range(1, 10):
+            outbox.send({"type": "delta", "n": n})
+        # 送り直し待ちの間に届いた終了通知
+        outbox.send({"type": "thread_completed"}, control=True)
+
+        websocket.gate.set()
+        await outbox.flush(timeout=1.0)
+        await outbox.close()
+        return [json.loads(text)["type"] for text in websocket.sent]
+
+    types = asyncio.run(scenario())
+    assert types == ["delta", "thread_started", "thread_completed", "thread_snapshot"], types
+
+
+def test_slow_consumer_disconnect():
+    """disconnectでは溢れた時点で1013で閉じ、以降のフレームは積まない"""
+    async def scenario():
+        websocket = SlowWebSocket()
+        outbox = WebSocketOutbox(websocket, max_frames=2, slow_policy="disconnect")
+        for n in range(5):
+            outbox.send({"type": "delta", "n": n})
+        await asyncio.sleep(0.01)
+        websocket.gate.set()
+        await asyncio.sleep(0.01)
+        return websocket, outbox
+
+    websocket, outbox = asyncio.run(scenario())
+    assert outbox.closed
+    assert websocket.close_code == CLOSE_CODE_SLOW_CONSUMER, websocket.close_code
+    assert websocket.sent == [], websocket.sent
+
+
+def test_unknown_policy_is_rejected():
+    """未知のポリシーは設定ミスとして起動時にエラーにする"""
+    async def scenario():
+        WebSocketOutbox(SlowWebSocket(), slow_policy="drop")
+
+    try:
+        asyncio.run(scenario())
+    except ValueError:
+        return
+    raise AssertionError("ValueError was not raised")
+
+
+def main():
+    print("=" * 60)
+    print("WebSocket Outbox Regression Test")
+    print("=" * 60)
+
+    tests = [
+        test_frames_are_sent_in_order,
+        test_slow_consumer_gets_snapshot,
+        test_control_frames_survive_snapshot,
+        test_slow_consumer_disconnect,
+        test_unknown_policy_is_rejected,
+    ]
+
+    failed = 0
+    for test in tests:
+        print(f"\n{test.__name__}")
+        try:
+            test()
+            print("  ✅ PASS")
+        except AssertionError as e:
+            failed += 1
+            print(f"  ❌ FAIL: {e}")
+
+    print(f"\n{'=' * 60}")
+    print(f"📊 Results: {len(tests) - failed}/{len(tests)} passed")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional
+
+from characters import CHARACTERS
+from thread_manager import Post, ThreadManager
+from ws_outbox import WebSocketOutbox, encode_frame
+
+logger = logging.getLogger(__name__)
+
+def post_header(post: Post) -> Dict:
+    """post_startで送るレスのヘッダ情報"""
+    return {
+        "number": post.number,
+        "character_id": post.character_id,
+        "character_name": post.character_name,
+        "timestamp": post.timestamp.isoformat(),
+        "character_color": CHARACTERS[post.character_id].color
+    }
+
+def post_body(post: Post) -> Dict:
+    """post_completeで送る確定済みレス"""
+    return {
+        "number": post.number,
+        "character_id": post.character_id,
+        "character_name": post.character_name,
+        "content": post.content,
+        "timestamp": post.timestamp.isoformat(),
+        "anchors": post.anchors,
+        "character_color": CHARACTERS[post.character_id].color
+    }
+
+def thread_snapshot(thread_id: str, thread_manager: ThreadManager) -> Dict:
+    """スレッドの現在の状態（確定済みのレスと、生成中のレスのここまでの本文）"""
+    streaming = thread_manager.streaming_post()
+    return {
+        "type": "thread_snapshot",
+        "thread_id": thread_id,
+        "title": thread_manager.title,
+        "max_posts": thread_manager.max_posts,
+        "status": thread_manager.status,
+        "queue_position": thread_manager.queue_position if thread_manager.status == "queued" else None,
+        "posts": [post_body(post) for post in thread_manager.posts],
+        "streaming": {"post": post_header(streaming[0]), "content": streaming[1]} if streaming else None
+    }
+
+class ThreadBroadcaster:
+    """
+    1つのスレッドを視聴している全接続への配信ハブ
+    ThreadManagerへの登録は視聴者数によらず1つで、各イベントはここで1回だけJSONにして
+    各接続の送信キュー（WebSocketOutbox）に積む。表示中のレスのdeltaは
+    flush_interval 秒または flush_bytes バイトまでまとめてから1フレームにする。
+    途中から視聴を始めた接続には現在の状態（thread_snapshot）を送り、以降は差分だけを送る。
+    """
+
+    def __init__(self, thread_id: str, thread_manager: ThreadManager,
+                 flush_interval: Optional[float] = None, flush_bytes: Optional[int] = None):
+        self.thread_id = thread_id
+        self.thread_manager = thread_manager
+        self.flush_interval = flush_interval if flush_interval is not None else \
+            float(os.getenv("WS_FLUSH_MS", "50")) / 1000
+        self.flush_bytes = flush_bytes or int(os.getenv("WS_FLUSH_BYTES", "4096"))
+        self.viewers: List[WebSocketOutbox] = []
+        self.stats = {"events": 0, "frames": 0, "deliveries": 0}
+
+        # まとめて配信する前のdelta
+        self._delta_number: Optional[int] = None
+        self._delta_chunks: List[str] = []
+        self._delta_bytes = 0
+        self._flush_timer: Optional[asyncio.TimerHandle] = None
+
+        # イベントは発生時にその場で処理する（スナップショットと配信済みの差分がずれないように）
+        thread_manager.add_listener(self._on_event)
+
+    def join(self, outbox: WebSocketOutbox):
+        """視聴者を追加して現在の状態を送る（送信が追いつかなくなったときもスナップショットを送り直す）"""
+        outbox.snapshot = self.snapshot
+        for frame in self.snapshot():
+            outbox.send(frame)
+        self.viewers.append(outbox)
+
+    def leave(self, outbox: WebSocketOutbox) -> int:
+        """視聴者を外し、残りの視聴者数を返す"""
+        if outbox in self.viewers:
+            self.viewers.remove(outbox)
+        return len(self.viewers)
+
+    def snapshot(self) -> List[str]:
+        """現在の状態をJSONにしたフレーム（まとめ中のdeltaは先に配信し、後から重ねて送らないようにする）"""
+        self._flush_delta()
+        return [encode_frame(thread_snapshot(self.thread_id, self.thread_manager))]
+
+    def _broadcast(self, frame: Dict, control: bool = False):
+        text = encode_frame(frame)
+        self.stats["frames"] += 1
+        for outbox in self.viewers:
+            outbox.send(text, control)
+        self.stats["deliveries"] += len(self.viewers)
+
+    def _flush_delta(self):
+        if self._flush_timer:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if not self._delta_chunks:
+            return
+        self._broadcast({
+            "type": "post_stream",
+            "post_number": self._delta_number,
+            "content_chunk": "".join(self._delta_chunks)
+        })
+        self._delta_chunks = []
+        self._delta_bytes = 0
+
+    def _on_event(self, event: Dict):
+        try:
+            self._handle(event)
+        except Exception as e:
+            # 配信の失敗でスレッドの生成を止めない
+            logger.error(f"Broadcast error for thread {self.thread_id}: {str(e)}")
+
+    def _handle(self, event: Dict):
+        """ThreadManagerのイベントをクライアント向けのフレームにして配信"""
+        self.stats["events"] += 1
+        if event["type"] == "post_delta":
+            if event["number"] != self._delta_number:
+                self._flush_delta()
+                self._delta_number = event["number"]
+            if not self._delta_chunks:
+                self._flush_timer = asyncio.get_running_loop().call_later(self.flush_interval, self._flush_delta)
+            self._delta_chunks.append(event["delta"])
+            self._delta_bytes += len(event["delta"].encode())
+            if self._delta_bytes >= self.flush_bytes:
+                self._flush_delta()
+            return
+
+        # 他のイベントより前にdeltaを送って順序を保つ
+        self._flush_delta()
+        if event["type"] == "queued":
+            self._broadcast({"type": "queued", "thread_id": self.thread_id, "position": event["position"]})
+        elif event["type"] == "title":
+            self._broadcast({"type": "thread_title_updated", "title": event["title"]})
+        elif event["type"] == "post_start":
+            self._broadcast({"type": "post_start", "post": post_header(event["post"])})
+        elif event["type"] == "post_complete":
+            self._broadcast({"type": "post_complete", "post": post_body(event["post"])})
+        elif event["type"] == "completed":
+            # 終了通知はスナップショットを送り直す場合も捨てない
+            self._broadcast({
+                "type": "thread_completed",
+                "thread_id": self.thread_id,
+                "total_posts": len(self.thread_manager.posts)
+            }, control=True)
+
+    def close(self):
+        """配信を止めてThreadManagerへの登録を解除"""
+        self.thread_manager.remove_listener(self._on_event)
+        if self._flush_timer:
+            self._flush_timer.cancel()
+            self._flush_timer = None
@@ -1,12 +1,17 @@
 import asyncio
+import json
+import os
 import random
 import logging
-from typing import List, Dict, Optional
+from collections import deque
+from typing import Callable, Deque, List, Dict, Optional, Tuple
 from datetime import datetime
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from ai_clients import AIClientFactory
 from characters import CHARACTERS, ResponseLength, select_response_length
+from thread_store import ThreadStore, BatchedPostWriter
+from pacing import PacingPolicy, get_pacing
 
 logger = logging.getLogger(__name__)
 
@@ -20,48 +25,226 @@ class Post:
     timestamp: datetime
     anchors: List[int]
     response_length: ResponseLength
+    
+    def to_dict(self) -> Dict:
+        return {
+            "number": self.number,
+            "character_id": self.character_id,
+            "character_name": self.character_name,
+            "content": self.content,
+            "timestamp": self.timestamp.isoformat(),
+            "anchors": self.anchors,
+            "response_length": self.response_length.name
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Post":
+        return cls(
+            number=data["number"],
+            character_id=data["character_id"],
+            character_name=data["character_name"],
+            content=data["content"],
+            timestamp=datetime.fromisoformat(data["timestamp"]),
+            anchors=list(data["anchors"]),
+            response_length=ResponseLength[data["response_length"]]
+        )
+
+@dataclass
+class PendingPost:
+    """生成中のレス（先読みで生成を始めたものを含む）"""
+    character_id: str
+    anchors: List[int]
+    response_length: ResponseLength
+    prompt: str
+    system_prompt: str
+    # 生成を始めた時点のレス数（プロンプトに含まれている文脈）
+    context_size: int
+    chunks: List[str] = field(default_factory=list)
+    # 表示を始めた（post_startを配信した）時点で割り当てる
+    post: Optional[Post] = None
+    task: Optional[asyncio.Task] = None
+    
+    @property
+    def prefix(self) -> str:
+        return f">>{self.anchors[0]} " if self.anchors else ""
 
 class ThreadManager:
     """スレッド全体を管理"""
     
-    def __init__(self, title: str = "", max_posts: int = 100):
+    def __init__(self, title: str = "", max_posts: int = 100,
+                 thread_id: Optional[str] = None, store: Optional[ThreadStore] = None,
+                 lookahead: Optional[int] = None, max_staleness: Optional[int] = None,
+                 stale_policy: Optional[str] = None, pacing: Optional[str] = None):
         self.title = title
         self.max_posts = max_posts
+        # レス間の待機（realtime / fast / replay）
+        self.pacing: PacingPolicy = get_pacing(pacing or os.getenv("THREAD_PACING", "realtime"))
+        
+        # 先読み生成：表示中のレスの生成と並行して、次のlookahead件の生成を始める
+        # 生成開始後にmax_stalenessを超えるレスが追加されたものは古い文脈で書かれているとみなし、
+        # stale_policyに従って作り直す（regenerate）か捨てる（discard）
+        self.lookahead = lookahead if lookahead is not None else int(os.getenv("THREAD_LOOKAHEAD", "0"))
+        if max_staleness is None:
+            # 空の値（.env.exampleの行をそのまま有効にした場合）も未設定として扱う
+            max_staleness = int(os.getenv("THREAD_MAX_STALENESS") or max(1, self.lookahead))
+        self.max_staleness = max_staleness
+        self.stale_policy = stale_policy or os.getenv("THREAD_STALE_POLICY", "regenerate")
+        if self.stale_policy not in ("regenerate", "discard"):
+            raise ValueError(f"Unknown stale policy: {self.stale_policy}")
         self.posts: List[Post] = []
         self.is_running = False
+        # created / queued / running / completed / stopped
+        self.status = "created"
+        self.queue_position = 0
+        self.created_at = datetime.now()
+        # シナリオ名など、スレッドと一緒に保存する任意の情報
+        self.metadata: Dict = {}
         
         self.participating_characters = ["grok", "gpt", "claude", "gemini", "nanashi"]
         
-    async def start_thread(self):
-        """スレッドを開始"""
-        self.is_running = True
+        # イベント（タイトル更新・レスのストリーム・完了）を発生時にその場で受け取る関数（配信ハブなど）
+        self._listeners: List[Callable[[Dict], None]] = []
+        # 表示中（post_start配信後、未確定）のレス
+        self._streaming: Optional[PendingPost] = None
         
-        if not self.title:
-            self.title = await self._generate_thread_title()
+        # 確定済みのレスは変更されないので、追加時にJSONにした結果をキャッシュする（self.postsと同じ並び）
+        self._post_json: List[str] = []
         
-        await self._create_post("grok", is_first=True)
+        # 永続化（storeを指定した場合のみ。レスはまとめて追記する）
+        self.thread_id = thread_id
+        self.store = store
+        self._writer = BatchedPostWriter(store, thread_id) if store and thread_id else None
+    
+    @classmethod
+    async def from_store(cls, thread_id: str, store: ThreadStore) -> Optional["ThreadManager"]:
+        """保存済みのスレッドを復元（存在しなければNone）"""
+        thread = await asyncio.to_thread(store.load_thread, thread_id)
+        if thread is None:
+            return None
         
-        consecutive_errors = 0
-        max_consecutive_errors = 5
+        thread_manager = cls(title=thread["title"], max_posts=thread["max_posts"], thread_id=thread_id, store=store)
+        thread_manager.created_at = datetime.fromisoformat(thread["created_at"])
+        thread_manager.metadata = thread.get("metadata", {})
+        posts = await asyncio.to_thread(store.load_posts, thread_id)
+        for post in posts:
+            thread_manager._add_post(Post.from_dict(post))
         
-        while self.is_running and len(self.posts) < self.max_posts:
-            next_character = self._select_next_character()
-            post = await self._create_post(next_character)
+        thread_manager.status = cls.restored_status(thread["status"], len(thread_manager.posts), thread["max_posts"])
+        return thread_manager
+    
+    @staticmethod
+    def restored_status(stored_status: str, post_count: int, max_posts: int) -> str:
+        """
+        保存済みスレッドの状態
+        実行中にプロセスが終了したスレッドは停止扱いにして、続きから再開できるようにする
+        """
+        if post_count >= max_posts:
+            return "completed"
+        if post_count or stored_status == "stopped":
+            return "stopped"
+        return "created"
+    
+    async def save(self):
+        """スレッド情報を保存（レスは生成のたびに追記される）"""
+        if self.store is None or self.thread_id is None:
+            return
+        try:
+            await asyncio.to_thread(self.store.save_thread, self.thread_id, {
+                "title": self.title,
+                "max_posts": self.max_posts,
+                "status": self.status,
+                "created_at": self.created_at.isoformat(),
+                "metadata": self.metadata
+            })
+        except Exception as e:
+            logger.error(f"Failed to save thread {self.thread_id}: {str(e)}")
+    
+    def add_listener(self, listener: Callable[[Dict], None]):
+        """
+        イベントを受け取る関数を登録（イベントの発生時に呼ばれる）
+        呼び出し時点で、スレッドの状態はそのイベントまでを反映している
+        """
+        self._listeners.append(listener)
+    
+    def remove_listener(self, listener: Callable[[Dict], None]):
+        """登録した関数を解除"""
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+    
+    def notify_queued(self, position: int):
+        """実行待ちであることと待ち順を通知"""
+        self.status = "queued"
+        if position != self.queue_position:
+            self.queue_position = position
+            self._publish({"type": "queued", "position": position})
+    
+    def _publish(self, event: Dict):
+        """登録された全ての関数にイベントを配信"""
+        for listener in list(self._listeners):
+            listener(event)
+        
+    async def start_thread(self):
+        """スレッドを開始"""
+        self.is_running = True
+        self.status = "running"
+        self.queue_position = 0
+        pipeline: Deque[PendingPost] = deque()
+        
+        try:
+            if not self.title:
+                self.title = await self._generate_thread_title()
+                self._publish({"type": "title", "title": self.title})
+            await self.save()
+            
+            # 停止したスレッドを再開する場合は1レス目を作り直さない
+            if not self.posts:
+                await self._create_post("grok", is_first=True)
+            
+            consecutive_errors = 0
+            max_consecutive_errors = 5
             
-            if post is None:
-                consecutive_errors += 1
-                logger.warning(f"Failed to create post. Consecutive errors: {consecutive_errors}")
+            while self.is_running and len(self.posts) < self.max_posts:
+                # 表示するレスと先読み分の生成を開始
+                while (len(pipeline) < 1 + self.lookahead
+                       and len(self.posts) + len(pipeline) < self.max_posts):
+                    pipeline.append(self._launch_post(self._select_next_character(), ahead=len(pipeline)))
+                
+                pending = pipeline.popleft()
+                if len(self.posts) - pending.context_size > self.max_staleness:
+                    pending.task.cancel()
+                    if self.stale_policy == "discard":
+                        logger.info(f"Discarding stale post by {pending.character_id}")
+                        continue
+                    logger.info(f"Regenerating stale post by {pending.character_id}")
+                    pending = self._launch_post(pending.character_id)
+                
+                post = await self._finish_post(pending)
                 
-                if consecutive_errors >= max_consecutive_errors:
-                    logger.error(f"Too many consecutive errors ({consecutive_errors}). Stopping thread.")
-                    self.is_running = False
-                    break
+                if post is None:
+                    consecutive_errors += 1
+                    logger.warning(f"Failed to create post. Consecutive errors: {consecutive_errors}")
                     
-                # エラー時は少し長めに待機
-                await asyncio.sleep(5)
-            else:
-                consecutive_errors = 0  # 成功したらカウンタをリセット
-                await asyncio.sleep(random.uniform(2, 5))
+                    if consecutive_errors >= max_consecutive_errors:
+                        logger.error(f"Too many consecutive errors ({consecutive_errors}). Stopping thread.")
+                        break
+                        
+                    # エラー時は少し長めに待機
+                    await asyncio.sleep(self.pacing.error_delay)
+                else:
+                    consecutive_errors = 0  # 成功したらカウンタをリセット
+                    await asyncio.sleep(self.pacing.post_interval())
+        finally:
+            # 停止時に残っている先読み分は破棄
+            for pending in pipeline:
+                pending.task.cancel()
+            await asyncio.gather(*[pending.task for pending in pipeline], return_exceptions=True)
+            
+            self.is_running = False
+            self.status = "completed" if len(self.posts) >= self.max_posts else "stopped"
+            self._publish({"type": "completed", "total_posts": len(self.posts)})
+            if self._writer:
+                await self._writer.flush()
+            await self.save()
     
     def _select_next_character(self) -> str:
         """次に発言するキャラクターを選択"""
@@ -82,77 +265,119 @@ class ThreadManager:
         )[0]
     
     async def _create_post(self, character_id: str, is_first: bool = False):
-        """レスを作成"""
+        """レスを作成（先読みせずに1件だけ生成）"""
         try:
-            character = CHARACTERS[character_id]
-            post_number = len(self.posts) + 1
-            
-            client = AIClientFactory.get_client(character_id)
-            
-            response_length = select_response_length(post_number)
-            
-            # レスポンスの長さをプロンプトで指定
-            if response_length == ResponseLength.SHORT:
-                length_instruction = "50文字程度で短く返答してください。"
-            elif response_length == ResponseLength.MEDIUM:
-                length_instruction = "150文字程度で返答してください。"
-            else:  # LONG
-                length_instruction = "300文字程度で熱く語ってください。"
-            
-            anchors = []
-            if not is_first and self.posts and random.random() < 0.3:
-                recent_posts = self.posts[-5:]
-                anchor_target = random.choice(recent_posts)
-                anchors = [anchor_target.number]
-            
-            prompt = self._build_prompt(character_id, anchors, is_first, length_instruction)
-            
-            system_prompt = character.get_system_prompt(thread_context=self.title)
-            
-            # エラーハンドリングを追加
-            retry_count = 0
-            max_retries = 3
-            
-            while retry_count < max_retries:
-                try:
-                    content = await client.generate_response(
-                        prompt=prompt,
-                        system_prompt=system_prompt
-                        # max_tokensは省略（デフォルト100000）
-                    )
-                    break
-                except Exception as e:
-                    retry_count += 1
-                    logger.warning(f"API error for {character_id} (attempt {retry_count}/{max_retries}): {str(e)}")
-                    
-                    if retry_count >= max_retries:
-                        # フォールバックレスポンス
-                        logger.error(f"Failed to generate response for {character_id} after {max_retries} attempts")
-                        content = "なるほど、そういう考え方もありますね。"
-                    else:
-                        # リトライ前に少し待機
-                        await asyncio.sleep(2 * retry_count)
-            
-            if anchors:
-                content = f">>{anchors[0]} {content}"
-            
+            pending = self._launch_post(character_id, is_first=is_first)
+        except Exception as e:
+            logger.error(f"Critical error in _create_post for {character_id}: {str(e)}")
+            return None
+        return await self._finish_post(pending)
+    
+    def _launch_post(self, character_id: str, is_first: bool = False, ahead: int = 0) -> PendingPost:
+        """
+        現時点の文脈でプロンプトを組み立て、レスの生成を開始する
+        aheadは表示待ちのレスの数（先読みの場合は1以上）
+        """
+        character = CHARACTERS[character_id]
+        
+        response_length = select_response_length(len(self.posts) + ahead + 1)
+        
+        # レスポンスの長さをプロンプトで指定
+        if response_length == ResponseLength.SHORT:
+            length_instruction = "50文字程度で短く返答してください。"
+        elif response_length == ResponseLength.MEDIUM:
+            length_instruction = "150文字程度で返答してください。"
+        else:  # LONG
+            length_instruction = "300文字程度で熱く語ってください。"
+        
+        anchors = []
+        if not is_first and self.posts and random.random() < 0.3:
+            recent_posts = self.posts[-5:]
+            anchor_target = random.choice(recent_posts)
+            anchors = [anchor_target.number]
+        
+        pending = PendingPost(
+            character_id=character_id,
+            anchors=anchors,
+            response_length=response_length,
+            prompt=self._build_prompt(character_id, anchors, is_first, length_instruction),
+            system_prompt=character.get_system_prompt(thread_context=self.title),
+            context_size=len(self.posts)
+        )
+        pending.task = asyncio.create_task(self._generate_content(pending))
+        return pending
+    
+    async def _generate_content(self, pending: PendingPost) -> str:
+        """レス本文を生成（表示中ならdeltaを配信し、先読み中は表示されるまでためておく）"""
+        client = AIClientFactory.get_client(pending.character_id)
+        
+        # エラーハンドリングを追加
+        retry_count = 0
+        max_retries = 3
+        
+        while retry_count < max_retries:
+            pending.chunks = []
+            try:
+                async for delta in client.generate_response_stream(
+                    prompt=pending.prompt,
+                    system_prompt=pending.system_prompt
+                    # max_tokensは省略（デフォルト100000）
+                ):
+                    pending.chunks.append(delta)
+                    if pending.post is not None:
+                        self._publish({"type": "post_delta", "number": pending.post.number, "delta": delta})
+                return "".join(pending.chunks)
+            except Exception as e:
+                retry_count += 1
+                logger.warning(f"API error for {pending.character_id} (attempt {retry_count}/{max_retries}): {str(e)}")
+                
+                if retry_count < max_retries:
+                    # リトライ前に少し待機
+                    await asyncio.sleep(2 * retry_count)
+        
+        # フォールバックレスポンス
+        logger.error(f"Failed to generate response for {pending.character_id} after {max_retries} attempts")
+        return "なるほど、そういう考え方もありますね。"
+    
+    async def _finish_post(self, pending: PendingPost) -> Optional[Post]:
+        """レスを表示して生成の完了を待ち、スレッドに追加する"""
+        try:
+            character = CHARACTERS[pending.character_id]
             post = Post(
-                number=post_number,
-                character_id=character_id,
+                number=len(self.posts) + 1,
+                character_id=pending.character_id,
                 character_name=character.name,
-                content=content,
+                content="",
                 timestamp=datetime.now(),
-                anchors=anchors,
-                response_length=response_length
+                anchors=pending.anchors,
+                response_length=pending.response_length
             )
+            pending.post = post
+            self._streaming = pending
+            self._publish({"type": "post_start", "post": post})
+            
+            # 先読み中に生成済みの部分はまとめて配信
+            buffered = pending.prefix + "".join(pending.chunks)
+            if buffered:
+                self._publish({"type": "post_delta", "number": post.number, "delta": buffered})
             
-            self.posts.append(post)
+            content = await pending.task
+            
+            # ストリーム途中でリトライした場合も、確定した内容はpost_completeで送られる
+            post.content = pending.prefix + content
+            
+            self._add_post(post)
+            self._publish({"type": "post_complete", "post": post})
+            if self._writer:
+                await self._writer.add(post.to_dict())
             return post
             
         except Exception as e:
-            logger.error(f"Critical error in _create_post for {character_id}: {str(e)}")
+            logger.error(f"Critical error in _finish_post for {pending.character_id}: {str(e)}")
             # エラーが発生してもスレッドは継続
             return None
+        finally:
+            self._streaming = None
     
     def _build_prompt(self, character_id: str, anchors: List[int], is_first: bool, length_instruction: str) -> str:
         """キャラクター用のプロンプトを構築"""
@@ -203,24 +428,42 @@ class ThreadManager:
     def stop_thread(self):
         """スレッドを停止"""
         self.is_running = False
+        if self.status == "queued":
+            # 開始前に停止された場合は、待機中の視聴者に完了を通知する
+            self.status = "stopped"
+            self._publish({"type": "completed", "total_posts": len(self.posts)})
     
-    def to_dict(self) -> Dict:
-        """スレッド情報を辞書形式で返す"""
+    def streaming_post(self) -> Optional[Tuple[Post, str]]:
+        """表示中のレスと、そこまでに生成された本文（途中から接続したクライアントへの送り直し用）"""
+        pending = self._streaming
+        if pending is None or pending.post is None:
+            return None
+        return pending.post, pending.prefix + "".join(pending.chunks)
+    
+    def summary(self) -> Dict:
+        """レス本文を含まないスレッド情報"""
         return {
             "title": self.title,
             "max_posts": self.max_posts,
             "current_posts": len(self.posts),
             "is_running": self.is_running,
-            "posts": [
-                {
-                    "number": post.number,
-                    "character_id": post.character_id,
-                    "character_name": post.character_name,
-                    "content": post.content,
-                    "timestamp": post.timestamp.isoformat(),
-                    "anchors": post.anchors,
-                    "response_length": post.response_length.name
-                }
-                for post in self.posts
-            ]
+            "status": self.status
+        }
+    
+    def _add_post(self, post: Post):
+        """確定したレスを追加し、JSONにした結果をキャッシュする"""
+        self.posts.append(post)
+        self._post_json.append(json.dumps(post.to_dict(), ensure_ascii=False))
+    
+    def posts_page(self, after: int = 0, limit: Optional[int] = None) -> List[str]:
+        """レス番号がafterより大きいレスを最大limit件、JSONにした状態で返す"""
+        # レス番号は1からの連番なので、afterはそのままリストの位置になる
+        end = len(self._post_json) if limit is None else after + limit
+        return self._post_json[after:end]
+    
+    def to_dict(self) -> Dict:
+        """スレッド情報を辞書形式で返す"""
+        return {
+            **self.summary(),
+            "posts": [post.to_dict() for post in self.posts]
         }
\ No newline at end of file
@@ -0,0 +1,190 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from thread_manager import ThreadManager
+
+logger = logging.getLogger(__name__)
+
+class QueueFullError(Exception):
+    """待機中のスレッドが上限に達していて、実行を予約できない"""
+    pass
+
+class ThreadScheduler:
+    """
+    スレッドの同時実行数を制限するスケジューラ
+    上限を超えたスレッドは優先度順（同順位はFIFO）で最大max_queued件まで待機させ、
+    終了・放置されたスレッドはTTLとLRUで破棄する（TTLはstartで開始する定期処理でも確認する）
+    """
+
+    def __init__(self, max_running: Optional[int] = None, thread_ttl: Optional[float] = None,
+                 max_threads: Optional[int] = None, max_queued: Optional[int] = None,
+                 sweep_interval: Optional[float] = None):
+        self.max_running = max_running or int(os.getenv("MAX_RUNNING_THREADS", "3"))
+        self.thread_ttl = thread_ttl or float(os.getenv("THREAD_TTL_SECONDS", "3600"))
+        self.max_threads = max_threads or int(os.getenv("MAX_RETAINED_THREADS", "100"))
+        self.max_queued = max_queued or int(os.getenv("MAX_QUEUED_THREADS", "100"))
+        self.sweep_interval = sweep_interval or float(os.getenv("THREAD_SWEEP_SECONDS", "60"))
+
+        # 参照順に並べたスレッド（先頭が最も長く使われていない）
+        self.threads: "OrderedDict[str, ThreadManager]" = OrderedDict()
+        self._idle_since: Dict[str, float] = {}
+        self._pending: List[Tuple[int, int, str]] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._sequence = itertools.count()
+        self._sweeper: Optional[asyncio.Task] = None
+
+    def start(self):
+        """TTLを過ぎたスレッドを定期的に破棄する（新しいスレッドが来ない間もメモリに残さないように）"""
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep())
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                self.evict()
+            except Exception as e:
+                logger.error(f"Thread sweep failed: {str(e)}")
+
+    def register(self, thread_id: str, thread_manager: ThreadManager):
+        """スレッドを登録（開始はsubmitで行う）"""
+        self.evict(reserve=1)
+        self.threads[thread_id] = thread_manager
+        self._idle_since[thread_id] = time.monotonic()
+
+    def get(self, thread_id: str) -> Optional[ThreadManager]:
+        """スレッドを取得（LRUの参照順を更新）"""
+        thread_manager = self.threads.get(thread_id)
+        if thread_manager is not None:
+            self.threads.move_to_end(thread_id)
+            if thread_id in self._idle_since:
+                self._idle_since[thread_id] = time.monotonic()
+        return thread_manager
+
+    def submit(self, thread_id: str, priority: int = 0) -> int:
+        """
+        スレッドの実行を予約し、待ち順を返す（0はすでに実行中・実行済み）
+        priorityが小さいほど先に実行される
+        空きがなく待機中のスレッドがmax_queued件あればQueueFullError
+        """
+        thread_manager = self.threads[thread_id]
+
+        # 同じスレッドを二重に生成しない（停止済みのスレッドは続きから再開する）
+        resumable = thread_manager.status == "stopped" and len(thread_manager.posts) < thread_manager.max_posts
+        if thread_manager.status == "created" or resumable:
+            if len(self._running) >= self.max_running and self.stats()["queued"] >= self.max_queued:
+                raise QueueFullError(f"{self.max_queued} threads are already waiting")
+            thread_manager.status = "queued"
+            heapq.heappush(self._pending, (priority, next(self._sequence), thread_id))
+            self._idle_since.pop(thread_id, None)
+            self._dispatch()
+
+        return self.position(thread_id)
+
+    def position(self, thread_id: str) -> int:
+        """待機中のスレッドの順番（1始まり）。待機中でなければ0"""
+        queued = [entry for entry in sorted(self._pending) if self.threads[entry[2]].status == "queued"]
+        for index, (_, _, queued_id) in enumerate(queued):
+            if queued_id == thread_id:
+                return index + 1
+        return 0
+
+    def stop(self, thread_id: str):
+        """スレッドを停止（待機中なら待ち行列から外す）"""
+        thread_manager = self.threads.get(thread_id)
+        if thread_manager is None:
+            return
+
+        was_queued = thread_manager.status == "queued"
+        thread_manager.stop_thread()
+        if was_queued:
+            self._pending = [entry for entry in self._pending if entry[2] != thread_id]
+            heapq.heapify(self._pending)
+            self._idle_since[thread_id] = time.monotonic()
+            self._notify_positions()
+
+    def _dispatch(self):
+        """空きがあれば待機中のスレッドを開始"""
+        while self._pending and len(self._running) < self.max_running:
+            _, _, thread_id = heapq.heappop(self._pending)
+            thread_manager = self.threads.get(thread_id)
+            if thread_manager is None or thread_manager.status != "queued":
+                continue
+            self._running[thread_id] = asyncio.create_task(self._run(thread_id, thread_manager))
+        self._notify_positions()
+
+    def _notify_positions(self):
+        """待機中のスレッドに現在の順番を通知"""
+        queued = [entry[2] for entry in sorted(self._pending) if self.threads[entry[2]].status == "queued"]
+        for index, thread_id in enumerate(queued):
+            self.threads[thread_id].notify_queued(index + 1)
+
+    async def _run(self, thread_id: str, thread_manager: ThreadManager):
+        try:
+            # 開始直前に停止された場合は生成しない
+            if thread_manager.status == "queued":
+                await thread_manager.start_thread()
+        except Exception as e:
+            logger.error(f"Thread {thread_id} failed: {str(e)}")
+        finally:
+            self._running.pop(thread_id, None)
+            if thread_id in self.threads:
+                self._idle_since[thread_id] = time.monotonic()
+            self.evict()
+            self._dispatch()
+
+    def evict(self, reserve: int = 0):
+        """
+        終了・放置から一定時間経ったスレッドと、上限を超えた古いスレッドを破棄
+        reserveは、これから登録するスレッドのために空けておく数
+        """
+        now = time.monotonic()
+        expired = [
+            thread_id for thread_id, idle_since in self._idle_since.items()
+            if now - idle_since > self.thread_ttl
+        ]
+        for thread_id in expired:
+            self._evict(thread_id)
+
+        if len(self.threads) + reserve > self.max_threads:
+            # 実行中・待機中のスレッドは破棄しない
+            for thread_id in [thread_id for thread_id in self.threads if thread_id in self._idle_since]:
+                if len(self.threads) + reserve <= self.max_threads:
+                    break
+                self._evict(thread_id)
+
+    def _evict(self, thread_id: str):
+        logger.info(f"Evicting thread {thread_id}")
+        self.threads.pop(thread_id, None)
+        self._idle_since.pop(thread_id, None)
+
+    def stats(self) -> Dict:
+        return {
+            "running": len(self._running),
+            "queued": sum(1 for entry in self._pending if self.threads[entry[2]].status == "queued"),
+            "retained": len(self.threads),
+            "max_running": self.max_running,
+            "max_queued": self.max_queued
+        }
+
+    async def shutdown(self):
+        """全スレッドを停止し、実行中のタスクの終了を待つ"""
+        if self._sweeper:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+        for thread_id, thread_manager in list(self.threads.items()):
+            logger.info(f"Stopping thread {thread_id}")
+            thread_manager.stop_thread()
+        self._pending.clear()
+
+        tasks = list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,298 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# スレッドIDはUUIDやdemo_scenario_1_20250101_000000のような英数字・_・-のみ（ファイル名にも使うため）
+THREAD_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,128}")
+
+def is_valid_thread_id(thread_id: str) -> bool:
+    """クライアントから受け取ったスレッドIDをストアに渡してよいか"""
+    return isinstance(thread_id, str) and THREAD_ID_PATTERN.fullmatch(thread_id) is not None
+
+class ThreadStore(ABC):
+    """
+    スレッドとレスの永続化層
+    スレッド情報は上書き、レスは追記のみで保存する
+    メソッドは同期処理なので、イベントループからはasyncio.to_threadで呼び出す
+    """
+
+    @abstractmethod
+    def save_thread(self, thread_id: str, thread: Dict):
+        """スレッド情報（title, max_posts, status, created_at, metadata）を保存"""
+        pass
+
+    @abstractmethod
+    def append_posts(self, thread_id: str, posts: List[Dict]):
+        """レスを追記（1回の呼び出しを1トランザクションとして書き込む）"""
+        pass
+
+    @abstractmethod
+    def load_thread(self, thread_id: str) -> Optional[Dict]:
+        """スレッド情報を返す（存在しなければNone）"""
+        pass
+
+    @abstractmethod
+    def load_posts(self, thread_id: str, after: int = 0, limit: Optional[int] = None) -> List[Dict]:
+        """レス番号がafterより大きいレスを番号順に最大limit件返す"""
+        pass
+
+    @abstractmethod
+    def count_posts(self, thread_id: str) -> int:
+        pass
+
+    @abstractmethod
+    def list_threads(self) -> List[Dict]:
+        """保存されているスレッド情報の一覧"""
+        pass
+
+    def close(self):
+        pass
+
+class SQLiteThreadStore(ThreadStore):
+    """SQLite（WALモード）によるスレッドストア"""
+
+    def __init__(self, path: str = "threads.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS threads (
+                    thread_id TEXT PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    max_posts INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    metadata TEXT NOT NULL DEFAULT '{}'
+                );
+                CREATE TABLE IF NOT EXISTS posts (
+                    thread_id TEXT NOT NULL,
+                    number INTEGER NOT NULL,
+                    character_id TEXT NOT NULL,
+                    character_name TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    anchors TEXT NOT NULL,
+                    response_length TEXT NOT NULL,
+                    PRIMARY KEY (thread_id, number)
+                ) WITHOUT ROWID;
+            """)
+            self._conn.commit()
+
+    def save_thread(self, thread_id: str, thread: Dict):
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO threads (thread_id, title, max_posts, status, created_at, updated_at, metadata)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(thread_id) DO UPDATE SET
+                    title = excluded.title,
+                    max_posts = excluded.max_posts,
+                    status = excluded.status,
+                    updated_at = excluded.updated_at,
+                    metadata = excluded.metadata
+                """,
+                (
+                    thread_id, thread["title"], thread["max_posts"], thread["status"],
+                    thread["created_at"], time.time(), json.dumps(thread.get("metadata", {}), ensure_ascii=False)
+                )
+            )
+            self._conn.commit()
+
+    def append_posts(self, thread_id: str, posts: List[Dict]):
+        if not posts:
+            return
+        with self._lock:
+            self._conn.executemany(
+                """
+                INSERT OR REPLACE INTO posts
+                    (thread_id, number, character_id, character_name, content, timestamp, anchors, response_length)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (
+                        thread_id, post["number"], post["character_id"], post["character_name"],
+                        post["content"], post["timestamp"], json.dumps(post["anchors"]), post["response_length"]
+                    )
+                    for post in posts
+                ]
+            )
+            self._conn.commit()
+
+    def load_thread(self, thread_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM threads WHERE thread_id = ?", (thread_id,)).fetchone()
+        return self._thread_from_row(row) if row else None
+
+    def load_posts(self, thread_id: str, after: int = 0, limit: Optional[int] = None) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM posts WHERE thread_id = ? AND number > ? ORDER BY number LIMIT ?",
+                (thread_id, after, -1 if limit is None else limit)
+            ).fetchall()
+        return [
+            {
+                "number": row["number"],
+                "character_id": row["character_id"],
+                "character_name": row["character_name"],
+                "content": row["content"],
+                "timestamp": row["timestamp"],
+                "anchors": json.loads(row["anchors"]),
+                "response_length": row["response_length"]
+            }
+            for row in rows
+        ]
+
+    def count_posts(self, thread_id: str) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM posts WHERE thread_id = ?", (thread_id,)).fetchone()[0]
+
+    def list_threads(self) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM threads ORDER BY updated_at DESC").fetchall()
+        return [self._thread_from_row(row) for row in rows]
+
+    def _thread_from_row(self, row: sqlite3.Row) -> Dict:
+        return {
+            "thread_id": row["thread_id"],
+            "title": row["title"],
+            "max_posts": row["max_posts"],
+            "status": row["status"],
+            "created_at": row["created_at"],
+            "metadata": json.loads(row["metadata"])
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class JsonlThreadStore(ThreadStore):
+    """
+    スレッドごとの追記専用JSONLファイルによるスレッドストア
+    各行は{"kind": "thread", ...}（スレッド情報、最後の行が有効）か{"kind": "post", ...}
+    """
+
+    def __init__(self, directory: str = "threads"):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def thread_path(self, thread_id: str) -> str:
+        # ../などでディレクトリの外を読み書きしないように、ファイル名にする前に検証する
+        if not is_valid_thread_id(thread_id):
+            raise ValueError(f"Invalid thread id: {thread_id!r}")
+        return os.path.join(self.directory, f"{thread_id}.jsonl")
+
+    def _append(self, thread_id: str, records: List[Dict]):
+        lines = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        with self._lock, open(self.thread_path(thread_id), "a", encoding="utf-8") as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _read(self, thread_id: str):
+        path = self.thread_path(thread_id)
+        if not os.path.exists(path):
+            return
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # 書き込み途中で止まった最終行は読み飛ばす
+                    logger.warning(f"Skipping broken record in {path}")
+
+    def save_thread(self, thread_id: str, thread: Dict):
+        self._append(thread_id, [{"kind": "thread", "thread_id": thread_id, **thread}])
+
+    def append_posts(self, thread_id: str, posts: List[Dict]):
+        if posts:
+            self._append(thread_id, [{"kind": "post", **post} for post in posts])
+
+    def load_thread(self, thread_id: str) -> Optional[Dict]:
+        thread = None
+        for record in self._read(thread_id):
+            if record.get("kind") == "thread":
+                thread = record
+        if thread is not None:
+            thread.pop("kind")
+        return thread
+
+    def load_posts(self, thread_id: str, after: int = 0, limit: Optional[int] = None) -> List[Dict]:
+        posts: Dict[int, Dict] = {}
+        for record in self._read(thread_id):
+            if record.get("kind") == "post" and record["number"] > after:
+                record.pop("kind")
+                posts[record["number"]] = record
+        ordered = [posts[number] for number in sorted(posts)]
+        return ordered if limit is None else ordered[:limit]
+
+    def count_posts(self, thread_id: str) -> int:
+        return len({record["number"] for record in self._read(thread_id) if record.get("kind") == "post"})
+
+    def list_threads(self) -> List[Dict]:
+        threads = []
+        for filename in os.listdir(self.directory):
+            if filename.endswith(".jsonl"):
+                thread = self.load_thread(filename[:-len(".jsonl")])
+                if thread is not None:
+                    threads.append(thread)
+        return threads
+
+class BatchedPostWriter:
+    """
+    レスをまとめてストアに書き込む
+    batch_size件たまるか、最後の書き込みからflush_interval秒経つと書き込む
+    """
+
+    def __init__(self, store: ThreadStore, thread_id: str, batch_size: int = 10, flush_interval: float = 5.0):
+        self.store = store
+        self.thread_id = thread_id
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer: List[Dict] = []
+        self._last_flush = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def add(self, post: Dict):
+        self._buffer.append(post)
+        if len(self._buffer) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            if not self._buffer:
+                return
+            posts, self._buffer = self._buffer, []
+            self._last_flush = time.monotonic()
+            try:
+                await asyncio.to_thread(self.store.append_posts, self.thread_id, posts)
+            except Exception as e:
+                logger.error(f"Failed to persist posts for thread {self.thread_id}: {str(e)}")
+                self._buffer = posts + self._buffer
+
+def create_thread_store() -> Optional[ThreadStore]:
+    """
+    環境変数からストアを生成
+    THREAD_STORE: sqlite（デフォルト） / jsonl / none
+    THREAD_STORE_PATH: SQLiteのファイルパス、またはJSONLの保存ディレクトリ
+    """
+    kind = os.getenv("THREAD_STORE", "sqlite").lower()
+    if kind == "sqlite":
+        return SQLiteThreadStore(os.getenv("THREAD_STORE_PATH", "threads.db"))
+    if kind == "jsonl":
+        return JsonlThreadStore(os.getenv("THREAD_STORE_PATH", "threads"))
+    return None
@@ -0,0 +1,131 @@
+import asyncio
+import json
+import logging
+import os
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple, Union
+
+from fastapi import WebSocket
+
+logger = logging.getLogger(__name__)
+
+SLOW_CONSUMER_POLICIES = ("snapshot", "disconnect")
+
+# 遅いクライアントを切断するときのクローズコード（1013: Try Again Later）
+CLOSE_CODE_SLOW_CONSUMER = 1013
+
+Frame = Union[Dict, str]
+
+def encode_frame(frame: Dict) -> str:
+    """send_jsonと同じ形式でJSONにする"""
+    return json.dumps(frame, separators=(",", ":"), ensure_ascii=False)
+
+class WebSocketOutbox:
+    """
+    WebSocket接続ごとの送信キュー
+    送信は専用タスクが行うため、配信側（スレッドの生成）はクライアントの受信速度を待たない。
+    キューが max_frames を超えたら slow_policy に従い、
+    snapshot: 溜まったフレームを捨てて最新の状態（snapshotが返すフレーム）を送り直す
+    disconnect: 接続を閉じる
+    スナップショットで再現できない通知（thread_started / thread_completedなど）はcontrolとして積み、
+    snapshotでも捨てずにスナップショットより前に送る。
+    """
+
+    def __init__(self, websocket: WebSocket, max_frames: Optional[int] = None,
+                 slow_policy: Optional[str] = None, snapshot: Optional[Callable[[], List[Frame]]] = None):
+        self.websocket = websocket
+        self.max_frames = max_frames or int(os.getenv("WS_OUTBOX_MAX_FRAMES", "1000"))
+        self.slow_policy = slow_policy or os.getenv("WS_SLOW_CONSUMER", "snapshot")
+        if self.slow_policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Unknown slow consumer policy: {self.slow_policy}")
+        # 送り直す状態を返す関数（接続中のスレッドが変わったら差し替える）
+        self.snapshot = snapshot
+
+        # (フレーム, control)
+        self._queue: Deque[Tuple[Frame, bool]] = deque()
+        self._wakeup = asyncio.Event()
+        self._needs_snapshot = False
+        self._busy = False  # 送信中のフレームがある（キューからは取り出し済み）
+        self.closed = False
+        self.stats = {"frames": 0, "snapshots": 0}
+        self._task = asyncio.create_task(self._run())
+
+    def send(self, frame: Frame, control: bool = False):
+        """フレームをキューに積む（dictはここでは変換せず、送信時にJSONにする。strは変換済みとしてそのまま送る）"""
+        if self.closed:
+            return
+        if not control:
+            if self._needs_snapshot:
+                # 送り直し待ちの間のフレームはスナップショットに含まれる
+                return
+            if len(self._queue) >= self.max_frames:
+                self._overflow()
+                return
+        self._queue.append((frame, control))
+        self._wakeup.set()
+
+    def _overflow(self):
+        if self.slow_policy == "snapshot" and self.snapshot is not None:
+            controls = deque(item for item in self._queue if item[1])
+            logger.info(f"Slow websocket client: dropping {len(self._queue) - len(controls)} frames "
+                        f"and resending a snapshot")
+            self._queue = controls
+            self._needs_snapshot = True
+            self.stats["snapshots"] += 1
+            self._wakeup.set()
+        else:
+            logger.info("Slow websocket client: disconnecting")
+            self.closed = True
+            self._queue.clear()
+            self._task.cancel()
+            asyncio.create_task(self._close(CLOSE_CODE_SLOW_CONSUMER))
+
+    async def _close(self, code: int):
+        try:
+            await self.websocket.close(code=code)
+        except Exception as e:
+            logger.debug(f"Error closing websocket: {e}")
+
+    async def _run(self):
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                self._busy = True
+                while self._queue or self._needs_snapshot:
+                    if self._needs_snapshot and not self._queue:
+                        # 残していたcontrolフレームを送り終えてからスナップショットを作る
+                        # （作る間に積まれるフレームは送り直し待ちとして捨てられ、内容はスナップショットに含まれる）
+                        snapshot_frames = self.snapshot()
+                        self._needs_snapshot = False
+                        for snapshot_frame in snapshot_frames:
+                            await self._send(snapshot_frame)
+                        continue
+                    frame, _ = self._queue.popleft()
+                    await self._send(frame)
+                self._busy = False
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            # 送信できない接続はこれ以上積まない（受信側のループが切断を検知して後始末する）
+            logger.info(f"Websocket send failed: {e}")
+            self.closed = True
+            self._queue.clear()
+
+    async def _send(self, frame: Frame):
+        await self.websocket.send_text(frame if isinstance(frame, str) else encode_frame(frame))
+        self.stats["frames"] += 1
+
+    async def flush(self, timeout: float = 5.0):
+        """キューが空になるまで待つ（切断前に残りを送る用）"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while (self._queue or self._needs_snapshot or self._busy) and not self.closed and loop.time() < deadline:
+            await asyncio.sleep(0.01)
+
+    async def close(self):
+        """送信タスクを止める（WebSocket自体は閉じない）"""
+        self.closed = True
+        self._queue.clear()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
@@ -16,9 +16,10 @@ interface ThreadViewProps {
   posts: Post[];
   maxPosts: number;
   isRunning: boolean;
+  queuePosition?: number;
 }
 
-export const ThreadView: React.FC<ThreadViewProps> = ({ title, posts, maxPosts, isRunning }) => {
+export const ThreadView: React.FC<ThreadViewProps> = ({ title, posts, maxPosts, isRunning, queuePosition }) => {
   const bottomRef = useRef<HTMLDivElement>(null);
 
   useEffect(() => {
@@ -45,7 +46,7 @@ export const ThreadView: React.FC<ThreadViewProps> = ({ title, posts, maxPosts,
           {isRunning && (
             <span className="status-indicator">
               <span className="status-dot"></span>
-              進行中
+              {queuePosition ? `順番待ち（${queuePosition}番目）` : '進行中'}
             </span>
           )}
         </div>
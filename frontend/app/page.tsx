@@ -99,6 +99,7 @@ export default function Home() {
                 posts={currentThread.posts}
                 maxPosts={currentThread.maxPosts}
                 isRunning={currentThread.isRunning}
+                queuePosition={currentThread.queuePosition}
               />
             )}
           </div>
@@ -17,6 +17,7 @@ interface Thread {
   posts: Post[];
   maxPosts: number;
   isRunning: boolean;
+  queuePosition?: number;
   createdAt: string;
 }
 
@@ -151,6 +152,16 @@ export const useThreadStore = create<ThreadStore>()(
               }));
               break;
               
+            case 'queued':
+              // Waiting for a free generation slot on the server
+              set((state) => ({
+                currentThread: state.currentThread ? {
+                  ...state.currentThread,
+                  queuePosition: data.position,
+                } : null,
+              }));
+              break;
+              
             case 'thread_title_updated':
               // Update the thread title when it's generated by AI
               set((state) => {
@@ -175,6 +186,14 @@ export const useThreadStore = create<ThreadStore>()(
             case 'post_start':
               // Add new post with streaming flag
               // Note: content starts empty and will be filled via post_stream
+              if (get().currentThread?.queuePosition) {
+                set((state) => ({
+                  currentThread: state.currentThread ? {
+                    ...state.currentThread,
+                    queuePosition: undefined,
+                  } : null,
+                }));
+              }
               get().addPost({
                 ...data.post,
                 content: '',  // Will be filled by post_complete
@@ -246,6 +265,42 @@ export const useThreadStore = create<ThreadStore>()(
               });
               break;
               
+            case 'thread_snapshot':
+              // Current state of the thread: sent when joining a thread that is already running, and again
+              // if the server fell behind on this connection and dropped the queued frames
+              set((state) => {
+                if (!state.currentThread) return state;
+
+                const posts = [...data.posts];
+                if (data.streaming) {
+                  posts.push({
+                    ...data.streaming.post,
+                    content: '',
+                    anchors: [],
+                    isStreaming: true,
+                    streamingContent: data.streaming.content,
+                  });
+                }
+
+                const updatedThread = {
+                  ...state.currentThread,
+                  title: data.title || state.currentThread.title,
+                  posts,
+                  isRunning: data.status !== 'completed' && data.status !== 'stopped',
+                  queuePosition: data.queue_position ?? undefined,
+                };
+
+                const updatedThreads = state.threads.map(thread =>
+                  thread.id === updatedThread.id ? updatedThread : thread
+                );
+
+                return {
+                  currentThread: updatedThread,
+                  threads: updatedThreads,
+                };
+              });
+              break;
+
             case 'new_post':
               get().addPost(data.post);
               break;
@@ -262,6 +317,16 @@ export const useThreadStore = create<ThreadStore>()(
               
             case 'error':
               console.error('WebSocket error:', data.message);
+              if (data.code === 'queue_full') {
+                // The server is not accepting more threads right now; the thread was created but not started
+                set((state) => ({
+                  currentThread: state.currentThread ? {
+                    ...state.currentThread,
+                    isRunning: false,
+                    queuePosition: undefined,
+                  } : null,
+                }));
+              }
               break;
           }
         };
@@ -9,6 +9,11 @@ export interface DebateMetrics {
   tps: number;
   ttft?: number;
   total_tokens?: number;
+  // Sent with turn_end, from the model server's own counters
+  server_ttft?: number | null;
+  prompt_tokens?: number | null;
+  prompt_tps?: number | null;
+  decode_tps?: number | null;
 }
 
 export type AgentType = 'A' | 'B' | 'judge';
@@ -28,6 +33,7 @@ export interface TurnStartMessage {
 export interface TurnEndMessage {
   type: 'turn_end';
   agent: AgentType;
+  metrics?: DebateMetrics;
 }
 
 export interface DebateStartedMessage {
@@ -76,11 +82,7 @@ export interface DebateTurn {
   agent: string;
   content: string;
   timestamp: string;
-  metrics: {
-    ttft?: number;
-    tps: number;
-    total_tokens: number;
-  };
+  metrics: DebateMetrics;
 }
 
 export interface DebateSummary {